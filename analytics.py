@@ -0,0 +1,246 @@
+#!/usr/bin/env python
+"""
+Batch citation metrics computed from AuthorPublicationsParser output.
+
+Publications for many authors are loaded into padded NumPy arrays, one row
+per author, so every metric is computed for all authors at once.
+"""
+from collections import OrderedDict
+import datetime
+import random
+import sys
+import time
+
+import numpy as np
+
+
+class CitationMatrix(object):
+    """
+    Citation counts and publication years for a batch of authors.
+    Pass a list of publication dicts as produced by AuthorPublicationsParser,
+    one per author. Unparseable counts are treated as 0 citations and
+    unparseable years as unknown.
+    >>> matrix = CitationMatrix([{'author_uid': 'a', 'publications': [{'cited': 10, 'year': 2010}]}])
+    >>> matrix.h_index()
+    array([1])
+    """
+    def __init__(self, pubs_dicts, current_year=None):
+        if current_year is None:
+            current_year = datetime.date.today().year
+        self.current_year = current_year
+        self.author_uids = [pubs_dict.get('author_uid') for pubs_dict in pubs_dicts]
+        publications = [pubs_dict['publications'] for pubs_dict in pubs_dicts]
+        num_authors = len(publications)
+        self.num_pubs = np.array([len(pubs) for pubs in publications], dtype=np.int64)
+        max_pubs = max(self.num_pubs.max() if num_authors else 0, 1)
+        # every publication is flattened into one list and scattered into
+        # the padded arrays, rather than filling the arrays row by row.
+        rows = np.repeat(np.arange(num_authors), self.num_pubs)
+        row_starts = np.cumsum(self.num_pubs) - self.num_pubs
+        columns = np.arange(len(rows)) - np.repeat(row_starts, self.num_pubs)
+        flat_cited = [pub.get('cited') for pubs in publications for pub in pubs]
+        flat_year = [pub.get('year') for pubs in publications for pub in pubs]
+        self.cited = np.zeros((num_authors, max_pubs), dtype=np.int64)
+        # a year of 0 means the year is unknown.
+        self.year = np.zeros((num_authors, max_pubs), dtype=np.int64)
+        self.cited[rows, columns] = self.to_int_array(flat_cited)
+        self.year[rows, columns] = self.to_int_array(flat_year)
+        self.ranks = np.arange(1, max_pubs + 1)
+
+    @staticmethod
+    def to_int(value):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
+
+    @staticmethod
+    def to_int_array(values):
+        # parsed counts and years are almost always ints already.
+        return np.array([value if type(value) is int else CitationMatrix.to_int(value) for value in values], dtype=np.int64)
+
+    def sorted_cited(self, cited=None):
+        """
+        Returns each authors citation counts sorted highest first.
+        """
+        if cited is None:
+            cited = self.cited
+        return -np.sort(-cited, axis=1)
+
+    def total_citations(self):
+        return self.cited.sum(axis=1)
+
+    def h_index(self, cited=None):
+        return (self.sorted_cited(cited) >= self.ranks).sum(axis=1)
+
+    def i10_index(self, cited=None):
+        if cited is None:
+            cited = self.cited
+        return (cited >= 10).sum(axis=1)
+
+    def g_index(self):
+        """
+        Largest g such that the top g publications have at least g^2
+        citations between them, capped at the number of publications.
+        """
+        cumulative = self.sorted_cited().cumsum(axis=1)
+        within_pubs = self.ranks <= self.num_pubs[:, np.newaxis]
+        return ((cumulative >= self.ranks ** 2) & within_pubs).sum(axis=1)
+
+    def first_year(self):
+        """
+        Returns the earliest known publication year per author, 0 if unknown.
+        """
+        known_years = np.where(self.year > 0, self.year, np.iinfo(np.int64).max)
+        first_year = known_years.min(axis=1)
+        return np.where(first_year == np.iinfo(np.int64).max, 0, first_year)
+
+    def years_active(self):
+        first_year = self.first_year()
+        return np.where(first_year > 0, self.current_year - first_year + 1, 0)
+
+    def m_quotient(self):
+        return self.divide(self.h_index(), self.years_active())
+
+    def citations_per_year(self):
+        return self.divide(self.total_citations(), self.years_active())
+
+    def window_cited(self, window):
+        """
+        Returns citation counts with publications older than
+        window years zeroed out.
+        """
+        in_window = self.year > self.current_year - window
+        return np.where(in_window, self.cited, 0)
+
+    def windowed_h_index(self, window=5):
+        return self.h_index(self.window_cited(window))
+
+    def windowed_i10_index(self, window=5):
+        return self.i10_index(self.window_cited(window))
+
+    @staticmethod
+    def divide(numerator, denominator):
+        result = np.zeros(len(numerator), dtype=np.float64)
+        np.true_divide(numerator, denominator, out=result, where=denominator > 0)
+        return result
+
+    def metrics(self, window=5):
+        """
+        Returns a list of OrderedDicts of every metric, one per author.
+        """
+        columns = OrderedDict()
+        columns['total_citations'] = self.total_citations()
+        columns['h_index'] = self.h_index()
+        columns['i10_index'] = self.i10_index()
+        columns['g_index'] = self.g_index()
+        columns['m_quotient'] = self.m_quotient()
+        columns['citations_per_year'] = self.citations_per_year()
+        columns['h_index_{0}y'.format(window)] = self.windowed_h_index(window)
+        columns['i10_index_{0}y'.format(window)] = self.windowed_i10_index(window)
+        results = []
+        for row, author_uid in enumerate(self.author_uids):
+            author_metrics = OrderedDict()
+            author_metrics['author_uid'] = author_uid
+            for name, column in columns.items():
+                author_metrics[name] = column[row].item()
+            results.append(author_metrics)
+        return results
+
+
+class ReferenceMetrics(object):
+    """
+    Pure Python versions of the CitationMatrix metrics for a single
+    author, used to check and benchmark the batch implementation.
+    """
+    @staticmethod
+    def h_index(citations):
+        h_index = 0
+        for rank, count in enumerate(sorted(citations, reverse=True), 1):
+            if count >= rank:
+                h_index = rank
+        return h_index
+
+    @staticmethod
+    def i10_index(citations):
+        return len([count for count in citations if count >= 10])
+
+    @staticmethod
+    def g_index(citations):
+        g_index = 0
+        total = 0
+        for rank, count in enumerate(sorted(citations, reverse=True), 1):
+            total += count
+            if total >= rank ** 2:
+                g_index = rank
+        return g_index
+
+    @staticmethod
+    def m_quotient(citations, years, current_year):
+        known_years = [year for year in years if year > 0]
+        if not known_years:
+            return 0.0
+        return ReferenceMetrics.h_index(citations) / float(current_year - min(known_years) + 1)
+
+
+def random_pubs_dicts(num_authors, max_pubs=300, seed=0):
+    """
+    Generates AuthorPublicationsParser style output for benchmarking.
+    """
+    rng = random.Random(seed)
+    pubs_dicts = []
+    for author in range(num_authors):
+        publications = []
+        for pub in range(rng.randint(1, max_pubs)):
+            publications.append({'cited': int(rng.paretovariate(1.2)) - 1, 'year': rng.randint(1980, 2015)})
+        pubs_dicts.append({'author_uid': str(author), 'publications': publications})
+    return pubs_dicts
+
+
+def benchmark(num_authors=2000, current_year=2015):
+    """
+    Times h, i10, g index and m quotient for num_authors random authors,
+    batched against the pure Python reference. Loading the arrays is
+    timed separately as it is paid once for every metric.
+    """
+    pubs_dicts = random_pubs_dicts(num_authors)
+    start = time.time()
+    matrix = CitationMatrix(pubs_dicts, current_year)
+    load_time = time.time() - start
+    start = time.time()
+    batch_results = (matrix.h_index(), matrix.i10_index(), matrix.g_index(), matrix.m_quotient())
+    batch_time = time.time() - start
+
+    start = time.time()
+    reference_results = ([], [], [], [])
+    for pubs_dict in pubs_dicts:
+        citations = [pub['cited'] for pub in pubs_dict['publications']]
+        years = [pub['year'] for pub in pubs_dict['publications']]
+        reference_results[0].append(ReferenceMetrics.h_index(citations))
+        reference_results[1].append(ReferenceMetrics.i10_index(citations))
+        reference_results[2].append(ReferenceMetrics.g_index(citations))
+        reference_results[3].append(ReferenceMetrics.m_quotient(citations, years, current_year))
+    reference_time = time.time() - start
+
+    for batch, reference in zip(batch_results, reference_results):
+        assert np.allclose(batch, reference)
+    results = OrderedDict()
+    results['authors'] = num_authors
+    results['load_seconds'] = load_time
+    results['batch_seconds'] = batch_time
+    results['reference_seconds'] = reference_time
+    results['speedup'] = reference_time / batch_time
+    results['speedup_with_load'] = reference_time / (load_time + batch_time)
+    return results
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--benchmark':
+        # cli args = benchmark, number of authors
+        # python analytics.py --benchmark 2000
+        try:
+            num_authors = int(sys.argv[2])
+        except IndexError:
+            num_authors = 2000
+        for name, value in benchmark(num_authors).items():
+            print '{0}: {1}'.format(name, value)
@@ -0,0 +1,214 @@
+"""
+Append-only archive of raw pages fetched from GS.
+
+Pages are stored zlib compressed in numbered segment files. A fixed width
+index file maps an md5 of the url and the fetch time to the segment and
+offset of each record, and is memory mapped for lookups so pages can be
+re-parsed later without touching the network. Only a table of entry
+numbers, hashed by url, is kept in memory to find the entries of a url.
+Stores are serialized with a lock, so pages fetched from several threads
+can be archived together.
+"""
+from array import array
+from collections import namedtuple
+import hashlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+
+ArchiveEntry = namedtuple('ArchiveEntry', ['url_hash', 'fetched', 'segment', 'offset', 'length'])
+
+
+class PageArchive(object):
+    """
+    Stores and retrieves raw html keyed by url and fetch time.
+    >>> archive = PageArchive('/tmp/gs_archive')
+    >>> archive.store('https://scholar.google.ca/citations?user=x', u'<html></html>')
+    >>> archive.lookup('https://scholar.google.ca/citations?user=x')
+    u'<html></html>'
+    """
+    INDEX_FILE = 'index.dat'
+    SEGMENT_FILE = 'segment_{0:05d}.dat'
+    SEGMENT_SIZE = 64 * 1024 * 1024
+    # md5 of url, fetch time, segment number, offset, record length
+    INDEX_FORMAT = struct.Struct('<16sdIQI')
+    # url length, compressed html length
+    RECORD_HEADER = struct.Struct('<II')
+    # the leading bytes of a url md5, hashing it to a slot.
+    SLOT_HASH = struct.Struct('<Q')
+    MIN_SLOTS = 1024
+
+    def __init__(self, archive_dir):
+        self.archive_dir = archive_dir
+        if not os.path.isdir(archive_dir):
+            os.makedirs(archive_dir)
+        self.index_path = os.path.join(archive_dir, self.INDEX_FILE)
+        self.segment = self.get_last_segment()
+        # the current segment and the index, opened for appending on first store.
+        self.segment_file = None
+        self.index_file = None
+        # open addressed slots of the index entries read up to index_size,
+        # each an entry number plus one, 0 if empty. At most half are used.
+        self.slots = array('I', [0]) * self.MIN_SLOTS
+        self.index_size = 0
+        self.lock = threading.Lock()
+
+    def get_last_segment(self):
+        segments = [name for name in os.listdir(self.archive_dir) if name.startswith('segment_')]
+        if not segments:
+            return 0
+        return max(int(name[len('segment_'):-len('.dat')]) for name in segments)
+
+    def get_segment_path(self, segment):
+        return os.path.join(self.archive_dir, self.SEGMENT_FILE.format(segment))
+
+    @staticmethod
+    def hash_url(url):
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        return hashlib.md5(url).digest()
+
+    def store(self, url, html, fetched=None):
+        """
+        Appends the html fetched from url to the current segment
+        and records its location in the index, once the record is written.
+        """
+        if fetched is None:
+            fetched = time.time()
+        encoded_url = url.encode('utf-8') if isinstance(url, unicode) else url
+        encoded_html = html.encode('utf-8') if isinstance(html, unicode) else html
+        compressed = zlib.compress(encoded_html)
+        record = self.RECORD_HEADER.pack(len(encoded_url), len(compressed)) + encoded_url + compressed
+        with self.lock:
+            if self.segment_file is None:
+                self.segment_file = open(self.get_segment_path(self.segment), 'ab')
+                self.index_file = open(self.index_path, 'ab')
+            self.segment_file.seek(0, os.SEEK_END)
+            offset = self.segment_file.tell()
+            if offset and offset + len(record) > self.SEGMENT_SIZE:
+                self.segment_file.close()
+                self.segment += 1
+                self.segment_file = open(self.get_segment_path(self.segment), 'ab')
+                offset = 0
+            self.segment_file.write(record)
+            self.segment_file.flush()
+            entry = ArchiveEntry(self.hash_url(url), fetched, self.segment, offset, len(record))
+            self.index_file.write(self.INDEX_FORMAT.pack(*entry))
+            self.index_file.flush()
+
+    def close(self):
+        with self.lock:
+            if self.segment_file is not None:
+                self.segment_file.close()
+                self.index_file.close()
+                self.segment_file = None
+                self.index_file = None
+
+    def entries(self):
+        """
+        Yields every index entry in the order pages were stored.
+        """
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) == 0:
+            return
+        with open(self.index_path, 'rb') as index_file:
+            index_map = mmap.mmap(index_file.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                entry_size = self.INDEX_FORMAT.size
+                for position in xrange(0, len(index_map) - entry_size + 1, entry_size):
+                    yield ArchiveEntry(*self.INDEX_FORMAT.unpack_from(index_map, position))
+            finally:
+                index_map.close()
+
+    def add_slot(self, url_hash, entry_number):
+        slot = self.SLOT_HASH.unpack_from(url_hash)[0] % len(self.slots)
+        while self.slots[slot]:
+            slot = (slot + 1) % len(self.slots)
+        self.slots[slot] = entry_number + 1
+
+    def load_index(self):
+        """
+        Adds entries appended to the index file since it was last loaded,
+        by this archive or another, to the slots. The slots are doubled
+        and refilled from the index file once more than half are used.
+        """
+        if not os.path.exists(self.index_path) or os.path.getsize(self.index_path) <= self.index_size:
+            return
+        entry_size = self.INDEX_FORMAT.size
+        entry_count = os.path.getsize(self.index_path) // entry_size
+        start = self.index_size // entry_size
+        if entry_count * 2 > len(self.slots):
+            slot_count = len(self.slots)
+            while entry_count * 2 > slot_count:
+                slot_count *= 2
+            self.slots = array('I', [0]) * slot_count
+            start = 0
+        with open(self.index_path, 'rb') as index_file:
+            index_file.seek(start * entry_size)
+            data = index_file.read((entry_count - start) * entry_size)
+        for entry_number in xrange(start, entry_count):
+            url_hash = self.INDEX_FORMAT.unpack_from(data, (entry_number - start) * entry_size)[0]
+            self.add_slot(url_hash, entry_number)
+        self.index_size = entry_count * entry_size
+
+    def find(self, url, before=None):
+        """
+        Returns the index entry of the newest copy of url, optionally
+        fetched no later than the timestamp before. Entries are read from
+        the memory mapped index file.
+        """
+        url_hash = self.hash_url(url)
+        entry_size = self.INDEX_FORMAT.size
+        found = None
+        with self.lock:
+            self.load_index()
+            if not self.index_size:
+                return None
+            with open(self.index_path, 'rb') as index_file:
+                index_map = mmap.mmap(index_file.fileno(), self.index_size, access=mmap.ACCESS_READ)
+            try:
+                slot = self.SLOT_HASH.unpack_from(url_hash)[0] % len(self.slots)
+                while self.slots[slot]:
+                    entry = ArchiveEntry(*self.INDEX_FORMAT.unpack_from(index_map, (self.slots[slot] - 1) * entry_size))
+                    slot = (slot + 1) % len(self.slots)
+                    if entry.url_hash != url_hash or (before is not None and entry.fetched > before):
+                        continue
+                    if found is None or entry.fetched >= found.fetched:
+                        found = entry
+            finally:
+                index_map.close()
+        return found
+
+    def read(self, entry):
+        """
+        Returns the (url, html) pair stored at an index entry.
+        """
+        with open(self.get_segment_path(entry.segment), 'rb') as segment_file:
+            segment_file.seek(entry.offset)
+            record = segment_file.read(entry.length)
+        url_length, html_length = self.RECORD_HEADER.unpack_from(record)
+        start = self.RECORD_HEADER.size
+        url = record[start:start + url_length].decode('utf-8')
+        compressed = record[start + url_length:start + url_length + html_length]
+        html = zlib.decompress(compressed).decode('utf-8')
+        return url, html
+
+    def lookup(self, url, before=None):
+        """
+        Returns the archived html for url, or None if it was never stored.
+        """
+        entry = self.find(url, before)
+        if entry is None:
+            return None
+        return self.read(entry)[1]
+
+    def pages(self):
+        """
+        Yields (url, fetched, html) for every archived page.
+        """
+        for entry in self.entries():
+            url, html = self.read(entry)
+            yield url, entry.fetched, html
@@ -0,0 +1,176 @@
+#!/usr/bin/env python
+"""
+Change feed between successive crawls.
+
+Parsed Author, AuthorPublications and AuthorCoAuthors results are diffed
+against the snapshot kept from the previous crawl, and only what changed
+is written out: new and removed publications, citation count deltas, new
+and removed coauthors and changed profile fields.
+"""
+from collections import OrderedDict
+import json
+import os
+import sys
+
+
+class ChangeFeed(object):
+    """
+    Diffs parsed results against the previous snapshot and appends the
+    changes to feed_path, one JSON change per line. The snapshot is kept
+    at snapshot_path between runs, pass None to keep it in memory only.
+    >>> change_feed = ChangeFeed('snapshot.json', 'changes.jsonl')
+    >>> change_feed.add(Author('hNTyptAAAAAJ', AuthorParser).get_results_dict())
+    >>> change_feed.save()
+    """
+    # publication fields kept in the snapshot, the rest can't change
+    # without the publication uid changing.
+    PUBLICATION_FIELDS = ('title', 'cited', 'year')
+
+    def __init__(self, snapshot_path=None, feed_path=None):
+        self.snapshot_path = snapshot_path
+        self.feed_path = feed_path
+        # author uid to profile, to publication uid to fields, and to
+        # coauthor uid to name.
+        self.authors = {}
+        self.publications = {}
+        self.coauthors = {}
+        if snapshot_path is not None and os.path.exists(snapshot_path):
+            with open(snapshot_path, 'r') as snapshot_file:
+                snapshot = json.load(snapshot_file, object_pairs_hook=OrderedDict)
+            self.authors = snapshot['authors']
+            self.publications = snapshot['publications']
+            self.coauthors = snapshot['coauthors']
+
+    def save(self):
+        snapshot = OrderedDict()
+        snapshot['authors'] = self.authors
+        snapshot['publications'] = self.publications
+        snapshot['coauthors'] = self.coauthors
+        with open(self.snapshot_path + '.tmp', 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+        os.rename(self.snapshot_path + '.tmp', self.snapshot_path)
+
+    def add(self, results_dict):
+        """
+        Diffs an Author, AuthorPublications or AuthorCoAuthors results
+        dict against the snapshot, updates the snapshot and returns the
+        changes, which are also appended to the feed.
+        """
+        if 'author_UID' in results_dict:
+            changes = self.diff_author(results_dict)
+        elif 'publications' in results_dict:
+            changes = self.diff_publications(results_dict)
+        elif 'coauthors' in results_dict:
+            changes = self.diff_coauthors(results_dict)
+        else:
+            raise ValueError("Can't diff results without author_UID, publications or coauthors")
+        if changes and self.feed_path is not None:
+            with open(self.feed_path, 'a') as feed_file:
+                for change in changes:
+                    feed_file.write(json.dumps(change) + '\n')
+        return changes
+
+    @staticmethod
+    def make_change(change_type, author_uid, **fields):
+        change = OrderedDict()
+        change['type'] = change_type
+        change['author_uid'] = author_uid
+        for key in sorted(fields):
+            change[key] = fields[key]
+        return change
+
+    def diff_author(self, author_dict):
+        author_uid = author_dict['author_UID']
+        old_profile = self.authors.get(author_uid)
+        if old_profile is None:
+            self.authors[author_uid] = author_dict
+            return [self.make_change('author_added', author_uid, profile=author_dict)]
+        changes = []
+        for field, value in author_dict.items():
+            # fields a projected crawl didn't parse aren't changes.
+            if field in old_profile and old_profile[field] != value:
+                changes.append(self.make_change('author_changed', author_uid, field=field,
+                                                old=old_profile[field], new=value))
+        # keep fields the new results didn't have for the next diff.
+        merged = OrderedDict(old_profile)
+        merged.update(author_dict)
+        self.authors[author_uid] = merged
+        return changes
+
+    def diff_publications(self, pubs_dict):
+        """
+        Publications missing from a single page may just have moved to
+        another page, so removals are only reported for results holding
+        every page, such as AuthorAllPublications.
+        """
+        author_uid = pubs_dict['author_uid']
+        known = self.publications.setdefault(author_uid, OrderedDict())
+        changes = []
+        seen = set()
+        for publication in pubs_dict['publications']:
+            publication_uid = publication.get('id')
+            if not publication_uid:
+                continue
+            seen.add(publication_uid)
+            fields = OrderedDict((field, publication[field]) for field in self.PUBLICATION_FIELDS if field in publication)
+            old_fields = known.get(publication_uid)
+            if old_fields is None:
+                changes.append(self.make_change('publication_added', author_uid, publication_uid=publication_uid,
+                                                publication=fields))
+                known[publication_uid] = fields
+                continue
+            old_cited = old_fields.get('cited')
+            new_cited = fields.get('cited')
+            if old_cited is not None and new_cited is not None and old_cited != new_cited:
+                changes.append(self.make_change('citations_changed', author_uid, publication_uid=publication_uid,
+                                                old=old_cited, new=new_cited, delta=new_cited - old_cited))
+            for field in ('title', 'year'):
+                if field in old_fields and field in fields and old_fields[field] != fields[field]:
+                    changes.append(self.make_change('publication_changed', author_uid, publication_uid=publication_uid,
+                                                    field=field, old=old_fields[field], new=fields[field]))
+            old_fields.update(fields)
+        if 'pages' in pubs_dict:
+            for publication_uid in [uid for uid in known if uid not in seen]:
+                changes.append(self.make_change('publication_removed', author_uid, publication_uid=publication_uid))
+                del known[publication_uid]
+        return changes
+
+    def diff_coauthors(self, coauthors_dict):
+        author_uid = coauthors_dict['author_uid']
+        old_coauthors = self.coauthors.get(author_uid, {})
+        new_coauthors = OrderedDict()
+        for coauthor in coauthors_dict['coauthors']:
+            if coauthor.get('author_uid'):
+                new_coauthors[coauthor['author_uid']] = coauthor.get('name')
+        changes = []
+        for coauthor_uid, name in new_coauthors.items():
+            if coauthor_uid not in old_coauthors:
+                changes.append(self.make_change('coauthor_added', author_uid, coauthor_uid=coauthor_uid, name=name))
+        for coauthor_uid, name in old_coauthors.items():
+            if coauthor_uid not in new_coauthors:
+                changes.append(self.make_change('coauthor_removed', author_uid, coauthor_uid=coauthor_uid, name=name))
+        self.coauthors[author_uid] = new_coauthors
+        return changes
+
+    @staticmethod
+    def diff(old_results, new_results):
+        """
+        Returns the changes from one results dict to a later one.
+        """
+        change_feed = ChangeFeed()
+        change_feed.add(old_results)
+        return change_feed.add(new_results)
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--diff':
+        # cli args = diff, old results file, new results file
+        # python changes.py --diff publications_old.json publications_new.json
+        # the results files are the output of gs.py --author, --publications
+        # or --coauthors for the same author.
+        with open(sys.argv[2], 'r') as old_file:
+            old_results = json.load(old_file, object_pairs_hook=OrderedDict)
+        with open(sys.argv[3], 'r') as new_file:
+            new_results = json.load(new_file, object_pairs_hook=OrderedDict)
+        for change in ChangeFeed.diff(old_results, new_results):
+            print json.dumps(change)
@@ -0,0 +1,255 @@
+"""
+Columnar export of crawl results.
+
+Each table is a directory holding one file per column. Numeric columns are
+raw little endian arrays, string columns are a utf-8 data file plus an
+array of end offsets, and meta.json records the dtypes and row count.
+Rows are buffered and appended in chunks while a crawl runs, and every
+column can be memory mapped with NumPy without loading the rest.
+"""
+from collections import OrderedDict
+import json
+import os
+
+import numpy as np
+
+
+class ColumnarWriter(object):
+    """
+    Appends rows to a columnar table in chunks of chunk_size rows.
+    Pass an OrderedDict of column name to dtype, with 'str' for strings.
+    """
+    META_FILE = 'meta.json'
+
+    def __init__(self, table_dir, schema, chunk_size=10000):
+        self.table_dir = table_dir
+        self.schema = schema
+        self.chunk_size = chunk_size
+        if not os.path.isdir(table_dir):
+            os.makedirs(table_dir)
+        self.num_rows = self.read_num_rows()
+        self.truncate_columns()
+        self.buffer = OrderedDict((name, []) for name in schema)
+        self.buffered = 0
+        # end offset of the last string written to each string column.
+        self.string_ends = OrderedDict()
+        for name, dtype in schema.items():
+            if dtype == 'str':
+                self.string_ends[name] = self.read_last_offset(name)
+
+    def read_num_rows(self):
+        meta_path = os.path.join(self.table_dir, self.META_FILE)
+        if not os.path.exists(meta_path):
+            return 0
+        with open(meta_path, 'r') as meta_file:
+            return json.load(meta_file)['num_rows']
+
+    def truncate_columns(self):
+        """
+        Cuts every column back to num_rows, dropping anything a flush
+        wrote before crashing without updating meta.json.
+        """
+        for name, dtype in self.schema.items():
+            if dtype == 'str':
+                self.truncate_file(name + '.offsets', self.num_rows * np.dtype('<i8').itemsize)
+                self.truncate_file(name + '.data', self.read_last_offset(name))
+            else:
+                self.truncate_file(name + '.bin', self.num_rows * np.dtype(dtype).itemsize)
+
+    def truncate_file(self, file_name, size):
+        path = os.path.join(self.table_dir, file_name)
+        if os.path.exists(path) and os.path.getsize(path) > size:
+            with open(path, 'r+b') as column_file:
+                column_file.truncate(size)
+
+    def read_last_offset(self, name):
+        if self.num_rows == 0:
+            return 0
+        offsets = np.memmap(os.path.join(self.table_dir, name + '.offsets'), dtype='<i8', mode='r')
+        return int(offsets[self.num_rows - 1])
+
+    def append(self, row):
+        """
+        Buffers a row, a dict keyed by column name. Missing values
+        are written as 0 or the empty string.
+        """
+        for name, dtype in self.schema.items():
+            self.buffer[name].append(to_column_value(row.get(name), dtype))
+        self.buffered += 1
+        if self.buffered >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffered:
+            return
+        for name, dtype in self.schema.items():
+            values = self.buffer[name]
+            if dtype == 'str':
+                self.write_strings(name, values)
+            else:
+                with open(os.path.join(self.table_dir, name + '.bin'), 'ab') as column_file:
+                    column_file.write(np.array(values, dtype=dtype).tobytes())
+            self.buffer[name] = []
+        self.num_rows += self.buffered
+        self.buffered = 0
+        # written last, so a crash mid flush leaves the rows before it readable.
+        self.write_meta()
+
+    def write_strings(self, name, values):
+        encoded = [value.encode('utf-8') for value in values]
+        lengths = np.array([len(value) for value in encoded], dtype='<i8')
+        offsets = self.string_ends[name] + lengths.cumsum()
+        with open(os.path.join(self.table_dir, name + '.data'), 'ab') as data_file:
+            data_file.write(b''.join(encoded))
+        with open(os.path.join(self.table_dir, name + '.offsets'), 'ab') as offsets_file:
+            offsets_file.write(offsets.tobytes())
+        if len(offsets):
+            self.string_ends[name] = int(offsets[-1])
+
+    def write_meta(self):
+        meta = OrderedDict()
+        meta['num_rows'] = self.num_rows
+        meta['columns'] = self.schema
+        meta_path = os.path.join(self.table_dir, self.META_FILE)
+        with open(meta_path + '.tmp', 'w') as meta_file:
+            json.dump(meta, meta_file, indent=4)
+        os.rename(meta_path + '.tmp', meta_path)
+
+    def close(self):
+        self.flush()
+
+
+def to_column_value(value, dtype):
+    if dtype == 'str':
+        if value is None:
+            return u''
+        if isinstance(value, list):
+            # lists such as research interests are joined with tabs.
+            return u'\t'.join(value)
+        if isinstance(value, str):
+            return value.decode('utf-8')
+        return unicode(value)
+    try:
+        return np.dtype(dtype).type(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+class StringColumn(object):
+    """
+    Memory mapped string column. Strings are decoded on access.
+    """
+    def __init__(self, table_dir, name, num_rows):
+        self.offsets = np.memmap(os.path.join(table_dir, name + '.offsets'), dtype='<i8', mode='r', shape=(num_rows,)) \
+            if num_rows else np.zeros(0, dtype='<i8')
+        data_path = os.path.join(table_dir, name + '.data')
+        self.data = np.memmap(data_path, dtype=np.uint8, mode='r') \
+            if num_rows and os.path.getsize(data_path) else np.zeros(0, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        start = int(self.offsets[index - 1]) if index > 0 else 0
+        end = int(self.offsets[index])
+        return self.data[start:end].tobytes().decode('utf-8')
+
+    def __iter__(self):
+        for index in xrange(len(self)):
+            yield self[index]
+
+    def to_list(self):
+        return list(self)
+
+
+class ColumnarTable(object):
+    """
+    Reads a table written by ColumnarWriter. Columns are memory mapped
+    on access, numeric columns as NumPy arrays, so they can be handed
+    straight to pandas.
+    table = ColumnarTable('crawl_export/publications')
+    pandas.DataFrame({'cited': table['cited'], 'year': table['year']})
+    """
+    def __init__(self, table_dir):
+        self.table_dir = table_dir
+        with open(os.path.join(table_dir, ColumnarWriter.META_FILE), 'r') as meta_file:
+            meta = json.load(meta_file, object_pairs_hook=OrderedDict)
+        self.num_rows = meta['num_rows']
+        self.schema = meta['columns']
+
+    def __len__(self):
+        return self.num_rows
+
+    def columns(self):
+        return list(self.schema)
+
+    def __getitem__(self, name):
+        dtype = self.schema[name]
+        if dtype == 'str':
+            return StringColumn(self.table_dir, name, self.num_rows)
+        if self.num_rows == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(os.path.join(self.table_dir, name + '.bin'), dtype=dtype, mode='r', shape=(self.num_rows,))
+
+
+class CrawlExporter(object):
+    """
+    Writes parsed authors, publications and coauthor edges to columnar
+    tables under export_dir as they are crawled.
+    """
+    AUTHORS_SCHEMA = OrderedDict([
+        ('author_uid', 'str'),
+        ('author_name', 'str'),
+        ('bio', 'str'),
+        ('research_interests', 'str'),
+        ('total_citations', '<i8'),
+        ('h_index', '<i8'),
+        ('i10_index', '<i8'),
+        ('author_image_URL', 'str'),
+    ])
+    PUBLICATIONS_SCHEMA = OrderedDict([
+        ('author_uid', 'str'),
+        ('publication_uid', 'str'),
+        ('title', 'str'),
+        ('cited', '<i8'),
+        ('year', '<i8'),
+    ])
+    COAUTHOR_EDGES_SCHEMA = OrderedDict([
+        ('author_uid', 'str'),
+        ('coauthor_uid', 'str'),
+        ('coauthor_name', 'str'),
+        ('coauthor_citation_count', '<i8'),
+    ])
+
+    def __init__(self, export_dir, chunk_size=10000):
+        self.authors = ColumnarWriter(os.path.join(export_dir, 'authors'), self.AUTHORS_SCHEMA, chunk_size)
+        self.publications = ColumnarWriter(os.path.join(export_dir, 'publications'), self.PUBLICATIONS_SCHEMA, chunk_size)
+        self.coauthor_edges = ColumnarWriter(os.path.join(export_dir, 'coauthor_edges'), self.COAUTHOR_EDGES_SCHEMA, chunk_size)
+
+    def add_author(self, author_dict):
+        row = dict(author_dict)
+        row['author_uid'] = author_dict.get('author_UID')
+        self.authors.append(row)
+
+    def add_publications(self, pubs_dict):
+        for publication in pubs_dict['publications']:
+            row = dict(publication)
+            row['author_uid'] = pubs_dict['author_uid']
+            row['publication_uid'] = publication.get('id')
+            self.publications.append(row)
+
+    def add_coauthors(self, coauthors_dict):
+        for coauthor in coauthors_dict['coauthors']:
+            row = OrderedDict()
+            row['author_uid'] = coauthors_dict['author_uid']
+            row['coauthor_uid'] = coauthor.get('author_uid')
+            row['coauthor_name'] = coauthor.get('name')
+            row['coauthor_citation_count'] = coauthor.get('citation_count')
+            self.coauthor_edges.append(row)
+
+    def close(self):
+        self.authors.close()
+        self.publications.close()
+        self.coauthor_edges.close()
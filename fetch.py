@@ -0,0 +1,436 @@
+"""
+Fetch policy for requests to GS: timeouts, jittered exponential retries,
+a circuit breaker per endpoint, optional hedged requests and a pool of
+egress proxies to spread requests over.
+"""
+from collections import OrderedDict, deque
+from urlparse import parse_qs, urlparse
+import Queue
+import random
+import zlib
+import threading
+import time
+
+import requests
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    Raised without making a request while an endpoints circuit is open.
+    """
+
+
+class TransientHTTPError(requests.HTTPError):
+    """
+    Raised for status codes worth retrying, such as 503.
+    """
+
+
+class CaptchaError(TransientHTTPError):
+    """
+    Raised when GS answers with a captcha instead of the page.
+    """
+
+
+class Egress(object):
+    """
+    One egress proxy, with its own token bucket rate budget and a health
+    score from recent latency and errors. Egresses are quarantined after
+    a captcha or too many errors, for longer each time it happens again.
+    """
+    # weight of the newest sample in the latency and error averages.
+    SMOOTHING = 0.2
+
+    def __init__(self, proxy_url, rate=1.0, burst=1, error_threshold=0.5, quarantine_time=60.0, max_quarantine_time=3600.0):
+        self.proxy_url = proxy_url
+        self.rate = rate
+        self.burst = burst
+        self.error_threshold = error_threshold
+        self.quarantine_time = quarantine_time
+        self.max_quarantine_time = max_quarantine_time
+        self.tokens = float(burst)
+        self.last_refill = time.time()
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.quarantined_until = 0.0
+        self.quarantines = 0
+        self.requests = 0
+        self.captchas = 0
+
+    def get_proxies(self):
+        if self.proxy_url is None:
+            return None
+        return {'http': self.proxy_url, 'https': self.proxy_url}
+
+    def refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def is_quarantined(self, now):
+        return now < self.quarantined_until
+
+    def wait_time(self, now):
+        """
+        Seconds until this egress can take another request.
+        """
+        if self.is_quarantined(now):
+            return self.quarantined_until - now
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now):
+        self.refill(now)
+        self.tokens -= 1
+        self.requests += 1
+
+    def health(self):
+        return (1.0 - self.error_rate) / (1.0 + self.latency)
+
+    def record_success(self, latency):
+        self.latency += self.SMOOTHING * (latency - self.latency)
+        self.error_rate -= self.SMOOTHING * self.error_rate
+        self.quarantines = 0
+
+    def record_failure(self, captcha=False):
+        now = time.time()
+        self.error_rate += self.SMOOTHING * (1.0 - self.error_rate)
+        if captcha:
+            self.captchas += 1
+        if captcha or self.error_rate > self.error_threshold:
+            self.quarantine(now)
+
+    def quarantine(self, now):
+        duration = min(self.max_quarantine_time, self.quarantine_time * 2 ** self.quarantines)
+        self.quarantined_until = now + duration
+        self.quarantines += 1
+        # come back on probation, one more failure sends it back.
+        self.error_rate = self.error_threshold
+
+
+class EgressPool(object):
+    """
+    Spreads requests over egress proxies. The healthiest egress with
+    budget left is used, except that requests with a sticky key, such as
+    an author uid, keep going through the same egress while it is usable.
+    >>> pool = EgressPool(['http://10.0.0.1:3128', 'http://10.0.0.2:3128'], rate=0.5)
+    >>> policy = FetchPolicy(egress_pool=pool)
+    """
+    def __init__(self, proxy_urls, **egress_options):
+        # None is a direct connection, blank urls are left out.
+        proxy_urls = [proxy_url if proxy_url is None else proxy_url.strip() for proxy_url in proxy_urls]
+        proxy_urls = [proxy_url for proxy_url in proxy_urls if proxy_url is None or proxy_url]
+        if not proxy_urls:
+            raise ValueError('An EgressPool needs at least one proxy url, or None for a direct connection')
+        self.egresses = [Egress(proxy_url, **egress_options) for proxy_url in proxy_urls]
+        self.lock = threading.Lock()
+
+    def get_sticky(self, sticky_key, now):
+        egress = self.egresses[zlib.crc32(sticky_key) % len(self.egresses)]
+        if egress.wait_time(now) == 0 and egress.health() >= max(other.health() for other in self.egresses) / 2:
+            return egress
+        return None
+
+    def acquire(self, sticky_key=None):
+        """
+        Returns an egress to send a request through, waiting for rate
+        budget if every egress is used up or quarantined.
+        """
+        while True:
+            with self.lock:
+                now = time.time()
+                egress = self.get_sticky(sticky_key, now) if sticky_key is not None else None
+                if egress is None:
+                    available = [candidate for candidate in self.egresses if candidate.wait_time(now) == 0]
+                    if available:
+                        egress = max(available, key=lambda candidate: candidate.health())
+                if egress is not None:
+                    egress.take(now)
+                    return egress
+                wait = min(candidate.wait_time(now) for candidate in self.egresses)
+            time.sleep(wait)
+
+    def record(self, egress, latency=None, error=None):
+        with self.lock:
+            if error is None:
+                egress.record_success(latency)
+            else:
+                egress.record_failure(captcha=isinstance(error, CaptchaError))
+
+    def get_stats(self):
+        with self.lock:
+            now = time.time()
+            stats = []
+            for egress in self.egresses:
+                egress_stats = OrderedDict()
+                egress_stats['proxy_url'] = egress.proxy_url
+                egress_stats['requests'] = egress.requests
+                egress_stats['captchas'] = egress.captchas
+                egress_stats['health'] = round(egress.health(), 3)
+                egress_stats['quarantined'] = egress.is_quarantined(now)
+                stats.append(egress_stats)
+            return stats
+
+
+class CircuitBreaker(object):
+    """
+    Opens after failure_threshold consecutive failures and rejects calls
+    for reset_timeout seconds, then lets a single trial call through.
+    """
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trial_running = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if time.time() - self.opened_at < self.reset_timeout or self.trial_running:
+                return False
+            # half open, let one call through to test the endpoint.
+            self.trial_running = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_running = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_running = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.time()
+
+
+class FetchPolicy(object):
+    """
+    Fetches urls with connect and read timeouts, retrying connection
+    errors, timeouts and RETRY_STATUSES with jittered exponential backoff.
+    Each endpoint, a GS view_op, gets its own circuit breaker. With
+    hedge=True a duplicate request is sent once a request has taken
+    longer than the p95 of recent latencies, and the first answer wins.
+    Requests go through the proxies of egress_pool when one is passed,
+    and captcha pages are retried like transient errors. A captcha is
+    held against the egress which got it rather than the endpoint, so
+    one blocked proxy doesn't stop requests through the others.
+    >>> policy = FetchPolicy(read_timeout=10, max_retries=2, hedge=True)
+    >>> response = policy.get('https://scholar.google.ca/citations?user=hNTyptAAAAAJ')
+    >>> policy.get_stats()['retries']
+    0
+    """
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    CAPTCHA_MARKERS = ('gs_captcha_f', "Please show you're not a robot", '/sorry/')
+    HEADERS = {'User-agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:27.0) Gecko/20100101 Firefox/27.0'}
+
+    def __init__(self, connect_timeout=5.0, read_timeout=30.0, max_retries=3, backoff=0.5, max_backoff=30.0,
+                 failure_threshold=5, reset_timeout=30.0, hedge=False, hedge_delay=1.0, latency_window=200,
+                 egress_pool=None):
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.hedge = hedge
+        # used as the hedge delay until enough latencies are recorded.
+        self.hedge_delay = hedge_delay
+        self.latencies = deque(maxlen=latency_window)
+        self.egress_pool = egress_pool
+        self.breakers = {}
+        self.lock = threading.Lock()
+        self.stats = OrderedDict((name, 0) for name in (
+            'requests', 'successes', 'failures', 'retries', 'timeouts', 'connection_errors',
+            'transient_statuses', 'captchas', 'hedges_sent', 'hedges_won', 'circuit_rejections'))
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.stats[name] += amount
+
+    def get_stats(self):
+        with self.lock:
+            stats = OrderedDict(self.stats)
+        if self.egress_pool is not None:
+            stats['egresses'] = self.egress_pool.get_stats()
+        return stats
+
+    @staticmethod
+    def get_endpoint(url):
+        url_components = urlparse(url)
+        view_op = parse_qs(url_components.query).get('view_op', ['author'])[0]
+        return url_components.netloc + ':' + view_op
+
+    def get_breaker(self, endpoint):
+        with self.lock:
+            if endpoint not in self.breakers:
+                self.breakers[endpoint] = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+            return self.breakers[endpoint]
+
+    def get_hedge_delay(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+        if len(latencies) < 20:
+            return self.hedge_delay
+        return latencies[int(len(latencies) * 0.95) - 1]
+
+    def get_backoff(self, attempt):
+        # full jitter, so workers retrying together spread out.
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+
+    def send(self, url, **kwargs):
+        """
+        Makes a single request, returning the response.
+        Override to send requests some other way.
+        """
+        return requests.get(url, headers=self.HEADERS, timeout=(self.connect_timeout, self.read_timeout), **kwargs)
+
+    @staticmethod
+    def get_sticky_key(url):
+        """
+        Requests for the same author go through the same egress.
+        """
+        return parse_qs(urlparse(url).query).get('user', [None])[0]
+
+    def is_captcha(self, response, check_body=True):
+        if any(marker in response.url for marker in self.CAPTCHA_MARKERS):
+            return True
+        # a streamed body can't be checked without reading all of it.
+        if not check_body:
+            return False
+        return any(marker in response.text for marker in self.CAPTCHA_MARKERS[:2])
+
+    def fetch_once(self, url, **kwargs):
+        self.count('requests')
+        egress = None
+        if self.egress_pool is not None:
+            egress = self.egress_pool.acquire(self.get_sticky_key(url))
+            if egress.get_proxies() is not None:
+                kwargs['proxies'] = egress.get_proxies()
+        start = time.time()
+        try:
+            response = self.send(url, **kwargs)
+            if response.status_code in self.RETRY_STATUSES:
+                raise TransientHTTPError(response.status_code, response=response)
+            if response.status_code == 200 and self.is_captcha(response, check_body=not kwargs.get('stream')):
+                raise CaptchaError('captcha', response=response)
+        except (requests.ConnectionError, requests.Timeout, TransientHTTPError) as e:
+            if egress is not None:
+                self.egress_pool.record(egress, error=e)
+            raise
+        latency = time.time() - start
+        if egress is not None:
+            self.egress_pool.record(egress, latency=latency)
+        if response.status_code != 200:
+            raise requests.HTTPError(response.status_code, response=response)
+        with self.lock:
+            self.latencies.append(latency)
+        return response
+
+    def fetch_hedged(self, url, **kwargs):
+        """
+        Sends the request, and a duplicate if no answer arrives within
+        the hedge delay. Returns the first response, or raises the error
+        of the last request to fail. The losing response is closed once
+        it arrives, so its connection goes back to the pool.
+        """
+        results = Queue.Queue()
+
+        def fetch(index):
+            try:
+                results.put((index, True, self.fetch_once(url, **kwargs)))
+            except Exception as e:
+                results.put((index, False, e))
+
+        def start(index):
+            thread = threading.Thread(target=fetch, args=(index,))
+            thread.daemon = True
+            thread.start()
+
+        start(0)
+        hedged = False
+        try:
+            index, success, result = results.get(timeout=self.get_hedge_delay())
+        except Queue.Empty:
+            self.count('hedges_sent')
+            hedged = True
+            start(1)
+            index, success, result = results.get()
+        if not success and hedged:
+            # the other request may still succeed.
+            index, success, other_result = results.get()
+            if success:
+                result = other_result
+        elif hedged:
+            closer = threading.Thread(target=self.close_loser, args=(results,))
+            closer.daemon = True
+            closer.start()
+        if not success:
+            raise result
+        if index == 1:
+            self.count('hedges_won')
+        return result
+
+    @staticmethod
+    def close_loser(results):
+        """
+        Waits for the hedged request which lost and closes its response.
+        """
+        index, success, result = results.get()
+        if success:
+            result.close()
+
+    def get(self, url, **kwargs):
+        """
+        Returns the response for url, or raises once retries run out.
+        """
+        breaker = self.get_breaker(self.get_endpoint(url))
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.count('circuit_rejections')
+                raise CircuitOpenError('Circuit open for ' + self.get_endpoint(url))
+            try:
+                if self.hedge:
+                    response = self.fetch_hedged(url, **kwargs)
+                else:
+                    response = self.fetch_once(url, **kwargs)
+            except requests.Timeout as e:
+                self.count('timeouts')
+                error = e
+            except requests.ConnectionError as e:
+                self.count('connection_errors')
+                error = e
+            except CaptchaError as e:
+                self.count('captchas')
+                error = e
+                if self.egress_pool is not None:
+                    # the endpoint answered, the egress is quarantined instead.
+                    breaker.record_success()
+            except TransientHTTPError as e:
+                self.count('transient_statuses')
+                error = e
+            except requests.HTTPError:
+                # the endpoint answered, the request was bad.
+                breaker.record_success()
+                self.count('failures')
+                raise
+            else:
+                breaker.record_success()
+                self.count('successes')
+                return response
+            if not isinstance(error, CaptchaError) or self.egress_pool is None:
+                breaker.record_failure()
+            if attempt >= self.max_retries:
+                self.count('failures')
+                raise error
+            self.count('retries')
+            time.sleep(self.get_backoff(attempt))
+            attempt += 1
@@ -1,10 +1,23 @@
 #!/usr/bin/env python
 from bs4 import BeautifulSoup
+from HTMLParser import HTMLParser
+from htmlentitydefs import name2codepoint
 from urllib import urlencode
 from urlparse import parse_qs, urlparse
 from collections import OrderedDict
-import requests
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+from archive import PageArchive
+from changes import ChangeFeed
+from export import CrawlExporter
+from fetch import EgressPool, FetchPolicy
+from history import CitationHistory
+from images import ImageFetcher, ImageStore
+from profiles import ProfileIndex
+from timeseries import YearSeries
+import codecs
 import json
+import re
 import sys
 import time
 
@@ -17,53 +30,259 @@ class GSHelper(object):
     BASE_URL = 'https://scholar.google.ca'
     CITATIONS_URL_EXTENSION = '/citations?'
     PUB_RESULTS_PER_PAGE = 100
+    # timeouts, retries, circuit breakers and hedging for every request.
+    fetch_policy = FetchPolicy()
+    # PageArchive which every fetched page is appended to, if set.
+    archive = None
+    # CrawlExporter which parsed results are written to, if set.
+    exporter = None
+    # ProfileIndex which parsed author profiles are added to, if set.
+    profile_index = None
+    # ChangeFeed which parsed results are diffed against, if set.
+    change_feed = None
+    # ImageFetcher which author photos are downloaded with, if set.
+    image_fetcher = None
+    # CitationHistory which citation counts are recorded in, if set.
+    citation_history = None
 
     @staticmethod
     def get_url(url):
         """
         Requests page at url provided, passes back html
+        Raises requests.HTTPError for non 200 responses once
+        GSHelper.fetch_policy has given up retrying.
         """
-        header = {'User-agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:27.0) Gecko/20100101 Firefox/27.0'}
-        response = requests.get(url, headers=header)
-        if response.status_code != 200:
-            raise requests.HTTPError
+        response = GSHelper.fetch_policy.get(url)
+        if GSHelper.archive is not None:
+            GSHelper.archive.store(url, response.text)
         return response.text
 
+    @staticmethod
+    def stream_url(url, chunk_size=16384):
+        """
+        Requests page at url provided, returns the encoding of the page,
+        utf-8 if the response doesn't give one, and a generator of the raw
+        bytes of the body as they arrive.
+        """
+        response = GSHelper.fetch_policy.get(url, stream=True)
+        encoding = response.encoding or 'utf-8'
+        def iter_chunks():
+            chunks = []
+            for chunk in response.iter_content(chunk_size):
+                if GSHelper.archive is not None:
+                    chunks.append(chunk)
+                yield chunk
+            if GSHelper.archive is not None:
+                GSHelper.archive.store(url, b''.join(chunks).decode(encoding))
+        return encoding, iter_chunks()
+
+    @staticmethod
+    def set_archive(archive_dir):
+        """
+        Archives every page fetched from now on in archive_dir.
+        """
+        GSHelper.archive = PageArchive(archive_dir)
+
+    @staticmethod
+    def set_exporter(export_dir):
+        """
+        Writes results parsed from now on to columnar tables in export_dir.
+        """
+        GSHelper.exporter = CrawlExporter(export_dir)
+
+    @staticmethod
+    def set_profile_index(index_path):
+        """
+        Adds author profiles parsed from now on to the index at index_path.
+        """
+        GSHelper.profile_index = ProfileIndex(index_path)
+
+    @staticmethod
+    def index_profiles(profiles):
+        if GSHelper.profile_index is not None:
+            GSHelper.profile_index.add_all(profiles)
+
+    @staticmethod
+    def set_image_store(store_dir):
+        """
+        Downloads the photos of authors and coauthors parsed from now on
+        to store_dir, adding their local paths to the results.
+        """
+        GSHelper.image_fetcher = ImageFetcher(ImageStore(store_dir), GSHelper.fetch_policy)
+
+    @staticmethod
+    def fetch_images(results_dict):
+        if GSHelper.image_fetcher is not None:
+            GSHelper.image_fetcher.add_local_paths(results_dict)
+
+    @staticmethod
+    def set_change_feed(snapshot_path, feed_path):
+        """
+        Diffs results parsed from now on against the snapshot at
+        snapshot_path, appending changes to feed_path.
+        """
+        GSHelper.change_feed = ChangeFeed(snapshot_path, feed_path)
+
+    @staticmethod
+    def record_changes(results_dict):
+        if GSHelper.change_feed is not None:
+            GSHelper.change_feed.add(results_dict)
+
+    @staticmethod
+    def set_citation_history(history_dir):
+        """
+        Records citation counts parsed from now on in the history kept
+        in history_dir.
+        """
+        GSHelper.citation_history = CitationHistory(history_dir)
+
+    @staticmethod
+    def record_history(results_dict):
+        if GSHelper.citation_history is not None:
+            GSHelper.citation_history.add(results_dict)
+
+    @staticmethod
+    def reparse_archive(archive_dir, processes=None):
+        """
+        Runs the current parsers over every page in the archive in
+        parallel. No requests are made to GS.
+        """
+        archive = PageArchive(archive_dir)
+        jobs = [(archive_dir, entry) for entry in archive.entries()]
+        pool = Pool(processes)
+        try:
+            results = pool.map(reparse_archive_entry, jobs)
+        finally:
+            pool.close()
+            pool.join()
+        return [result for result in results if result is not None]
+
     @staticmethod
     def search_author(author_name, description=None, labels=None):
-        author_name = sys.argv[2]
-        if description is not None:
-            # Author name and description are part of the same
-            # field in the gs url.
-            author_name = author_name + description
-        if labels is None:
-            author_query = AuthorQuery(author_name, AuthorQueryParser)
-        else:
-            author_query = AuthorQuery(author_name, AuthorQueryParser, labels)
+        author_query = AuthorQuery(author_name, AuthorQueryParser, description, labels)
+        GSHelper.index_profiles(author_query.get_results_dict()['search_results'])
         return author_query.to_json()
 
     @staticmethod
-    def get_author(author_url):
-        author = Author(author_url, AuthorParser)
+    def author_fields(fields):
+        """
+        Returns the author fields to parse, adding author_UID to projected
+        fields when results are exported, diffed or recorded in the
+        citation history, which key authors by it.
+        """
+        if fields is None or 'author_UID' in fields:
+            return fields
+        if GSHelper.exporter is None and GSHelper.change_feed is None and GSHelper.citation_history is None:
+            return fields
+        return list(fields) + ['author_UID']
+
+    @staticmethod
+    def get_author(author_url, fields=None):
+        author = Author(author_url, AuthorParser, GSHelper.author_fields(fields))
+        GSHelper.fetch_images(author.get_results_dict())
+        if GSHelper.exporter is not None:
+            GSHelper.exporter.add_author(author.get_results_dict())
+        GSHelper.index_profiles([author.get_results_dict()])
+        GSHelper.record_changes(author.get_results_dict())
+        GSHelper.record_history(author.get_results_dict())
         return author.to_json()
 
     @staticmethod
-    def get_publications(author_uid, page):
-        author_pubs = AuthorPublications(author_uid, page, AuthorPublicationsParser)
+    def get_publications(author_uid, page, fields=None):
+        if fields is None:
+            author_pubs = AuthorPublications(author_uid, page, AuthorPublicationsParser)
+        else:
+            author_pubs = AuthorPublicationsProjection(author_uid, page, fields)
+        if GSHelper.exporter is not None:
+            GSHelper.exporter.add_publications(author_pubs.get_results_dict())
+        GSHelper.record_changes(author_pubs.get_results_dict())
+        GSHelper.record_history(author_pubs.get_results_dict())
         return author_pubs.to_json()
 
     @staticmethod
-    def get_publication(author_uid, publication_uid):
-        author_pub = AuthorPublication(author_uid, publication_uid, AuthorPublicationParser)
+    def stream_publications(author_uid, page):
+        """
+        Yields publications one at a time as the page downloads.
+        """
+        author_pubs = AuthorPublicationsStream(author_uid, page)
+        for publication in author_pubs:
+            yield publication
+        if GSHelper.exporter is not None:
+            GSHelper.exporter.add_publications(author_pubs.get_results_dict())
+        GSHelper.record_changes(author_pubs.get_results_dict())
+        GSHelper.record_history(author_pubs.get_results_dict())
+
+    @staticmethod
+    def get_all_publications(author_uid, num_publications=None):
+        author_pubs = AuthorAllPublications(author_uid, AuthorPublicationsParser, num_publications)
+        if GSHelper.exporter is not None:
+            GSHelper.exporter.add_publications(author_pubs.get_results_dict())
+        GSHelper.record_changes(author_pubs.get_results_dict())
+        GSHelper.record_history(author_pubs.get_results_dict())
+        return author_pubs.to_json()
+
+    @staticmethod
+    def sync_publications(author_uid, known_uids, top_n=20):
+        author_sync = AuthorPublicationsSync(author_uid, known_uids, AuthorPublicationsParser, top_n)
+        return author_sync.to_json()
+
+    @staticmethod
+    def get_publication(author_uid, publication_uid, fields=None):
+        author_pub = AuthorPublication(author_uid, publication_uid, AuthorPublicationParser, fields)
         return author_pub.to_json()
 
     @staticmethod
     def get_coauthors(author_uid):
         author_coauthors = AuthorCoAuthors(author_uid, AuthorCoAuthorsParser)
+        GSHelper.fetch_images(author_coauthors.get_results_dict())
+        if GSHelper.exporter is not None:
+            GSHelper.exporter.add_coauthors(author_coauthors.get_results_dict())
+        GSHelper.index_profiles(author_coauthors.get_results_dict()['coauthors'])
+        GSHelper.record_changes(author_coauthors.get_results_dict())
         return author_coauthors.to_json()
 
 
+def reparse_archive_entry(job):
+    """
+    Parses a single archived page. Lives at module level so it can be
+    handed to a multiprocessing pool.
+    """
+    archive_dir, entry = job
+    url, html = PageArchive(archive_dir).read(entry)
+    parser = ParseHelper.get_parser_for_url(url)
+    if parser is None:
+        return None
+    results_dict = OrderedDict()
+    results_dict['url'] = url
+    results_dict['fetched'] = entry.fetched
+    try:
+        parser(html, results_dict)
+    except Exception as e:
+        print "Couldn't re-parse {0}: {1}".format(url, e)
+        return None
+    return results_dict
+
+
 class ParseHelper(object):
+    @staticmethod
+    def get_parser_for_url(url):
+        """
+        Returns the parser class which handles the GS page at url.
+        """
+        params = parse_qs(urlparse(url).query)
+        view_op = params.get('view_op', [None])[0]
+        if view_op == 'search_authors':
+            return AuthorQueryParser
+        if view_op == 'list_colleagues':
+            return AuthorCoAuthorsParser
+        if view_op == 'view_citation':
+            return AuthorPublicationParser
+        if 'user' in params and 'cstart' in params:
+            return AuthorPublicationsParser
+        if 'user' in params:
+            return AuthorParser
+        return None
+
     @staticmethod
     def get_parameter_from_url(url, key):
         """
@@ -118,9 +337,34 @@ class Parser(object):
     """
     Base class for parser objects.
     """
+    # result field to the name of the method parsing it, in output order.
+    FIELDS = OrderedDict()
+    # fields parsed when none are asked for, every field in FIELDS if None.
+    DEFAULT_FIELDS = None
+
     def get_results(self):
         return self.results
 
+    def select_fields(self, fields=None):
+        """
+        Returns the fields to parse, in output order, DEFAULT_FIELDS if
+        fields is None. Unknown fields raise a ValueError.
+        """
+        if fields is None:
+            return list(self.DEFAULT_FIELDS or self.FIELDS)
+        unknown = [field for field in fields if field not in self.FIELDS]
+        if unknown:
+            raise ValueError("{0} can't parse fields: {1}".format(self.__class__.__name__, ', '.join(unknown)))
+        return [field for field in self.FIELDS if field in fields]
+
+    def parse_fields(self, soup, results_dict):
+        """
+        Parses only the fields in self.fields from soup into results_dict.
+        """
+        for field in self.fields:
+            results_dict[field] = getattr(self, self.FIELDS[field])(soup)
+        return results_dict
+
 
 class AuthorQuery(ScholarObject):
     """
@@ -149,8 +393,8 @@ class AuthorQuery(ScholarObject):
     >>> search_results.get_num_hits()
     '3'
     """
-    def __init__(self, author_name, author_query_parser, author_description=None, labels=None):
-        self.query_url = self.get_url(author_name, author_description, labels)
+    def __init__(self, author_name, author_query_parser, author_description=None, labels=None, page=None):
+        self.query_url = self.get_url(author_name, author_description, labels, page)
         html = GSHelper.get_url(self.query_url)
         self.results_dict = OrderedDict()
         self.results_dict['author_search_name'] = author_name
@@ -168,9 +412,10 @@ class AuthorQuery(ScholarObject):
             formatted_labels += ' label:' + label.replace(' ', '_')
         return formatted_labels
 
-    def get_url(self, author_name, author_description=None, labels=None):
+    def get_url(self, author_name, author_description=None, labels=None, page=None):
         """
         Generate the http request URL submittable to GS
+        page is the next_page token of a previous results page.
         """
         results_dict = OrderedDict()
         if author_description:
@@ -182,6 +427,8 @@ class AuthorQuery(ScholarObject):
             results_dict['mauthors'] += formatted_labels
         results_dict['hl'] = 'en'
         results_dict['view_op'] = 'search_authors'
+        if page is not None:
+            results_dict.update(page)
         query_URL = GSHelper.BASE_URL + GSHelper.CITATIONS_URL_EXTENSION + urlencode(results_dict)
         return query_URL
 
@@ -201,6 +448,50 @@ class AuthorQuery(ScholarObject):
         return self.search_results[index]['uid']
 
 
+class AuthorSearch(object):
+    """
+    Streams author hits across every results page of a query.
+    Hits are yielded lazily while the next page is fetched in the
+    background, stopping after max_results hits.
+    >>> for author in AuthorSearch('label:machine_learning', AuthorQueryParser, max_results=50):
+    ...     print author['uid']
+    """
+    def __init__(self, author_name, author_query_parser, author_description=None, labels=None, max_results=None):
+        self.author_name = author_name
+        self.author_query_parser = author_query_parser
+        self.author_description = author_description
+        self.labels = labels
+        self.max_results = max_results
+        self.pages_fetched = 0
+
+    def fetch_page(self, page):
+        self.pages_fetched += 1
+        author_query = AuthorQuery(self.author_name, self.author_query_parser, self.author_description, self.labels, page)
+        return author_query.get_results_dict()
+
+    def __iter__(self):
+        if self.max_results is not None and self.max_results <= 0:
+            return
+        pool = ThreadPool(1)
+        try:
+            pending = pool.apply_async(self.fetch_page, (None,))
+            num_results = 0
+            while pending is not None:
+                query_dict = pending.get()
+                search_results = query_dict['search_results']
+                next_page = query_dict.get('next_page')
+                pending = None
+                if next_page and (self.max_results is None or num_results + len(search_results) < self.max_results):
+                    pending = pool.apply_async(self.fetch_page, (next_page,))
+                for author in search_results:
+                    yield author
+                    num_results += 1
+                    if self.max_results is not None and num_results >= self.max_results:
+                        return
+        finally:
+            pool.terminate()
+
+
 class AuthorQueryParser(Parser):
     """
     Parses the html payload of an author query.
@@ -209,6 +500,27 @@ class AuthorQueryParser(Parser):
     def __init__(self, payload, query_dict):
         soup = BeautifulSoup(payload, 'lxml')
         query_dict['search_results'] = self.parse(soup, query_dict)
+        query_dict['next_page'] = self.parse_next_page(soup)
+
+    def parse_next_page(self, soup):
+        """
+        Returns the url parameters of the next results page, taken from
+        the onclick handler of the next button, or None on the last page.
+        """
+        next_button = soup.find('button', attrs={'aria-label': 'Next'})
+        if next_button is None or next_button.get('disabled') is not None:
+            return None
+        onclick = next_button.get('onclick')
+        if not onclick:
+            return None
+        # the url in the handler has its = and & escaped as \x3d and \x26.
+        onclick = re.sub(r'\\x([0-9a-fA-F]{2})', lambda match: chr(int(match.group(1), 16)), onclick)
+        params = parse_qs(urlparse(onclick.split("'")[1]).query)
+        next_page = OrderedDict()
+        for key in ('after_author', 'astart'):
+            if key in params:
+                next_page[key] = params[key][0]
+        return next_page or None
 
     def parse(self, soup, query_dict):
         parsed_results = []
@@ -279,12 +591,13 @@ class Author(ScholarObject):
     Represents an author.
     Pass in an author page url on GS.
     Get parsed information by calling Author.get_author_info()
+    Pass a list of fields to only parse those.
     """
-    def __init__(self, author_uid, author_parser):
+    def __init__(self, author_uid, author_parser, fields=None):
         self.results_dict = OrderedDict()
         self.author_url = self.get_author_url(author_uid)
         author_html = GSHelper.get_url(self.author_url)
-        self.author_parser = author_parser(author_html, self.results_dict)
+        self.author_parser = author_parser(author_html, self.results_dict, fields)
 
     def get_author_url(self, author_uid):
         """
@@ -299,22 +612,30 @@ class Author(ScholarObject):
 class AuthorParser(Parser):
     """
     Parses the html payload of an author page on GS.
+    Pass a list of fields to only parse those.
+    >>> AuthorParser(html, OrderedDict(), ['h_index', 'total_citations']).get_results()
     """
-    def __init__(self, payload, author_dict):
+    FIELDS = OrderedDict([
+        ('author_name', 'parse_name'),
+        ('author_UID', 'parse_author_uid'),
+        ('bio', 'parse_author_bio'),
+        ('research_interests', 'parse_author_research_interests'),
+        ('total_citations', 'parse_author_total_citations'),
+        ('h_index', 'parse_h_index'),
+        ('i10_index', 'parse_i10_index'),
+        ('publications_by_year', 'parse_publications_by_year'),
+        ('author_image_URL', 'parse_author_image_URL'),
+    ])
+
+    def __init__(self, payload, author_dict, fields=None):
+        self.fields = self.select_fields(fields)
         soup = BeautifulSoup(payload, 'lxml')
         self.results = self.parse(soup, author_dict)
 
     def parse(self, soup, author_dict):
-        author_dict['author_name'] = self.parse_name(soup)
-        author_dict['author_UID'] = self.parse_author_uid(soup)
-        author_dict['bio'] = self.parse_author_bio(soup)
-        author_dict['research_interests'] = self.parse_author_research_interests(soup)
-        author_dict['total_citations'] = self.parse_author_total_citations(soup)
-        author_dict['h_index'] = self.parse_h_index(soup)
-        author_dict['i10_index'] = self.parse_i10_index(soup)
-        author_dict['publications_by_year'] = self.parse_publications_by_year(soup)
-        author_dict['author_image_URL'] = self.parse_author_image_URL(soup)
-        return author_dict
+        # YearSeries of the publications_by_year graph.
+        self.publications_by_year = None
+        return self.parse_fields(soup, author_dict)
 
     @ParseHelper.exception_wrapper
     def parse_name(self, soup):
@@ -372,18 +693,14 @@ class AuthorParser(Parser):
 
     @ParseHelper.exception_wrapper
     def parse_publications_by_year(self, soup):
-        pubs_by_year = []
         graph_div = soup.find(id='gsc_g')
         years_div = graph_div.find(id='gsc_g_x')
         years = years_div.find_all('span')
         counts_div = graph_div.find(id='gsc_g_bars')
         counts = counts_div.find_all('a')
-        for year, count in zip(years, counts):
-            result_dict = OrderedDict()
-            result_dict['year'] = int(year.text)
-            result_dict['count'] = int(count.text)
-            pubs_by_year.append(result_dict)
-        return pubs_by_year
+        pairs = [(int(year.text), int(count.text)) for year, count in zip(years, counts)]
+        self.publications_by_year = YearSeries.from_pairs(pairs)
+        return self.publications_by_year.to_dicts()
 
     @ParseHelper.exception_wrapper
     def parse_author_image_URL(self, soup):
@@ -482,27 +799,280 @@ class AuthorCoAuthorsParser(Parser):
 
 
 class AuthorPublications(ScholarObject):
-    def __init__(self, author_uid, page, author_publications_parser):
+    """
+    Represents one page of an authors publications.
+    Pages are sorted by citation count unless sortby='pubdate' is passed.
+    Pass a list of fields to only parse those for each publication.
+    """
+    def __init__(self, author_uid, page, author_publications_parser, sortby=None, pagesize=GSHelper.PUB_RESULTS_PER_PAGE,
+                 fields=None):
         self.results_dict = OrderedDict()
         self.results_dict['author_uid'] = author_uid
         self.results_dict['page'] = page
-        query_url = self.get_page_url(author_uid, page)
+        query_url = self.get_page_url(author_uid, page, sortby, pagesize)
         html = GSHelper.get_url(query_url)
-        self.author_pubs_parser = author_publications_parser(html, self.results_dict)
+        self.author_pubs_parser = author_publications_parser(html, self.results_dict, fields)
 
-    def get_page_url(self, author_uid, page):
+    def get_page_url(self, author_uid, page, sortby=None, pagesize=GSHelper.PUB_RESULTS_PER_PAGE):
         url = GSHelper.BASE_URL + GSHelper.CITATIONS_URL_EXTENSION
         query_dict = OrderedDict()
         query_dict['user'] = author_uid
         query_dict['hl'] = 'en'
-        query_dict['cstart'] = page * GSHelper.PUB_RESULTS_PER_PAGE
-        query_dict['pagesize'] = GSHelper.PUB_RESULTS_PER_PAGE
+        query_dict['cstart'] = page * pagesize
+        query_dict['pagesize'] = pagesize
+        if sortby is not None:
+            query_dict['sortby'] = sortby
         query_url = url + urlencode(query_dict)
         return query_url
 
 
+class AuthorPublicationsStream(AuthorPublications):
+    """
+    One page of an authors publications, parsed from the raw bytes as
+    they arrive. Iterate over it to get publications as they are parsed,
+    the results dict is complete once iteration finishes.
+    >>> for publication in AuthorPublicationsStream('hNTyptAAAAAJ', 0):
+    ...     print publication['title']
+    """
+    def __init__(self, author_uid, page, streaming_parser=None, sortby=None, pagesize=GSHelper.PUB_RESULTS_PER_PAGE):
+        self.results_dict = OrderedDict()
+        self.results_dict['author_uid'] = author_uid
+        self.results_dict['page'] = page
+        self.results_dict['publications'] = []
+        self.query_url = self.get_page_url(author_uid, page, sortby, pagesize)
+        self.streaming_parser = streaming_parser or StreamingPublicationsParser
+
+    def __iter__(self):
+        encoding, chunks = GSHelper.stream_url(self.query_url)
+        parser = self.streaming_parser(encoding)
+        for chunk in chunks:
+            for publication in parser.feed(chunk):
+                self.results_dict['publications'].append(publication)
+                yield publication
+        for publication in parser.close():
+            self.results_dict['publications'].append(publication)
+            yield publication
+
+
+class AuthorPublicationsProjection(ScholarObject):
+    """
+    One page of an authors publications with only the fields asked for,
+    from the list page (url, id, title, authors_line, cited, year) and
+    the publication detail page (AuthorPublicationParser.FIELDS). Detail
+    pages are only fetched when a field isn't on the list page.
+    >>> AuthorPublicationsProjection('hNTyptAAAAAJ', 0, ['title', 'year', 'citation_count']).detail_fetches
+    0
+    """
+    # detail fields the list page already has, under another name.
+    LIST_PAGE_ALIASES = OrderedDict([('citation_count', 'cited')])
+
+    def __init__(self, author_uid, page, fields, max_workers=8):
+        self.author_uid = author_uid
+        list_fields, detail_fields = self.split_fields(fields)
+        # the publication uid is needed to fetch its detail page.
+        fetch_fields = list_fields + ['id'] if detail_fields else list_fields
+        author_pubs = AuthorPublications(author_uid, page, AuthorPublicationsParser, fields=fetch_fields)
+        listed = author_pubs.get_results_dict()['publications']
+        self.detail_fetches = len(listed) if detail_fields else 0
+        details = self.fetch_details(listed, detail_fields, max_workers) if detail_fields else [{}] * len(listed)
+
+        self.results_dict = OrderedDict()
+        self.results_dict['author_uid'] = author_uid
+        self.results_dict['page'] = page
+        self.results_dict['publications'] = []
+        for listed_pub, detail in zip(listed, details):
+            publication = OrderedDict()
+            for field in fields:
+                if field in detail:
+                    publication[field] = detail[field]
+                else:
+                    publication[field] = listed_pub.get(self.LIST_PAGE_ALIASES.get(field, field))
+            self.results_dict['publications'].append(publication)
+
+    def split_fields(self, fields):
+        """
+        Returns (list page fields, detail page fields) needed for fields.
+        Raises a ValueError for fields on neither page.
+        """
+        list_fields = []
+        detail_fields = []
+        for field in fields:
+            list_field = self.LIST_PAGE_ALIASES.get(field, field)
+            if list_field in AuthorPublicationsParser.FIELDS:
+                list_fields.append(list_field)
+            elif field in AuthorPublicationParser.FIELDS:
+                detail_fields.append(field)
+            else:
+                raise ValueError("Publications don't have field: {0}".format(field))
+        return list_fields, detail_fields
+
+    def fetch_details(self, listed, detail_fields, max_workers):
+        def fetch_detail(listed_pub):
+            author_pub = AuthorPublication(self.author_uid, listed_pub['id'], AuthorPublicationParser, detail_fields)
+            return author_pub.get_results_dict()
+        if not listed:
+            return []
+        pool = ThreadPool(min(max_workers, len(listed)))
+        try:
+            return pool.map(fetch_detail, listed)
+        finally:
+            pool.close()
+            pool.join()
+
+
+class AuthorAllPublications(ScholarObject):
+    """
+    Represents every publication of an author, across all pages.
+    Once the number of pages is known, either from num_publications or
+    by probing pages 1, 2, 4, 8... until one comes back short and binary
+    searching between the last two probes, the remaining pages are
+    fetched concurrently and merged in order. If the last page expected
+    from num_publications is full the count was too low, and the pages
+    after it are probed the same way. No page is fetched twice.
+    Rows repeated across page boundaries are dropped by publication uid.
+    Pass a list of fields to only parse those, they must include id.
+    """
+    def __init__(self, author_uid, author_publications_parser, num_publications=None, max_workers=8, fields=None):
+        self.author_uid = author_uid
+        self.author_publications_parser = author_publications_parser
+        self.fields = fields
+        self.pages = OrderedDict()
+        self.results_dict = OrderedDict()
+        self.results_dict['author_uid'] = author_uid
+        self.fetch_page(0)
+        if self.is_full(0):
+            if num_publications is not None:
+                last_page = max(num_publications - 1, 0) // GSHelper.PUB_RESULTS_PER_PAGE
+                self.fetch_pages(range(1, last_page + 1), max_workers)
+                if self.is_full(last_page):
+                    last_page = self.probe_last_page(last_page)
+            else:
+                last_page = self.probe_last_page()
+            self.fetch_pages(range(1, last_page + 1), max_workers)
+        self.results_dict['pages'] = self.count_pages()
+        self.results_dict['publications'] = self.merge_pages()
+
+    def fetch_page(self, page):
+        author_pubs = AuthorPublications(self.author_uid, page, self.author_publications_parser, fields=self.fields)
+        self.pages[page] = author_pubs.get_results_dict()['publications']
+
+    def fetch_pages(self, pages, max_workers):
+        """
+        Fetches the pages not fetched yet concurrently.
+        """
+        remaining = [page for page in pages if page not in self.pages]
+        if not remaining:
+            return
+        pool = ThreadPool(min(max_workers, len(remaining)))
+        try:
+            pool.map(self.fetch_page, remaining)
+        finally:
+            pool.close()
+            pool.join()
+
+    def is_full(self, page):
+        return len(self.pages[page]) >= GSHelper.PUB_RESULTS_PER_PAGE
+
+    def probe_last_page(self, last_full=0):
+        """
+        Fetches pages at exponentially growing offsets after last_full, a
+        full page, until one is short, then binary searches between it and
+        the last full probe. Returns the first short page, the last which
+        can hold publications.
+        """
+        start = last_full
+        offset = 1
+        while True:
+            probe = start + offset
+            self.fetch_page(probe)
+            if not self.is_full(probe):
+                break
+            last_full = probe
+            offset *= 2
+        first_short = probe
+        while first_short - last_full > 1:
+            middle = (last_full + first_short) // 2
+            self.fetch_page(middle)
+            if self.is_full(middle):
+                last_full = middle
+            else:
+                first_short = middle
+        return first_short
+
+    def count_pages(self):
+        # pages after the first short one are empty.
+        for page in sorted(self.pages):
+            if not self.is_full(page):
+                return page + 1 if self.pages[page] else page
+        return len(self.pages)
+
+    def merge_pages(self):
+        seen_uids = set()
+        publications = []
+        for page in sorted(self.pages):
+            for publication in self.pages[page]:
+                if publication['id'] in seen_uids:
+                    continue
+                seen_uids.add(publication['id'])
+                publications.append(publication)
+        return publications
+
+
+class AuthorPublicationsSync(ScholarObject):
+    """
+    Picks up the publications an author added since the last crawl.
+    Walks the publication list newest first and stops at the first
+    publication uid already known, then refreshes the citation counts
+    of the top_n most cited publications from a single page.
+    """
+    def __init__(self, author_uid, known_uids, author_publications_parser, top_n=20):
+        self.results_dict = OrderedDict()
+        self.results_dict['author_uid'] = author_uid
+        self.results_dict['new_publications'] = self.get_new_publications(author_uid, set(known_uids), author_publications_parser)
+        self.results_dict['top_cited'] = self.get_top_cited(author_uid, top_n, author_publications_parser)
+
+    def get_new_publications(self, author_uid, known_uids, author_publications_parser):
+        new_publications = []
+        page = 0
+        while True:
+            author_pubs = AuthorPublications(author_uid, page, author_publications_parser, sortby='pubdate')
+            publications = author_pubs.get_results_dict()['publications']
+            for publication in publications:
+                if publication['id'] in known_uids:
+                    return new_publications
+                new_publications.append(publication)
+            if len(publications) < GSHelper.PUB_RESULTS_PER_PAGE:
+                return new_publications
+            page += 1
+
+    def get_top_cited(self, author_uid, top_n, author_publications_parser):
+        if top_n <= 0:
+            return []
+        author_pubs = AuthorPublications(author_uid, 0, author_publications_parser, pagesize=top_n)
+        top_cited = []
+        for publication in author_pubs.get_results_dict()['publications'][:top_n]:
+            citation_dict = OrderedDict()
+            citation_dict['id'] = publication['id']
+            citation_dict['cited'] = publication['cited']
+            top_cited.append(citation_dict)
+        return top_cited
+
+
 class AuthorPublicationsParser(Parser):
-    def __init__(self, payload, pubs_dict):
+    FIELDS = OrderedDict([
+        ('url', 'parse_article_url'),
+        ('id', 'parse_article_uid'),
+        ('title', 'parse_article_title'),
+        ('authors_line', 'parse_authors_line'),
+        ('cited', 'parse_citation_count'),
+        ('year', 'parse_year'),
+    ])
+    # the shortened authors line is only parsed when asked for, the full
+    # list of authors is the detail page authors field.
+    DEFAULT_FIELDS = ('url', 'id', 'title', 'cited', 'year')
+
+    def __init__(self, payload, pubs_dict, fields=None):
+        self.fields = self.select_fields(fields)
         soup = BeautifulSoup(payload, 'lxml')
         self.results = self.parse(soup, pubs_dict)
 
@@ -519,13 +1089,7 @@ class AuthorPublicationsParser(Parser):
             print "Couldn't parse publications."
             return article_uids
         for article in articles:
-            article_dict = OrderedDict()
-            article_dict['url'] = self.parse_article_url(article)
-            article_dict['id'] = self.parse_article_uid(article)
-            article_dict['title'] = self.parse_article_title(article)
-            article_dict['cited'] = self.parse_citation_count(article)
-            article_dict['year'] = self.parse_year(article)
-            article_uids.append(article_dict)
+            article_uids.append(self.parse_fields(article, OrderedDict()))
         return article_uids
 
     @ParseHelper.exception_wrapper
@@ -539,6 +1103,11 @@ class AuthorPublicationsParser(Parser):
         title = article_soup.find('td').a.text
         return title
 
+    @ParseHelper.exception_wrapper
+    def parse_authors_line(self, article_soup):
+        authors_line = article_soup.find('td').find(class_='gs_gray').text
+        return authors_line
+
     @ParseHelper.exception_wrapper
     def parse_article_uid(self, article_soup):
         href = article_soup.find('td').a.get('href')
@@ -565,14 +1134,146 @@ class AuthorPublicationsParser(Parser):
         return year
 
 
+class StreamingPublicationsParser(Parser):
+    """
+    Event based parser for the publications table, fed raw bytes a
+    chunk at a time. Gives the same publications as
+    AuthorPublicationsParser without building a tree, returning each row
+    as soon as it is complete. Chunks are decoded incrementally, so a
+    character split across two chunks is decoded once both arrive.
+    Everything before the table is skipped without being parsed.
+    """
+    TABLE_MARKER = '<table id="gsc_a_t"'
+
+    def __init__(self, encoding='utf-8'):
+        self.results = []
+        self.extractor = PublicationsTableExtractor(self.results)
+        self.decoder = codecs.getincrementaldecoder(encoding)()
+        self.in_table = False
+        self.skipped = ''
+
+    def feed(self, chunk):
+        """
+        Parses the next chunk of the page, returning the publications
+        completed by it.
+        """
+        if not self.in_table:
+            # keep enough of the skipped bytes to find a marker split
+            # across two chunks.
+            chunk = self.skipped + chunk
+            table_idx = chunk.find(self.TABLE_MARKER)
+            if table_idx == -1:
+                self.skipped = chunk[-len(self.TABLE_MARKER):]
+                return []
+            self.in_table = True
+            chunk = chunk[table_idx:]
+        self.extractor.feed(self.decoder.decode(chunk))
+        return self.extractor.take_pending()
+
+    def close(self):
+        """
+        Finishes the page, returning any publications not yet returned.
+        """
+        self.extractor.feed(self.decoder.decode('', final=True))
+        self.extractor.close()
+        return self.extractor.take_pending()
+
+
+class PublicationsTableExtractor(HTMLParser):
+    """
+    Collects rows of the publications table from parser events,
+    fed decoded text.
+    """
+    def __init__(self, publications):
+        HTMLParser.__init__(self)
+        self.publications = publications
+        self.pending = []
+        self.publication = None
+        # the field whose text is being collected.
+        self.capturing = None
+        self.text = []
+
+    def take_pending(self):
+        pending = self.pending
+        self.pending = []
+        return pending
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        element_classes = (attrs.get('class') or '').split()
+        if tag == 'tr' and 'gsc_a_tr' in element_classes:
+            self.publication = OrderedDict()
+            self.publication['url'] = ''
+            self.publication['id'] = ''
+            self.publication['title'] = ''
+            self.publication['cited'] = ''
+            self.publication['year'] = ''
+        elif self.publication is None:
+            return
+        elif tag == 'a' and 'gsc_a_at' in element_classes:
+            href = attrs.get('href', '')
+            self.publication['url'] = GSHelper.BASE_URL + href
+            try:
+                uid_param = ParseHelper.get_parameter_from_url(href, 'citation_for_view')
+                self.publication['id'] = uid_param.split(':')[-1]
+            except KeyError:
+                pass
+            self.start_capture('title')
+        elif tag == 'a' and 'gsc_a_ac' in element_classes:
+            self.start_capture('cited')
+        elif tag == 'span' and 'gsc_a_h' in element_classes:
+            self.start_capture('year')
+
+    def start_capture(self, field):
+        self.capturing = field
+        self.text = []
+
+    def handle_endtag(self, tag):
+        if self.publication is None:
+            return
+        if self.capturing is not None and tag in ('a', 'span'):
+            self.end_capture()
+        elif tag == 'tr':
+            self.publications.append(self.publication)
+            self.pending.append(self.publication)
+            self.publication = None
+
+    def end_capture(self):
+        text = u''.join(self.text)
+        if self.capturing == 'title':
+            self.publication['title'] = text
+        else:
+            try:
+                self.publication[self.capturing] = int(text)
+            except ValueError:
+                # same as AuthorPublicationsParser, no count is 0 citations.
+                self.publication[self.capturing] = 0 if self.capturing == 'cited' else ''
+        self.capturing = None
+
+    def handle_data(self, data):
+        if self.capturing is not None:
+            self.text.append(data)
+
+    def handle_entityref(self, name):
+        if self.capturing is not None and name in name2codepoint:
+            self.text.append(unichr(name2codepoint[name]))
+
+    def handle_charref(self, name):
+        if self.capturing is not None:
+            if name.lower().startswith('x'):
+                self.text.append(unichr(int(name[1:], 16)))
+            else:
+                self.text.append(unichr(int(name)))
+
+
 class AuthorPublication(ScholarObject):
-    def __init__(self, author_uid, publication_uid, author_publication_parser):
+    def __init__(self, author_uid, publication_uid, author_publication_parser, fields=None):
         self.results_dict = OrderedDict()
         self.results_dict['author_uid'] = author_uid
         self.results_dict['publication_uid'] = publication_uid
         query_url = self.get_page_url(author_uid, publication_uid)
         html = GSHelper.get_url(query_url)
-        self.author_pub_parser = author_publication_parser(html, self.results_dict)
+        self.author_pub_parser = author_publication_parser(html, self.results_dict, fields)
 
     def get_page_url(self, author_uid, publication_uid):
         url = GSHelper.BASE_URL + GSHelper.CITATIONS_URL_EXTENSION
@@ -586,21 +1287,28 @@ class AuthorPublication(ScholarObject):
 
 
 class AuthorPublicationParser(Parser):
-    def __init__(self, payload, pub_dict):
+    FIELDS = OrderedDict([
+        ('publication_url', 'parse_publication_url'),
+        ('authors', 'parse_authors'),
+        ('publication_date', 'parse_publication_date'),
+        ('journal_name', 'parse_journal_name'),
+        ('page_range', 'parse_page_range'),
+        ('publisher', 'parse_publisher'),
+        ('partial_abstract', 'parse_abstract'),
+        ('citation_count', 'parse_citation_count'),
+        ('citations_by_year', 'parse_citations_by_year'),
+        ('cluster_ids', 'parse_cluster_ids'),
+    ])
+
+    def __init__(self, payload, pub_dict, fields=None):
+        self.fields = self.select_fields(fields)
         soup = BeautifulSoup(payload, 'lxml')
         self.results = self.parse(soup, pub_dict)
 
     def parse(self, soup, pub_dict):
-        pub_dict['publication_url'] = self.parse_publication_url(soup)
-        pub_dict['authors'] = self.parse_authors(soup)
-        pub_dict['publication_date'] = self.parse_publication_date(soup)
-        pub_dict['journal_name'] = self.parse_journal_name(soup)
-        pub_dict['page_range'] = self.parse_page_range(soup)
-        pub_dict['publisher'] = self.parse_publisher(soup)
-        pub_dict['partial_abstract'] = self.parse_abstract(soup)
-        pub_dict['citation_count'] = self.parse_citation_count(soup)
-        pub_dict['citations_by_year'] = self.parse_citations_by_year(soup)
-        return pub_dict
+        # YearSeries of the citations_by_year graph.
+        self.citations_by_year = None
+        return self.parse_fields(soup, pub_dict)
 
     @ParseHelper.exception_wrapper
     def parse_publication_url(self, soup):
@@ -646,46 +1354,136 @@ class AuthorPublicationParser(Parser):
 
     @ParseHelper.exception_wrapper
     def parse_citations_by_year(self, soup):
-        citations_count = []
+        pairs = []
         graph = soup.find(id='gsc_graph_bars')
         counts = graph.find_all('a')
         for count in counts:
-            result_dict = OrderedDict()
             try:
                 href = count.get('href')
                 year = ParseHelper.get_parameter_from_url(href, 'as_yhi')
-                result_dict['year'] = int(year)
-                result_dict['count'] = int(count.text)
-                citations_count.append(result_dict)
-            except AttributeError, TypeError:
+                pairs.append((int(year), int(count.text)))
+            except (AttributeError, TypeError):
                 print "Couldn't parse publication citation by year."
                 break
-        self.fill_empty_years(citations_count)
-        return citations_count
+        # years without citations have no bar, the series fills them with 0.
+        self.citations_by_year = YearSeries.from_pairs(pairs)
+        return self.citations_by_year.to_dicts()
 
-    def fill_empty_years(self, citations_list):
-        for idx, citation in enumerate(citations_list):
-            try:
-                if citation['year'] + 1 != citations_list[idx + 1]['year']:
-                    empty_year = OrderedDict()
-                    empty_year['year'] = citation['year'] + 1
-                    empty_year['count'] = 0
-                    citations_list.insert(idx + 1, empty_year)
-            except IndexError:
-                pass
+    @ParseHelper.exception_wrapper
+    def parse_cluster_ids(self, soup):
+        """
+        Returns the GS cluster ids of every version merged into the
+        publication, from its total citations link.
+        """
+        href = soup.find('div', text='Total citations').next_sibling.div.a.get('href')
+        try:
+            cites = ParseHelper.get_parameter_from_url(href, 'cites')
+        except KeyError:
+            return []
+        return cites.split(',')
 
 if __name__ == '__main__':
+    if '--archive' in sys.argv:
+        # store every fetched page for offline re-parsing
+        # python gs.py --author 'Q0ZsJ_UAAAAJ' --archive archive_dir
+        option_idx = sys.argv.index('--archive')
+        GSHelper.set_archive(sys.argv[option_idx + 1])
+        del sys.argv[option_idx:option_idx + 2]
+
+    if '--export' in sys.argv:
+        # write parsed results to columnar tables as well as printing them
+        # python gs.py --publications 'Q0ZsJ_UAAAAJ' 0 --export export_dir
+        option_idx = sys.argv.index('--export')
+        GSHelper.set_exporter(sys.argv[option_idx + 1])
+        del sys.argv[option_idx:option_idx + 2]
+
+    if '--hedge' in sys.argv:
+        # send a duplicate request when one is slower than the p95 latency
+        # python gs.py --author 'Q0ZsJ_UAAAAJ' --hedge
+        GSHelper.fetch_policy.hedge = True
+        sys.argv.remove('--hedge')
+
+    if '--proxies' in sys.argv:
+        # spread requests over the proxies listed one per line in a file
+        # python gs.py --author 'Q0ZsJ_UAAAAJ' --proxies proxies.txt
+        option_idx = sys.argv.index('--proxies')
+        with open(sys.argv[option_idx + 1], 'r') as proxies_file:
+            proxy_urls = [line.strip() for line in proxies_file if line.strip()]
+        GSHelper.fetch_policy.egress_pool = EgressPool(proxy_urls)
+        del sys.argv[option_idx:option_idx + 2]
+
+    fetch_stats = '--fetch-stats' in sys.argv
+    if fetch_stats:
+        # print request, retry, timeout and hedge counts to stderr when done
+        # python gs.py --author 'Q0ZsJ_UAAAAJ' --fetch-stats
+        sys.argv.remove('--fetch-stats')
+
+    if '--images' in sys.argv:
+        # download author and coauthor photos, adding their local paths to the results
+        # python gs.py --coauthors 'Q0ZsJ_UAAAAJ' --images images_dir
+        option_idx = sys.argv.index('--images')
+        GSHelper.set_image_store(sys.argv[option_idx + 1])
+        del sys.argv[option_idx:option_idx + 2]
+
+    if '--history' in sys.argv:
+        # record citation counts in an append only history of changes
+        # python gs.py --all-publications 'Q0ZsJ_UAAAAJ' --history history_dir
+        option_idx = sys.argv.index('--history')
+        GSHelper.set_citation_history(sys.argv[option_idx + 1])
+        del sys.argv[option_idx:option_idx + 2]
+
+    if '--changes' in sys.argv:
+        # diff parsed results against the last crawl, appending changes to a feed
+        # python gs.py --author 'Q0ZsJ_UAAAAJ' --changes snapshot.json changes.jsonl
+        option_idx = sys.argv.index('--changes')
+        GSHelper.set_change_feed(sys.argv[option_idx + 1], sys.argv[option_idx + 2])
+        del sys.argv[option_idx:option_idx + 3]
+
+    fields = None
+    if '--fields' in sys.argv:
+        # only parse the comma separated fields, and skip publication detail
+        # pages when every field is on the publications list page
+        # python gs.py --publications 'Q0ZsJ_UAAAAJ' 0 --fields title,year,citation_count
+        option_idx = sys.argv.index('--fields')
+        fields = sys.argv[option_idx + 1].split(',')
+        del sys.argv[option_idx:option_idx + 2]
+
+    if '--index' in sys.argv:
+        # add parsed author profiles to a local index for offline search
+        # python gs.py --search 'V Guana' --index profiles.json
+        option_idx = sys.argv.index('--index')
+        GSHelper.set_profile_index(sys.argv[option_idx + 1])
+        del sys.argv[option_idx:option_idx + 2]
+
+    if sys.argv[1] == '--reparse':
+        # cli args = reparse, archive_dir
+        # python gs.py --reparse archive_dir
+        print json.dumps(GSHelper.reparse_archive(sys.argv[2]), indent=4)
+
     if sys.argv[1] == '--search':
         # cli args = search, author_name
         # python gs.py search 'V Guana'
         author_name = sys.argv[2]
         print GSHelper.search_author(author_name)
 
+    if sys.argv[1] == '--search-all':
+        # every results page, one author per line as they are found
+        # cli args = search-all, query, max_results
+        # python gs.py --search-all 'label:machine_learning' 500
+        try:
+            max_results = int(sys.argv[3])
+        except IndexError:
+            max_results = None
+        for author in AuthorSearch(sys.argv[2], AuthorQueryParser, max_results=max_results):
+            GSHelper.index_profiles([author])
+            print json.dumps(author)
+            sys.stdout.flush()
+
     if sys.argv[1] == '--author':
         # /author/search
         # cli args = author, author_uid
         # python gs.py author 'https://scholar.google.ca/citations?user=Q0ZsJ_UAAAAJ&hl=en'
-        print GSHelper.get_author(sys.argv[2])
+        print GSHelper.get_author(sys.argv[2], fields)
 
     if sys.argv[1] == '--coauthors':
         # /author/coauthors
@@ -703,7 +1501,48 @@ if __name__ == '__main__':
             page = sys.argv[3]
         except IndexError:
             page = 0
-        print GSHelper.get_publications(author_uid, page)
+        print GSHelper.get_publications(author_uid, int(page), fields)
+
+    if sys.argv[1] == '--publications-stream':
+        # /author/publications, one publication per line as the page downloads
+        # cli args = publications-stream, author_uid, page
+        # python gs.py --publications-stream 'Q0ZsJ_UAAAAJ' 0
+        author_uid = sys.argv[2]
+        try:
+            page = int(sys.argv[3])
+        except IndexError:
+            page = 0
+        for publication in GSHelper.stream_publications(author_uid, page):
+            print json.dumps(publication)
+            sys.stdout.flush()
+
+    if sys.argv[1] == '--all-publications':
+        # /author/publications, every page
+        # cli args = all-publications, author_uid, number of publications
+        # python gs.py --all-publications 'Q0ZsJ_UAAAAJ' 250
+        author_uid = sys.argv[2]
+        try:
+            num_publications = int(sys.argv[3])
+        except IndexError:
+            num_publications = None
+        print GSHelper.get_all_publications(author_uid, num_publications)
+
+    if sys.argv[1] == '--sync':
+        # /author/publications, only what is new since the last crawl
+        # cli args = sync, author_uid, known publications file, top_n
+        # python gs.py --sync 'Q0ZsJ_UAAAAJ' publications.json 20
+        # the known publications file is the output of --publications,
+        # or a json list of publication uids.
+        author_uid = sys.argv[2]
+        with open(sys.argv[3], 'r') as known_file:
+            known = json.load(known_file)
+        if isinstance(known, dict):
+            known = [publication['id'] for publication in known['publications']]
+        try:
+            top_n = int(sys.argv[4])
+        except IndexError:
+            top_n = 20
+        print GSHelper.sync_publications(author_uid, known, top_n)
 
     if sys.argv[1] == '--publication':
         # /author/publication
@@ -711,4 +1550,22 @@ if __name__ == '__main__':
         # python gs.py publication 'Q0ZsJ_UAAAAJ' 'u-x6o8ySG0sC'
         author_uid = sys.argv[2]
         publication_uid = sys.argv[3]
-        print GSHelper.get_publication(author_uid, publication_uid)
+        print GSHelper.get_publication(author_uid, publication_uid, fields)
+
+    if GSHelper.archive is not None:
+        GSHelper.archive.close()
+
+    if GSHelper.exporter is not None:
+        GSHelper.exporter.close()
+
+    if GSHelper.profile_index is not None:
+        GSHelper.profile_index.save()
+
+    if GSHelper.change_feed is not None:
+        GSHelper.change_feed.save()
+
+    if GSHelper.image_fetcher is not None:
+        GSHelper.image_fetcher.image_store.save()
+
+    if fetch_stats:
+        sys.stderr.write(json.dumps(GSHelper.fetch_policy.get_stats(), indent=4) + '\n')
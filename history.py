@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+"""
+Append-only history of citation counts for tracking growth between crawls.
+
+Instead of keeping every nightly snapshot, only changes are stored: the
+change in cited of each publication and in total_citations, h_index and
+i10_index of each author since the last crawl, as fixed width records in
+binary files. Author and publication uids are kept once in a key table and
+referred to by their index. The counts of an author or publication over
+time are read with a single sequential scan of the records.
+"""
+from collections import OrderedDict
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+
+class CitationHistory(object):
+    """
+    Citation count history kept in history_dir, recorded from Author and
+    AuthorPublications results dicts at the time of the crawl.
+    >>> citation_history = CitationHistory('history_dir')
+    >>> citation_history.add(author.get_results_dict(), timestamp=1500000000)
+    >>> citation_history.get_author_history('hNTyptAAAAAJ')[0]['total_citations']
+    72929
+    """
+    KEYS_FILE = 'keys.txt'
+    PUBLICATIONS_FILE = 'publications.bin'
+    AUTHORS_FILE = 'authors.bin'
+    AUTHOR_FIELDS = ('total_citations', 'h_index', 'i10_index')
+    PUBLICATION_DTYPE = np.dtype([('timestamp', '<i8'), ('key', '<u4'), ('cited', '<i4')])
+    AUTHOR_DTYPE = np.dtype([('timestamp', '<i8'), ('key', '<u4'), ('total_citations', '<i4'),
+                             ('h_index', '<i4'), ('i10_index', '<i4')])
+
+    def __init__(self, history_dir):
+        self.history_dir = history_dir
+        if not os.path.isdir(history_dir):
+            os.makedirs(history_dir)
+        self.keys_path = os.path.join(history_dir, self.KEYS_FILE)
+        self.publications_path = os.path.join(history_dir, self.PUBLICATIONS_FILE)
+        self.authors_path = os.path.join(history_dir, self.AUTHORS_FILE)
+        # key to its index, in the order keys were added.
+        self.keys = OrderedDict()
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'r') as keys_file:
+                for line in keys_file:
+                    self.keys[line.rstrip('\n').decode('utf-8')] = len(self.keys)
+        # the latest counts, summed from the deltas recorded so far.
+        self.publication_counts = self.sum_deltas(self.read_records(self.publications_path, self.PUBLICATION_DTYPE),
+                                                  ('cited',))
+        self.author_counts = self.sum_deltas(self.read_records(self.authors_path, self.AUTHOR_DTYPE),
+                                             self.AUTHOR_FIELDS)
+
+    @staticmethod
+    def read_records(path, dtype):
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=dtype)
+        return np.fromfile(path, dtype=dtype)
+
+    @staticmethod
+    def sum_deltas(records, fields):
+        """
+        Returns a dict of key index to the latest counts of fields.
+        """
+        if not len(records):
+            return {}
+        key_idxs = np.unique(records['key'])
+        totals = [np.bincount(records['key'], weights=records[field]).astype(np.int64) for field in fields]
+        return dict((int(key_idx), [int(total[key_idx]) for total in totals]) for key_idx in key_idxs)
+
+    def get_key_index(self, key):
+        """
+        Returns the index of key, adding it to the key table if it's new.
+        """
+        if key not in self.keys:
+            with open(self.keys_path, 'a') as keys_file:
+                keys_file.write(key.encode('utf-8') + '\n')
+            self.keys[key] = len(self.keys)
+        return self.keys[key]
+
+    @staticmethod
+    def publication_key(author_uid, publication_uid):
+        return u'{0}:{1}'.format(author_uid, publication_uid)
+
+    @staticmethod
+    def to_count(value):
+        """
+        Returns a parsed count as an int, None if it's missing.
+        """
+        if value is None or value == '':
+            return None
+        return int(value)
+
+    def append_records(self, path, dtype, rows):
+        if not rows:
+            return
+        with open(path, 'ab') as records_file:
+            records_file.write(np.array(rows, dtype=dtype).tobytes())
+
+    def add(self, results_dict, timestamp=None):
+        """
+        Records the changes in an Author or AuthorPublications results
+        dict since the last crawl, at timestamp or now. Returns the number
+        of records appended.
+        """
+        if timestamp is None:
+            timestamp = int(time.time())
+        if 'author_UID' in results_dict:
+            return self.add_author(results_dict, timestamp)
+        if 'publications' in results_dict:
+            return self.add_publications(results_dict, timestamp)
+        raise ValueError("Can't record history of results without author_UID or publications")
+
+    def add_author(self, author_dict, timestamp):
+        key_idx = self.get_key_index(author_dict['author_UID'])
+        old_counts = self.author_counts.get(key_idx)
+        new_counts = []
+        for field_idx, field in enumerate(self.AUTHOR_FIELDS):
+            count = self.to_count(author_dict.get(field))
+            # fields a projected crawl didn't parse keep their last count.
+            if count is None:
+                count = old_counts[field_idx] if old_counts is not None else 0
+            new_counts.append(count)
+        deltas = [new - old for new, old in zip(new_counts, old_counts or [0] * len(new_counts))]
+        # the first crawl of an author is always recorded, even with no citations.
+        if old_counts is not None and not any(deltas):
+            return 0
+        self.author_counts[key_idx] = new_counts
+        self.append_records(self.authors_path, self.AUTHOR_DTYPE, [tuple([timestamp, key_idx] + deltas)])
+        return 1
+
+    def add_publications(self, pubs_dict, timestamp):
+        rows = []
+        for publication in pubs_dict['publications']:
+            cited = self.to_count(publication.get('cited'))
+            if not publication.get('id') or cited is None:
+                continue
+            key_idx = self.get_key_index(self.publication_key(pubs_dict['author_uid'], publication['id']))
+            old_counts = self.publication_counts.get(key_idx)
+            if old_counts is not None and old_counts[0] == cited:
+                continue
+            rows.append((timestamp, key_idx, cited - (old_counts[0] if old_counts is not None else 0)))
+            self.publication_counts[key_idx] = [cited]
+        self.append_records(self.publications_path, self.PUBLICATION_DTYPE, rows)
+        return len(rows)
+
+    def get_history(self, path, dtype, key, fields):
+        """
+        Returns the counts of fields for key after every crawl they
+        changed in, oldest first.
+        """
+        if key not in self.keys:
+            return []
+        records = self.read_records(path, dtype)
+        records = records[records['key'] == self.keys[key]]
+        counts = [np.cumsum(records[field], dtype=np.int64) for field in fields]
+        history = []
+        for row_idx, timestamp in enumerate(records['timestamp']):
+            point = OrderedDict()
+            point['timestamp'] = int(timestamp)
+            for field, field_counts in zip(fields, counts):
+                point[field] = int(field_counts[row_idx])
+            history.append(point)
+        return history
+
+    def get_author_history(self, author_uid):
+        """
+        >>> citation_history.get_author_history('hNTyptAAAAAJ')
+        [OrderedDict([('timestamp', 1500000000), ('total_citations', 72929), ('h_index', 66), ('i10_index', 175)])]
+        """
+        return self.get_history(self.authors_path, self.AUTHOR_DTYPE, author_uid, self.AUTHOR_FIELDS)
+
+    def get_publication_history(self, author_uid, publication_uid):
+        """
+        >>> citation_history.get_publication_history('hNTyptAAAAAJ', 'u5HHmVD_uO8C')
+        [OrderedDict([('timestamp', 1500000000), ('cited', 41320)])]
+        """
+        return self.get_history(self.publications_path, self.PUBLICATION_DTYPE,
+                                self.publication_key(author_uid, publication_uid), ('cited',))
+
+    def get_stats(self):
+        stats = OrderedDict()
+        stats['keys'] = len(self.keys)
+        for name, path, dtype in (('publication_records', self.publications_path, self.PUBLICATION_DTYPE),
+                                  ('author_records', self.authors_path, self.AUTHOR_DTYPE)):
+            stats[name] = os.path.getsize(path) // dtype.itemsize if os.path.exists(path) else 0
+        return stats
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--history':
+        # cli args = history, history dir, author uid, publication uid
+        # python history.py --history history_dir 'hNTyptAAAAAJ'
+        # python history.py --history history_dir 'hNTyptAAAAAJ' 'u5HHmVD_uO8C'
+        # the history is recorded with gs.py --history history_dir.
+        citation_history = CitationHistory(sys.argv[2])
+        if len(sys.argv) > 4:
+            print json.dumps(citation_history.get_publication_history(sys.argv[3], sys.argv[4]))
+        else:
+            print json.dumps(citation_history.get_author_history(sys.argv[3]))
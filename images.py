@@ -0,0 +1,152 @@
+"""
+Concurrent download of author profile photos into a content addressed store.
+
+Photos are fetched through the FetchPolicy pages are, so they share its
+timeouts, retries, circuit breakers and egress proxies, and are stored
+under the sha1 of their bytes. The placeholder avatar most authors have is
+stored once, and urls already downloaded aren't fetched again.
+"""
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import hashlib
+import json
+import os
+import threading
+
+
+class ImageStore(object):
+    """
+    Images stored by the sha1 of their content under store_dir, with an
+    index of the url each was downloaded from.
+    >>> image_store = ImageStore('images')
+    >>> image_store.store('https://scholar.google.ca/citations/images/avatar_scholar_150.jpg', jpeg_bytes, 'image/jpeg')
+    ('images/3f/3f2a...c1.jpg', True)
+    """
+    INDEX_FILE = 'index.json'
+    EXTENSIONS = {'image/jpeg': '.jpg', 'image/png': '.png', 'image/gif': '.gif'}
+
+    def __init__(self, store_dir):
+        self.store_dir = store_dir
+        if not os.path.isdir(store_dir):
+            os.makedirs(store_dir)
+        self.index_path = os.path.join(store_dir, self.INDEX_FILE)
+        # url to path of the stored image, relative to store_dir.
+        self.urls = OrderedDict()
+        if os.path.exists(self.index_path):
+            with open(self.index_path, 'r') as index_file:
+                self.urls = json.load(index_file, object_pairs_hook=OrderedDict)
+        self.lock = threading.Lock()
+
+    def get_path(self, url):
+        """
+        Returns the local path of the image downloaded from url, or None.
+        """
+        if url not in self.urls:
+            return None
+        return os.path.join(self.store_dir, self.urls[url])
+
+    def store(self, url, content, content_type=None):
+        """
+        Stores image bytes downloaded from url, unless an image with the
+        same content is stored already. Returns (local path, whether the
+        content was new).
+        """
+        digest = hashlib.sha1(content).hexdigest()
+        extension = self.EXTENSIONS.get((content_type or '').split(';')[0].strip(), '')
+        relative_path = os.path.join(digest[:2], digest + extension)
+        path = os.path.join(self.store_dir, relative_path)
+        with self.lock:
+            is_new = not os.path.exists(path)
+            if is_new:
+                if not os.path.isdir(os.path.dirname(path)):
+                    os.makedirs(os.path.dirname(path))
+                with open(path + '.tmp', 'wb') as image_file:
+                    image_file.write(content)
+                os.rename(path + '.tmp', path)
+            self.urls[url] = relative_path
+        return path, is_new
+
+    def save(self):
+        with self.lock:
+            with open(self.index_path + '.tmp', 'w') as index_file:
+                json.dump(self.urls, index_file)
+            os.rename(self.index_path + '.tmp', self.index_path)
+
+
+class ImageFetcher(object):
+    """
+    Downloads images into an ImageStore through fetch_policy with
+    max_workers threads, skipping urls the store already has.
+    >>> image_fetcher = ImageFetcher(ImageStore('images'), GSHelper.fetch_policy)
+    >>> image_fetcher.fetch(['https://scholar.google.ca/citations?view_op=view_photo&user=hNTyptAAAAAJ&citpid=3'])
+    """
+    # result fields holding image urls, and the field their local path goes in.
+    IMAGE_FIELDS = OrderedDict([
+        ('author_image_URL', 'author_image_path'),
+        ('author_image_url', 'author_image_path'),
+    ])
+
+    def __init__(self, image_store, fetch_policy, max_workers=8):
+        self.image_store = image_store
+        self.fetch_policy = fetch_policy
+        self.max_workers = max_workers
+        self.stats = OrderedDict([('downloaded', 0), ('skipped', 0), ('duplicates', 0), ('errors', 0)])
+        self.lock = threading.Lock()
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def fetch_one(self, url):
+        try:
+            # streamed, so the fetch policy doesn't decode the image as text.
+            response = self.fetch_policy.get(url, stream=True)
+            content = response.content
+        except Exception as e:
+            print "Couldn't download image {0}: {1}".format(url, e)
+            self.count('errors')
+            return None
+        path, is_new = self.image_store.store(url, content, response.headers.get('content-type'))
+        self.count('downloaded')
+        if not is_new:
+            self.count('duplicates')
+        return path
+
+    def fetch(self, urls):
+        """
+        Downloads every url not already stored, returns an OrderedDict of
+        url to local path, None for urls which couldn't be downloaded.
+        """
+        to_fetch = []
+        for url in urls:
+            if not url:
+                continue
+            if self.image_store.get_path(url) is not None or url in to_fetch:
+                self.count('skipped')
+            else:
+                to_fetch.append(url)
+        if to_fetch:
+            pool = ThreadPool(min(self.max_workers, len(to_fetch)))
+            try:
+                pool.map(self.fetch_one, to_fetch)
+            finally:
+                pool.close()
+                pool.join()
+        return OrderedDict((url, self.image_store.get_path(url)) for url in urls if url)
+
+    def add_local_paths(self, results_dict):
+        """
+        Downloads the images of an Author or AuthorCoAuthors results dict
+        and adds their local paths next to the urls.
+        """
+        image_dicts = [results_dict] + list(results_dict.get('coauthors', []))
+        urls = [image_dict.get(field) for image_dict in image_dicts for field in self.IMAGE_FIELDS if image_dict.get(field)]
+        paths = self.fetch(urls)
+        for image_dict in image_dicts:
+            for url_field, path_field in self.IMAGE_FIELDS.items():
+                if image_dict.get(url_field):
+                    image_dict[path_field] = paths.get(image_dict[url_field])
+        return results_dict
+
+    def get_stats(self):
+        return self.stats
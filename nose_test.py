@@ -1,10 +1,100 @@
 # coding: UTF-8
 import gs
+import analytics
+import archive
+import changes
+import export
+import fetch
+import history
+import images
+import profiles
+import registry
+import resolve
+import scheduler
+import spill
+import timeseries
+import visited
+import workqueue
+import BaseHTTPServer
+import SocketServer
+import json
+import numpy
+import os
+import requests
+import shutil
+import tempfile
+import threading
+import time
 from bs4 import BeautifulSoup
 from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 from nose.tools import set_trace
 from urllib import unquote
 
+class LocalServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """
+    Local stand in for GS. Each path is served from a list of
+    (status, delay, body) responses, used in turn with the last repeated,
+    in the charset given for the path, utf-8 by default.
+    """
+    daemon_threads = True
+
+    class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+        def do_GET(self):
+            status, delay, body = self.server.next_response(self.path)
+            time.sleep(delay)
+            self.send_response(status)
+            charset = self.server.charsets.get(self.path, 'utf-8')
+            self.send_header('Content-Type', 'text/html; charset={0}'.format(charset))
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    def __init__(self):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', 0), self.Handler)
+        self.responses = {}
+        self.charsets = {}
+        self.requests = []
+        self.lock = threading.Lock()
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+
+    def url(self, path):
+        return 'http://127.0.0.1:{0}{1}'.format(self.server_address[1], path)
+
+    def next_response(self, path):
+        with self.lock:
+            self.requests.append(path)
+            responses = self.responses.get(path, [(404, 0, '')])
+            if len(responses) > 1:
+                return responses.pop(0)
+            return responses[0]
+
+
+def setup_module():
+    # GS can't be reached from the tests, don't back off between retries.
+    gs.GSHelper.fetch_policy = fetch.FetchPolicy(backoff=0)
+
+
+class FakeGetUrl(object):
+    """
+    Serves GSHelper.get_url from get_url instead of GS until restored.
+    >>> fake_get_url = FakeGetUrl(lambda url: html)
+    >>> fake_get_url.restore()
+    """
+    def __init__(self, get_url):
+        # the staticmethod itself, so restoring it doesn't make it unbound.
+        self.real_get_url = gs.GSHelper.__dict__['get_url']
+        gs.GSHelper.get_url = staticmethod(get_url)
+
+    def restore(self):
+        gs.GSHelper.get_url = self.real_get_url
+
+
 class TestAuthorQuery:
     """
     Testing for AuthorQuery.
@@ -98,6 +188,56 @@ class TestAuthorQueryParser:
         assert self.author_query_results[2]['email_domain'] == '@einstein.yu.edu'
 
 
+class TestAuthorSearch:
+    """
+    Testing for streaming author search across results pages,
+    served from test data with a next button added to every page.
+    """
+    NEXT_BUTTON = ('<button type="button" onclick="window.location=\'/citations?view_op\\x3dsearch_authors'
+                   '\\x26hl\\x3den\\x26mauthors\\x3dEinstein\\x26after_author\\x3dabc123\\x26astart\\x3d{0}\'" '
+                   'aria-label="Next" class="gs_btnPR gs_in_ib gs_btn_half gs_btn_srt"></button>')
+
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/einstein_search.html', 'r') as html_file:
+            cls.html = html_file.read()
+        cls.requested_urls = []
+        def get_url(url):
+            cls.requested_urls.append(url)
+            return cls.html.replace('</body>', cls.NEXT_BUTTON.format(len(cls.requested_urls) * 3) + '</body>')
+        cls.fake_get_url = FakeGetUrl(get_url)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fake_get_url.restore()
+
+    def setup(self):
+        del self.requested_urls[:]
+
+    def test_parse_next_page(self):
+        query_dict = OrderedDict()
+        gs.AuthorQueryParser(self.html.replace('</body>', self.NEXT_BUTTON.format(10) + '</body>'), query_dict)
+        assert query_dict['next_page'] == {'after_author': 'abc123', 'astart': '10'}
+
+    def test_last_page_has_no_next_page(self):
+        query_dict = OrderedDict()
+        gs.AuthorQueryParser(self.html, query_dict)
+        assert query_dict['next_page'] is None
+
+    def test_next_page_url(self):
+        query = gs.AuthorQuery('Einstein', gs.AuthorQueryParser, page=OrderedDict([('after_author', 'abc123'), ('astart', '10')]))
+        assert query.query_url.endswith('view_op=search_authors&after_author=abc123&astart=10')
+
+    def test_stream_stops_at_max_results(self):
+        search = gs.AuthorSearch('Einstein', gs.AuthorQueryParser, max_results=7)
+        authors = list(search)
+        assert len(authors) == 7
+        assert authors[3]['name'] == 'Albert Einstein'
+        # three pages hold the seven results, no fourth page is prefetched.
+        assert search.pages_fetched == 3
+        assert 'astart=6' in self.requested_urls[2]
+
+
 class TestAuthor:
     """
     Tests for Author class.
@@ -193,6 +333,183 @@ class TestAuthorPublications:
         assert unquote(query.get_page_url(author_uid,page_offset)) == self.test_url
 
 
+class TestAuthorAllPublications:
+    """
+    Testing for fetching every publications page, served from test data.
+    The first full_pages pages repeat the same 100 publications.
+    """
+    full_pages = 3
+
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.html = html_file.read()
+        cls.requested_starts = []
+        def get_url(url):
+            cstart = int(gs.ParseHelper.get_parameter_from_url(url, 'cstart'))
+            cls.requested_starts.append(cstart)
+            if cstart < cls.full_pages * gs.GSHelper.PUB_RESULTS_PER_PAGE:
+                return cls.html
+            return '<html></html>'
+        cls.fake_get_url = FakeGetUrl(get_url)
+        cls.pubs_result = gs.AuthorAllPublications('hNTyptAAAAAJ', gs.AuthorPublicationsParser).get_results_dict()
+        cls.probed_starts = list(cls.requested_starts)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fake_get_url.restore()
+
+    def test_probes_then_fills_gap(self):
+        assert self.probed_starts[:4] == [0, 100, 200, 400]
+        assert sorted(self.probed_starts) == [0, 100, 200, 300, 400]
+
+    def test_page_count(self):
+        assert self.pubs_result['pages'] == 3
+
+    def test_boundary_rows_deduplicated(self):
+        assert len(self.pubs_result['publications']) == 100
+        assert self.pubs_result['publications'][0]['id'] == 'u5HHmVD_uO8C'
+
+    def test_known_publication_count(self):
+        del self.requested_starts[:]
+        gs.AuthorAllPublications('hNTyptAAAAAJ', gs.AuthorPublicationsParser, num_publications=250)
+        # the last page expected came back full, so the next one is probed.
+        assert sorted(self.requested_starts) == [0, 100, 200, 300]
+
+    def test_publication_count_too_low(self):
+        del self.requested_starts[:]
+        self.__class__.full_pages = 5
+        try:
+            pubs_result = gs.AuthorAllPublications('hNTyptAAAAAJ', gs.AuthorPublicationsParser,
+                                                   num_publications=150).get_results_dict()
+        finally:
+            self.__class__.full_pages = 3
+        assert pubs_result['pages'] == 5
+        assert sorted(self.requested_starts) == [0, 100, 200, 300, 400, 500]
+
+    def test_probed_pages_fetched_once(self):
+        del self.requested_starts[:]
+        self.__class__.full_pages = 9
+        try:
+            pubs_result = gs.AuthorAllPublications('hNTyptAAAAAJ', gs.AuthorPublicationsParser).get_results_dict()
+        finally:
+            self.__class__.full_pages = 3
+        assert pubs_result['pages'] == 9
+        assert len(self.requested_starts) == len(set(self.requested_starts))
+        # pages 0 to 9, and the probes past the end at 16, 12 and 10.
+        assert len(self.requested_starts) == 13
+
+
+class TestFieldProjection:
+    """
+    Testing for parsing only requested fields, served from test data.
+    """
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.html = html_file.read()
+        with open('test_data/sutton_publication.html', 'r') as html_file:
+            cls.publication_html = html_file.read()
+        cls.requested_urls = []
+        def get_url(url):
+            cls.requested_urls.append(url)
+            if 'view_citation' in url:
+                return cls.publication_html
+            return cls.html
+        cls.fake_get_url = FakeGetUrl(get_url)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fake_get_url.restore()
+
+    def test_author_fields(self):
+        author_result = gs.AuthorParser(self.html, OrderedDict(), ['total_citations', 'h_index']).get_results()
+        assert author_result.items() == [('total_citations', '41754'), ('h_index', '55')]
+
+    def test_unknown_field(self):
+        try:
+            gs.AuthorParser(self.html, OrderedDict(), ['h_index', 'citations'])
+        except ValueError:
+            pass
+        else:
+            assert False
+
+    def test_publications_list_fields(self):
+        pubs_result = gs.AuthorPublicationsParser(self.html, OrderedDict(), ['title', 'cited']).get_results()
+        assert pubs_result['publications'][0].items() == [('title', 'Reinforcement learning: An introduction'), ('cited', 19552)]
+
+    def test_publication_detail_fields(self):
+        pub_result = gs.AuthorPublicationParser(self.publication_html, OrderedDict(), ['citation_count']).get_results()
+        full_result = gs.AuthorPublicationParser(self.publication_html, OrderedDict()).get_results()
+        assert pub_result.items() == [('citation_count', full_result['citation_count'])]
+
+    def test_list_page_fields_skip_detail_pages(self):
+        del self.requested_urls[:]
+        projection = gs.AuthorPublicationsProjection('hNTyptAAAAAJ', 0, ['year', 'title', 'citation_count'])
+        publications = projection.get_results_dict()['publications']
+        assert projection.detail_fetches == 0
+        assert len(self.requested_urls) == 1
+        assert publications[0].items() == [('year', 1998), ('title', 'Reinforcement learning: An introduction'), ('citation_count', 19552)]
+
+    def test_detail_fields_fetch_detail_pages(self):
+        del self.requested_urls[:]
+        projection = gs.AuthorPublicationsProjection('hNTyptAAAAAJ', 0, ['title', 'publisher'])
+        publications = projection.get_results_dict()['publications']
+        assert projection.detail_fetches == 100
+        assert len(self.requested_urls) == 101
+        assert list(publications[0]) == ['title', 'publisher']
+
+    def test_authors_from_detail_pages(self):
+        del self.requested_urls[:]
+        projection = gs.AuthorPublicationsProjection('hNTyptAAAAAJ', 0, ['title', 'authors'])
+        publications = projection.get_results_dict()['publications']
+        assert projection.detail_fetches == 100
+        assert publications[0]['authors'] == [u'Richard S Sutton', u'Andrew G Barto']
+
+    def test_authors_line_on_list_page(self):
+        del self.requested_urls[:]
+        projection = gs.AuthorPublicationsProjection('hNTyptAAAAAJ', 0, ['title', 'authors_line'])
+        publications = projection.get_results_dict()['publications']
+        assert projection.detail_fetches == 0
+        assert publications[0]['authors_line'] == u'RS Sutton, AG Barto'
+        assert 'authors_line' not in gs.AuthorPublicationsParser(self.html, OrderedDict()).get_results()['publications'][0]
+
+
+class TestAuthorPublicationsSync:
+    """
+    Testing for incremental publication sync, served from test data.
+    """
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.html = html_file.read()
+        cls.requested_urls = []
+        def get_url(url):
+            cls.requested_urls.append(url)
+            return cls.html
+        cls.fake_get_url = FakeGetUrl(get_url)
+        cls.pubs = gs.AuthorPublicationsParser(cls.html, OrderedDict()).get_results()['publications']
+        cls.known_uids = [pub['id'] for pub in cls.pubs[3:]]
+        cls.sync_result = gs.AuthorPublicationsSync('hNTyptAAAAAJ', cls.known_uids, gs.AuthorPublicationsParser, top_n=5).get_results_dict()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fake_get_url.restore()
+
+    def test_new_publications(self):
+        new_ids = [pub['id'] for pub in self.sync_result['new_publications']]
+        assert new_ids == [pub['id'] for pub in self.pubs[:3]]
+
+    def test_stops_at_known_publication(self):
+        assert len(self.requested_urls) == 2
+        assert 'sortby=pubdate' in self.requested_urls[0]
+
+    def test_top_cited(self):
+        assert 'pagesize=5' in self.requested_urls[1]
+        assert len(self.sync_result['top_cited']) == 5
+        assert self.sync_result['top_cited'][0]['cited'] == 19552
+
+
 class TestAuthorPublicationsParser:
     """
     Testing for Author Publications Parser
@@ -242,6 +559,76 @@ class TestAuthorPublicationsParser:
         assert self.pubs_result['publications'][99]['url'] == 'https://scholar.google.ca/citations?view_op=view_citation&hl=en&user=hNTyptAAAAAJ&pagesize=100&citation_for_view=hNTyptAAAAAJ:bnK-pcrLprsC'
 
 
+
+class TestStreamingPublicationsParser:
+    """
+    Testing for the streaming publications parser, fed in chunks.
+    """
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.html = html_file.read()
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.expected = gs.AuthorPublicationsParser(html_file, OrderedDict()).get_results()['publications']
+        cls.server = LocalServer()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def feed_chunks(self, chunk_size):
+        parser = gs.StreamingPublicationsParser()
+        per_chunk = []
+        for start in range(0, len(self.html), chunk_size):
+            per_chunk.append(parser.feed(self.html[start:start + chunk_size]))
+        per_chunk.append(parser.close())
+        return per_chunk
+
+    def test_same_as_publications_parser(self):
+        for chunk_size in (1000, 4096, len(self.html)):
+            publications = [publication for chunk in self.feed_chunks(chunk_size) for publication in chunk]
+            assert publications == self.expected
+
+    def test_characters_split_across_chunks(self):
+        for chunk_size in (1, 2, 3, 7):
+            publications = [publication for chunk in self.feed_chunks(chunk_size) for publication in chunk]
+            assert publications == self.expected
+
+    def test_rows_returned_before_close(self):
+        per_chunk = self.feed_chunks(4096)
+        assert sum(len(chunk) for chunk in per_chunk[:-1]) > 90
+
+    def test_table_marker_split_across_chunks(self):
+        parser = gs.StreamingPublicationsParser()
+        table_idx = self.html.index(gs.StreamingPublicationsParser.TABLE_MARKER) + 5
+        publications = parser.feed(self.html[:table_idx]) + parser.feed(self.html[table_idx:]) + parser.close()
+        assert publications == self.expected
+
+    def test_author_publications_stream(self):
+        self.server.responses['/stream'] = [(200, 0, self.html)]
+        author_pubs = gs.AuthorPublicationsStream('hNTyptAAAAAJ', 0)
+        author_pubs.query_url = self.server.url('/stream')
+        assert list(author_pubs) == self.expected
+        assert author_pubs.get_results_dict()['publications'] == self.expected
+
+    def test_response_charset(self):
+        html = (u'<table id="gsc_a_t"><tbody><tr class="gsc_a_tr"><td>'
+                u'<a class="gsc_a_at" href="/citations?citation_for_view=x:y">Caf\xe9</a></td></tr></tbody></table>')
+        self.server.responses['/latin1'] = [(200, 0, html.encode('latin-1'))]
+        self.server.charsets['/latin1'] = 'iso-8859-1'
+        archive_dir = tempfile.mkdtemp()
+        gs.GSHelper.archive = archive.PageArchive(archive_dir)
+        try:
+            author_pubs = gs.AuthorPublicationsStream('hNTyptAAAAAJ', 0)
+            author_pubs.query_url = self.server.url('/latin1')
+            assert [publication['title'] for publication in author_pubs] == [u'Caf\xe9']
+            assert gs.GSHelper.archive.lookup(author_pubs.query_url) == html
+        finally:
+            gs.GSHelper.archive = None
+            shutil.rmtree(archive_dir)
+
+
 class TestCoAuthors:
     """
     Testing for CoAuthor object
@@ -353,6 +740,9 @@ class TestAuthorPublicationParser:
     def test_publication_authors(self):
         assert self.pub_result['authors'] == ['Richard S Sutton', 'Andrew G Barto']
 
+    def test_publication_cluster_ids(self):
+        assert self.pub_result['cluster_ids'][:2] == ['697317316240233105', '1406142924573259529']
+
     def test_publication_date(self):
         assert self.pub_result['publication_date'] == '1998/3/1'
 
@@ -436,3 +826,1191 @@ class TestAuthorPublicationParserMissingYears:
                             {'year': 2015, 'count': 1}
                             ]
 
+
+
+class TestPageArchive:
+    """
+    Testing for PageArchive and offline re-parsing.
+    """
+    @classmethod
+    def setup_class(cls):
+        cls.archive_dir = tempfile.mkdtemp()
+        cls.author_url = 'https://scholar.google.ca/citations?user=hNTyptAAAAAJ&hl=en'
+        cls.coauthors_url = 'https://scholar.google.ca/citations?view_op=list_colleagues&hl=en&user=hNTyptAAAAAJ'
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.author_html = html_file.read().decode('utf-8')
+        with open('test_data/sutton_coauthors_page.html', 'r') as html_file:
+            cls.coauthors_html = html_file.read().decode('utf-8')
+        cls.archive = archive.PageArchive(cls.archive_dir)
+        cls.archive.store(cls.author_url, u'<html>old</html>', fetched=100.0)
+        cls.archive.store(cls.author_url, cls.author_html, fetched=200.0)
+        cls.archive.store(cls.coauthors_url, cls.coauthors_html, fetched=300.0)
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.archive_dir)
+
+    def test_lookup_newest(self):
+        assert self.archive.lookup(self.author_url) == self.author_html
+
+    def test_lookup_before(self):
+        assert self.archive.lookup(self.author_url, before=150.0) == u'<html>old</html>'
+
+    def test_lookup_missing(self):
+        assert self.archive.lookup('https://scholar.google.ca/citations?user=missing') is None
+
+    def test_entries_in_order(self):
+        fetched = [entry.fetched for entry in self.archive.entries()]
+        assert fetched == [100.0, 200.0, 300.0]
+
+    def test_new_segment_when_full(self):
+        archive_dir = tempfile.mkdtemp()
+        try:
+            small_archive = archive.PageArchive(archive_dir)
+            small_archive.SEGMENT_SIZE = 64
+            small_archive.store(self.author_url, self.author_html)
+            small_archive.store(self.coauthors_url, self.coauthors_html)
+            segments = [entry.segment for entry in small_archive.entries()]
+            assert segments == [0, 1]
+            assert small_archive.lookup(self.coauthors_url) == self.coauthors_html
+        finally:
+            shutil.rmtree(archive_dir)
+
+    def test_concurrent_stores(self):
+        archive_dir = tempfile.mkdtemp()
+        try:
+            shared_archive = archive.PageArchive(archive_dir)
+            shared_archive.SEGMENT_SIZE = 64 * 1024
+            urls = ['https://scholar.google.ca/citations?user={0}'.format(idx) for idx in range(400)]
+            pool = ThreadPool(16)
+            try:
+                pool.map(lambda url: shared_archive.store(url, u'<html>{0}</html>'.format(url)), urls)
+            finally:
+                pool.close()
+                pool.join()
+            shared_archive.close()
+            reopened = archive.PageArchive(archive_dir)
+            assert len(list(reopened.entries())) == 400
+            for url in urls:
+                assert reopened.lookup(url) == u'<html>{0}</html>'.format(url)
+        finally:
+            shutil.rmtree(archive_dir)
+
+    def test_slots_grow(self):
+        archive_dir = tempfile.mkdtemp()
+        try:
+            large_archive = archive.PageArchive(archive_dir)
+            urls = ['https://scholar.google.ca/citations?user={0}'.format(idx) for idx in range(1500)]
+            for idx, url in enumerate(urls):
+                large_archive.store(url, u'<html>{0}</html>'.format(idx), fetched=float(idx))
+                if idx == 100:
+                    assert large_archive.lookup(urls[50]) == u'<html>50</html>'
+            large_archive.store(urls[50], u'<html>new</html>', fetched=2000.0)
+            assert large_archive.lookup(urls[50]) == u'<html>new</html>'
+            assert large_archive.lookup(urls[50], before=1000.0) == u'<html>50</html>'
+            assert large_archive.lookup(urls[1499]) == u'<html>1499</html>'
+            assert len(large_archive.slots) >= 2 * 1501
+        finally:
+            shutil.rmtree(archive_dir)
+
+    def test_reparse_archive(self):
+        results = gs.GSHelper.reparse_archive(self.archive_dir, processes=2)
+        # the truncated first copy of the author page can't be parsed
+        assert len(results) == 2
+        assert results[0]['author_name'] == 'Richard S. Sutton'
+        assert results[0]['fetched'] == 200.0
+        assert len(results[1]['coauthors']) == 32
+
+
+class TestCitationMatrix:
+    """
+    Testing for batch citation metrics.
+    """
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.sutton_pubs = gs.AuthorPublicationsParser(html_file, OrderedDict()).get_results()
+        cls.sutton_pubs['author_uid'] = 'hNTyptAAAAAJ'
+        cls.small_pubs = {'author_uid': 'small', 'publications': [
+                            {'cited': 10, 'year': 2010},
+                            {'cited': 8, 'year': 2012},
+                            {'cited': 5, 'year': ''},
+                            {'cited': '', 'year': 2014},
+                            {'cited': 1, 'year': 2014}]}
+        cls.empty_pubs = {'author_uid': 'empty', 'publications': []}
+        cls.matrix = analytics.CitationMatrix([cls.sutton_pubs, cls.small_pubs, cls.empty_pubs], current_year=2015)
+
+    def test_h_index(self):
+        citations = [pub['cited'] for pub in self.sutton_pubs['publications']]
+        assert list(self.matrix.h_index()) == [analytics.ReferenceMetrics.h_index(citations), 3, 0]
+
+    def test_i10_index(self):
+        assert list(self.matrix.i10_index()) == [100, 1, 0]
+
+    def test_g_index(self):
+        citations = [pub['cited'] for pub in self.sutton_pubs['publications']]
+        assert list(self.matrix.g_index()) == [analytics.ReferenceMetrics.g_index(citations), 4, 0]
+
+    def test_m_quotient(self):
+        assert self.matrix.m_quotient()[1] == 3 / 6.0
+        assert self.matrix.m_quotient()[2] == 0.0
+
+    def test_citations_per_year(self):
+        assert self.matrix.citations_per_year()[1] == 24 / 6.0
+
+    def test_windowed_h_index(self):
+        # only the 2012 and 2014 publications are within 5 years of 2015
+        assert self.matrix.windowed_h_index(5)[1] == 1
+
+    def test_metrics(self):
+        metrics = self.matrix.metrics()
+        assert metrics[1]['author_uid'] == 'small'
+        assert metrics[1]['total_citations'] == 24
+        assert metrics[1]['i10_index_5y'] == 0
+
+
+class TestYearSeries:
+    """
+    Testing for YearSeries.
+    """
+    def test_fills_multi_year_gaps(self):
+        series = timeseries.YearSeries.from_pairs([(2010, 3), (2014, 2), (2011, 1)])
+        assert series.start_year == 2010
+        assert list(series.counts) == [3, 1, 0, 0, 2]
+
+    def test_round_trip_dicts(self):
+        year_dicts = [{'year': 2001, 'count': 4}, {'year': 2002, 'count': 0}, {'year': 2003, 'count': 7}]
+        assert timeseries.YearSeries.from_dicts(year_dicts).to_dicts() == year_dicts
+
+    def test_align(self):
+        first = timeseries.YearSeries(2000, [1, 2])
+        second = timeseries.YearSeries(2002, [5])
+        start_year, matrix = timeseries.YearSeries.align([first, second])
+        assert start_year == 2000
+        assert matrix.tolist() == [[1, 2, 0], [0, 0, 5]]
+
+    def test_align_clipped(self):
+        series = timeseries.YearSeries(2000, [1, 2, 3, 4])
+        start_year, matrix = timeseries.YearSeries.align([series], start_year=2001, end_year=2002)
+        assert matrix.tolist() == [[2, 3]]
+
+    def test_total(self):
+        total = timeseries.YearSeries.total([timeseries.YearSeries(2000, [1, 2]), timeseries.YearSeries(2001, [3, 4])])
+        assert total == timeseries.YearSeries(2000, [1, 5, 4])
+
+    def test_subtract_and_diff(self):
+        newer = timeseries.YearSeries(2000, [3, 5])
+        older = timeseries.YearSeries(2000, [3, 4])
+        assert newer - older == timeseries.YearSeries(2000, [0, 1])
+        assert newer.diff() == timeseries.YearSeries(2001, [2])
+
+    def test_parsers_keep_series(self):
+        with open('test_data/sutton_publication.html', 'r') as html_file:
+            parser = gs.AuthorPublicationParser(html_file, OrderedDict())
+        assert parser.citations_by_year.start_year == 1998
+        assert parser.citations_by_year.get(2015) == 167
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            parser = gs.AuthorParser(html_file, OrderedDict())
+        assert parser.publications_by_year.end_year == 2015
+
+
+class TestCrawlExporter:
+    """
+    Testing for columnar export of crawl results.
+    """
+    @classmethod
+    def setup_class(cls):
+        cls.export_dir = tempfile.mkdtemp()
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            html = html_file.read()
+        cls.author_dict = gs.AuthorParser(html, OrderedDict()).get_results()
+        cls.pubs_dict = OrderedDict([('author_uid', 'hNTyptAAAAAJ')])
+        gs.AuthorPublicationsParser(html, cls.pubs_dict)
+        with open('test_data/sutton_coauthors_page.html', 'r') as html_file:
+            cls.coauthors_dict = OrderedDict([('author_uid', 'hNTyptAAAAAJ')])
+            gs.AuthorCoAuthorsParser(html_file, cls.coauthors_dict)
+        exporter = export.CrawlExporter(cls.export_dir, chunk_size=30)
+        exporter.add_author(cls.author_dict)
+        exporter.add_publications(cls.pubs_dict)
+        exporter.add_coauthors(cls.coauthors_dict)
+        exporter.close()
+
+    @classmethod
+    def teardown_class(cls):
+        shutil.rmtree(cls.export_dir)
+
+    def table(self, name):
+        return export.ColumnarTable(os.path.join(self.export_dir, name))
+
+    def test_author_row(self):
+        authors = self.table('authors')
+        assert len(authors) == 1
+        assert authors['author_uid'][0] == 'hNTyptAAAAAJ'
+        assert authors['total_citations'][0] == 41754
+        assert authors['research_interests'][0].split('\t')[1] == 'reinforcement learning'
+
+    def test_publication_columns(self):
+        publications = self.table('publications')
+        assert len(publications) == 100
+        assert publications['cited'][0] == 19552
+        assert publications['year'][99] == 2012
+        assert publications['title'][99] == 'Tuning-free step-size adaptation'
+        assert publications['publication_uid'].to_list()[0] == 'u5HHmVD_uO8C'
+
+    def test_columns_are_memory_mapped(self):
+        assert isinstance(self.table('publications')['cited'], numpy.memmap)
+
+    def test_coauthor_edges(self):
+        edges = self.table('coauthor_edges')
+        assert len(edges) == 32
+        assert edges['coauthor_uid'][1] == 'q92q8SMAAAAJ'
+        assert edges['coauthor_citation_count'][1] == 17853
+
+    def test_append_to_existing_export(self):
+        export_dir = tempfile.mkdtemp()
+        try:
+            for run in range(2):
+                exporter = export.CrawlExporter(export_dir)
+                exporter.add_coauthors(self.coauthors_dict)
+                exporter.close()
+            edges = export.ColumnarTable(os.path.join(export_dir, 'coauthor_edges'))
+            assert len(edges) == 64
+            assert edges['coauthor_name'][32] == 'Doina Precup'
+            assert edges['coauthor_name'][-1] == self.coauthors_dict['coauthors'][-1]['name']
+        finally:
+            shutil.rmtree(export_dir)
+
+    def test_append_after_interrupted_flush(self):
+        export_dir = tempfile.mkdtemp()
+        try:
+            exporter = export.CrawlExporter(export_dir)
+            exporter.add_coauthors(self.coauthors_dict)
+            exporter.close()
+            # columns written by a flush which crashed before meta.json.
+            table_dir = os.path.join(export_dir, 'coauthor_edges')
+            for file_name in ('coauthor_citation_count.bin', 'coauthor_uid.data', 'coauthor_uid.offsets'):
+                with open(os.path.join(table_dir, file_name), 'ab') as column_file:
+                    column_file.write('\x01' * 24)
+            exporter = export.CrawlExporter(export_dir)
+            exporter.add_coauthors(self.coauthors_dict)
+            exporter.close()
+            edges = export.ColumnarTable(table_dir)
+            assert len(edges) == 64
+            assert edges['coauthor_uid'][33] == 'q92q8SMAAAAJ'
+            assert edges['coauthor_citation_count'][33] == 17853
+        finally:
+            shutil.rmtree(export_dir)
+
+
+class TestBatchResolver:
+    """
+    Testing for batch name to uid resolution, searches served from test data.
+    """
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/einstein_search.html', 'r') as html_file:
+            cls.html = html_file.read()
+        cls.fake_get_url = FakeGetUrl(lambda url: cls.html)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fake_get_url.restore()
+
+    def test_normalize(self):
+        assert resolve.NameHelper.normalize(u'Jos\xe9 A. Mart\xednez') == ['jose', 'a', 'martinez']
+
+    def test_initial_matches_given_name(self):
+        assert resolve.NameHelper.name_similarity('A. Einstein', 'Albert Einstein') == 0.9
+        assert resolve.NameHelper.name_similarity('Albert Einstein', 'James Storey') == 0.0
+
+    def test_duplicates_searched_once(self):
+        resolver = resolve.BatchResolver(resolve.AuthorIndex())
+        results = resolver.resolve([('Albert Einstein', 'Princeton'),
+                                    ('albert  einstein', 'princeton'),
+                                    ('A. Einstein', 'Princeton')])
+        assert resolver.searches == 1
+        assert [result['uid'] for result in results] == ['qc6CJjYAAAAJ'] * 3
+        assert results[0]['confidence'] == 1.0
+        assert [result['source'] for result in results] == ['search', 'search', 'index']
+
+    def test_near_duplicates_searched_once(self):
+        resolver = resolve.BatchResolver(resolve.AuthorIndex())
+        results = resolver.resolve([('Albert Einstein', 'Princeton'), ('A Einstein', 'Princeton'),
+                                    ('Albert Einstien', 'Princeton'), ('Einstein A', 'Princeton')])
+        assert resolver.searches == 1
+        assert [result['uid'] for result in results] == ['qc6CJjYAAAAJ'] * 4
+        assert [result['source'] for result in results] == ['search', 'index', 'index', 'index']
+
+    def test_repeat_names_resolved_offline(self):
+        resolver = resolve.BatchResolver(resolve.AuthorIndex())
+        resolver.resolve([('Deniz Temel', 'einstein.yu.edu')])
+        results = resolver.resolve([('Deniz B. Temel', 'Albert Einstein College of Medicine'), ('D Temel', None)])
+        assert resolver.searches == 1
+        assert [result['uid'] for result in results] == ['H5JpaNUAAAAJ'] * 2
+        assert [result['source'] for result in results] == ['index', 'index']
+
+    def test_index_persists(self):
+        index_dir = tempfile.mkdtemp()
+        try:
+            index_path = os.path.join(index_dir, 'author_index.json')
+            resolver = resolve.BatchResolver(resolve.AuthorIndex(index_path))
+            resolver.resolve([('James Storey', None)])
+            resolver.author_index.save()
+            author_index = resolve.AuthorIndex(index_path)
+            assert len(author_index) == 3
+            assert author_index.lookup('James Storey')[0]['uid'] == 'b3I0YM8AAAAJ'
+        finally:
+            shutil.rmtree(index_dir)
+
+    def test_misspelled_last_name(self):
+        author_index = resolve.AuthorIndex()
+        author_index.add(gs.AuthorQueryParser(self.html, OrderedDict()).get_results())
+        hit, confidence = author_index.lookup('Albert Einstien', 'Princeton')
+        assert hit['uid'] == 'qc6CJjYAAAAJ'
+        assert confidence > 0.8
+        # a typo in the first letter changes the block, so hits with the same initial are scored.
+        assert author_index.lookup('Albert Ainstein', 'Princeton')[0]['uid'] == 'qc6CJjYAAAAJ'
+        assert author_index.lookup('Zachary Ainstein', 'Princeton') == (None, 0.0)
+
+    def test_failed_search_left_unresolved(self):
+        def get_url(url):
+            if 'Storey' in url:
+                raise IOError('connection reset')
+            return self.html
+        fake_get_url = FakeGetUrl(get_url)
+        try:
+            resolver = resolve.BatchResolver(resolve.AuthorIndex())
+            results = resolver.resolve([('James Storey', None), ('Albert Einstein', 'Princeton')])
+        finally:
+            fake_get_url.restore()
+        assert results[0]['uid'] is None
+        assert results[0]['source'] == 'error'
+        assert results[1]['uid'] == 'qc6CJjYAAAAJ'
+
+
+class TestProfileIndex:
+    """
+    Testing for the offline profile index.
+    """
+    @classmethod
+    def setup_class(cls):
+        cls.profile_index = profiles.ProfileIndex()
+        with open('test_data/einstein_search.html', 'r') as html_file:
+            cls.profile_index.add_all(gs.AuthorQueryParser(html_file, OrderedDict()).get_results())
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.profile_index.add(gs.AuthorParser(html_file, OrderedDict()).get_results())
+        with open('test_data/sutton_coauthors_page.html', 'r') as html_file:
+            cls.coauthors = gs.AuthorCoAuthorsParser(html_file, OrderedDict()).get_results()['coauthors']
+        cls.profile_index.add_all(cls.coauthors)
+
+    def test_label_and(self):
+        assert self.profile_index.search(labels_all=['Physics', 'biochemistry']) == ['H5JpaNUAAAAJ']
+
+    def test_label_or(self):
+        uids = self.profile_index.search(labels_any=['physics', 'reinforcement learning'])
+        assert uids == sorted(['qc6CJjYAAAAJ', 'b3I0YM8AAAAJ', 'H5JpaNUAAAAJ', 'hNTyptAAAAAJ'])
+
+    def test_domain_suffix(self):
+        assert self.profile_index.search(domains=['mcgill.ca']) == ['j54VcVEAAAAJ']
+        assert 'b3I0YM8AAAAJ' in self.profile_index.search(domains=['unibe.ch'])
+
+    def test_query_string(self):
+        uids = self.profile_index.query('label:physics domain:einstein.yu.edu OR label:machine_learning alberta')
+        assert uids == ['H5JpaNUAAAAJ', 'hNTyptAAAAAJ']
+
+    def test_missing_term(self):
+        assert self.profile_index.search(labels_all=['physics', 'no_such_label']) == []
+
+    def test_incremental_update(self):
+        profile_index = profiles.ProfileIndex()
+        profile_index.add({'uid': 'x', 'research_areas': ['Physics'], 'email_domain': '@princeton.edu'})
+        profile_index.add({'uid': 'x', 'research_areas': ['Chemistry'], 'email_domain': ''})
+        assert profile_index.search(labels_all=['physics']) == []
+        assert profile_index.search(labels_all=['chemistry'], domains=['princeton.edu']) == ['x']
+        profile_index.remove('x')
+        assert profile_index.search(labels_all=['chemistry']) == []
+        assert len(profile_index) == 0
+
+    def test_coauthor_entry_keeps_labels(self):
+        self.profile_index.add({'author_uid': 'hNTyptAAAAAJ', 'domain': '@ualberta.ca'})
+        assert self.profile_index.search(labels_all=['psychology'], domains=['ualberta.ca']) == ['hNTyptAAAAAJ']
+
+
+class TestFetchPolicy:
+    """
+    Testing for retries, timeouts, circuit breakers and hedging
+    against a local server.
+    """
+    @classmethod
+    def setup_class(cls):
+        cls.server = LocalServer()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_retries_transient_status(self):
+        self.server.responses['/retry'] = [(503, 0, ''), (500, 0, ''), (200, 0, 'ok')]
+        policy = fetch.FetchPolicy(backoff=0.01)
+        assert policy.get(self.server.url('/retry')).text == 'ok'
+        stats = policy.get_stats()
+        assert stats['retries'] == 2
+        assert stats['transient_statuses'] == 2
+        assert stats['successes'] == 1
+
+    def test_no_retry_on_client_error(self):
+        self.server.responses['/missing'] = [(404, 0, '')]
+        policy = fetch.FetchPolicy(backoff=0.01)
+        try:
+            policy.get(self.server.url('/missing'))
+        except requests.HTTPError:
+            pass
+        else:
+            assert False
+        assert policy.get_stats()['requests'] == 1
+
+    def test_read_timeout_retried(self):
+        self.server.responses['/slow'] = [(200, 1.0, 'slow'), (200, 0, 'fast')]
+        policy = fetch.FetchPolicy(read_timeout=0.2, backoff=0.01)
+        assert policy.get(self.server.url('/slow')).text == 'fast'
+        assert policy.get_stats()['timeouts'] == 1
+
+    def test_circuit_opens(self):
+        self.server.responses['/citations?view_op=down'] = [(503, 0, '')]
+        self.server.responses['/citations?view_op=up'] = [(200, 0, 'up')]
+        policy = fetch.FetchPolicy(max_retries=1, backoff=0.01, failure_threshold=2, reset_timeout=60)
+        try:
+            policy.get(self.server.url('/citations?view_op=down'))
+        except fetch.TransientHTTPError:
+            pass
+        try:
+            policy.get(self.server.url('/citations?view_op=down'))
+        except fetch.CircuitOpenError:
+            pass
+        else:
+            assert False
+        assert policy.get_stats()['circuit_rejections'] == 1
+        # other endpoints have their own breaker.
+        assert policy.get(self.server.url('/citations?view_op=up')).text == 'up'
+
+    def test_circuit_half_open_after_reset(self):
+        breaker = fetch.CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+        breaker.record_failure()
+        assert not breaker.allow()
+        time.sleep(0.1)
+        assert breaker.allow()
+        assert not breaker.allow()
+        breaker.record_success()
+        assert breaker.allow()
+
+    def test_hedged_request_wins(self):
+        self.server.responses['/hedge'] = [(200, 1.0, 'slow'), (200, 0, 'fast')]
+        policy = fetch.FetchPolicy(hedge=True, hedge_delay=0.1)
+        start = time.time()
+        assert policy.get(self.server.url('/hedge')).text == 'fast'
+        assert time.time() - start < 0.9
+        stats = policy.get_stats()
+        assert stats['hedges_sent'] == 1
+        assert stats['hedges_won'] == 1
+
+    def test_losing_hedge_closed(self):
+        closed = threading.Event()
+        class FakeResponse(object):
+            def __init__(self, text):
+                self.text = text
+            def close(self):
+                if self.text == 'slow':
+                    closed.set()
+        calls = []
+        def fetch_once(url, **kwargs):
+            calls.append(url)
+            if len(calls) == 1:
+                time.sleep(0.5)
+                return FakeResponse('slow')
+            return FakeResponse('fast')
+        policy = fetch.FetchPolicy(hedge=True, hedge_delay=0.1)
+        policy.fetch_once = fetch_once
+        assert policy.fetch_hedged(self.server.url('/hedge')).text == 'fast'
+        assert closed.wait(5)
+
+    def test_get_url_uses_policy(self):
+        self.server.responses['/page'] = [(502, 0, ''), (200, 0, '<html></html>')]
+        policy = gs.GSHelper.fetch_policy
+        gs.GSHelper.fetch_policy = fetch.FetchPolicy(backoff=0.01)
+        try:
+            assert gs.GSHelper.get_url(self.server.url('/page')) == '<html></html>'
+            assert gs.GSHelper.fetch_policy.get_stats()['retries'] == 1
+        finally:
+            gs.GSHelper.fetch_policy = policy
+
+
+class TestEgressPool:
+    """
+    Testing for spreading requests over egress proxies, with local
+    servers standing in for the proxies.
+    """
+    @classmethod
+    def setup_class(cls):
+        cls.proxies = [LocalServer() for idx in range(3)]
+        cls.captcha_page = '<html><form id="gs_captcha_f"></form></html>'
+
+    @classmethod
+    def teardown_class(cls):
+        for proxy in cls.proxies:
+            proxy.shutdown()
+            proxy.server_close()
+
+    def setup(self):
+        for proxy in self.proxies:
+            proxy.responses.clear()
+            del proxy.requests[:]
+
+    def proxy_urls(self):
+        return [proxy.url('') for proxy in self.proxies]
+
+    def serve(self, path, responses):
+        for proxy, response in zip(self.proxies, responses):
+            proxy.responses[path] = [response]
+
+    def test_requests_spread_over_egresses(self):
+        url = 'http://scholar.invalid/citations?view_op=list_colleagues'
+        self.serve(url, [(200, 0, 'ok')] * 3)
+        pool = fetch.EgressPool(self.proxy_urls(), rate=1000, burst=1)
+        policy = fetch.FetchPolicy(egress_pool=pool)
+        for idx in range(9):
+            assert policy.get(url).text == 'ok'
+        assert all(proxy.requests for proxy in self.proxies)
+        assert sum(egress['requests'] for egress in policy.get_stats()['egresses']) == 9
+
+    def test_rate_budget(self):
+        pool = fetch.EgressPool([None, None], rate=20, burst=1)
+        start = time.time()
+        for idx in range(6):
+            pool.acquire()
+        # two egresses at 20 requests a second, after the two initial tokens
+        assert time.time() - start >= 0.08
+
+    def test_captcha_quarantines_egress(self):
+        url = 'http://scholar.invalid/citations?view_op=search_authors'
+        self.serve(url, [(200, 0, self.captcha_page), (200, 0, 'ok'), (200, 0, 'ok')])
+        pool = fetch.EgressPool(self.proxy_urls(), rate=1000, burst=10)
+        # the captcha serving egress looks healthiest until it is used.
+        pool.egresses[1].latency = pool.egresses[2].latency = 1.0
+        policy = fetch.FetchPolicy(egress_pool=pool, backoff=0.01)
+        for idx in range(4):
+            assert policy.get(url).text == 'ok'
+        assert len(self.proxies[0].requests) == 1
+        stats = policy.get_stats()
+        assert stats['captchas'] == 1
+        assert stats['egresses'][0]['quarantined']
+
+    def test_captcha_leaves_circuit_closed(self):
+        url = 'http://scholar.invalid/citations?view_op=search_authors'
+        self.serve(url, [(200, 0, self.captcha_page), (200, 0, 'ok'), (200, 0, 'ok')])
+        pool = fetch.EgressPool(self.proxy_urls(), rate=1000, burst=10)
+        pool.egresses[1].latency = pool.egresses[2].latency = 1.0
+        policy = fetch.FetchPolicy(egress_pool=pool, backoff=0, failure_threshold=1)
+        for idx in range(4):
+            assert policy.get(url).text == 'ok'
+        assert policy.get_stats()['circuit_rejections'] == 0
+
+    def test_no_proxies(self):
+        try:
+            fetch.EgressPool(['', '  \n'])
+        except ValueError:
+            pass
+        else:
+            assert False
+        assert len(fetch.EgressPool([' http://10.0.0.1:3128\n', '']).egresses) == 1
+
+    def test_quarantine_recovery(self):
+        egress = fetch.Egress(None, quarantine_time=0.05)
+        egress.record_failure(captcha=True)
+        assert egress.is_quarantined(time.time())
+        time.sleep(0.1)
+        assert egress.wait_time(time.time()) == 0
+        # on probation, the next failure quarantines it for twice as long
+        egress.record_failure()
+        assert egress.quarantined_until - time.time() > 0.05
+
+    def test_sticky_assignment(self):
+        url = 'http://scholar.invalid/citations?user=hNTyptAAAAAJ&hl=en'
+        self.serve(url, [(200, 0, 'ok')] * 3)
+        pool = fetch.EgressPool(self.proxy_urls(), rate=1000, burst=10)
+        policy = fetch.FetchPolicy(egress_pool=pool)
+        for idx in range(5):
+            policy.get(url)
+        assert sorted(len(proxy.requests) for proxy in self.proxies) == [0, 0, 5]
+
+
+class TestChangeFeed:
+    """
+    Testing for diffing crawls, starting from the test data snapshot.
+    """
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.snapshot_path = os.path.join(self.temp_dir, 'snapshot.json')
+        self.feed_path = os.path.join(self.temp_dir, 'changes.jsonl')
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            html = html_file.read()
+        self.author = gs.AuthorParser(html, OrderedDict()).get_results()
+        self.pubs = gs.AuthorPublicationsParser(html, OrderedDict([('author_uid', 'hNTyptAAAAAJ'), ('page', 0)])).get_results()
+        with open('test_data/sutton_coauthors_page.html', 'r') as html_file:
+            self.coauthors = gs.AuthorCoAuthorsParser(html_file, OrderedDict([('author_uid', 'hNTyptAAAAAJ')])).get_results()
+        change_feed = changes.ChangeFeed(self.snapshot_path, self.feed_path)
+        for results_dict in (self.author, self.pubs, self.coauthors):
+            change_feed.add(results_dict)
+        change_feed.save()
+        self.change_feed = changes.ChangeFeed(self.snapshot_path, self.feed_path)
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_first_crawl_is_all_new(self):
+        with open(self.feed_path, 'r') as feed_file:
+            feed = [json.loads(line) for line in feed_file]
+        change_types = [change['type'] for change in feed]
+        assert change_types.count('author_added') == 1
+        assert change_types.count('publication_added') == 100
+        assert change_types.count('coauthor_added') == len(self.coauthors['coauthors'])
+
+    def test_unchanged_crawl_has_no_changes(self):
+        for results_dict in (self.author, self.pubs, self.coauthors):
+            assert self.change_feed.add(results_dict) == []
+
+    def test_citation_delta(self):
+        self.pubs['publications'][0]['cited'] += 7
+        feed = self.change_feed.add(self.pubs)
+        assert len(feed) == 1
+        assert feed[0]['type'] == 'citations_changed'
+        assert feed[0]['publication_uid'] == 'u5HHmVD_uO8C'
+        assert feed[0]['delta'] == 7
+
+    def test_profile_field_change(self):
+        self.author['h_index'] = '56'
+        feed = self.change_feed.add(self.author)
+        assert [(change['field'], change['old'], change['new']) for change in feed] == [('h_index', '55', '56')]
+
+    def test_projected_author_crawl(self):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            html = html_file.read().replace('>55<', '>56<', 1)
+        fake_get_url = FakeGetUrl(lambda url: html)
+        gs.GSHelper.change_feed = self.change_feed
+        try:
+            author = json.loads(gs.GSHelper.get_author('hNTyptAAAAAJ', ['h_index']))
+        finally:
+            gs.GSHelper.change_feed = None
+            fake_get_url.restore()
+        assert author.keys() == ['author_UID', 'h_index']
+        with open(self.feed_path, 'r') as feed_file:
+            change = json.loads(feed_file.readlines()[-1])
+        assert (change['type'], change['field'], change['old'], change['new']) == ('author_changed', 'h_index', '55', '56')
+
+    def test_coauthor_added_and_removed(self):
+        removed = self.coauthors['coauthors'].pop(0)
+        self.coauthors['coauthors'].append(OrderedDict([('author_uid', 'newAAAAAAAAJ'), ('name', 'New Coauthor')]))
+        feed = self.change_feed.add(self.coauthors)
+        assert [(change['type'], change['coauthor_uid']) for change in feed] == [
+            ('coauthor_added', 'newAAAAAAAAJ'), ('coauthor_removed', removed['author_uid'])]
+
+    def test_removals_only_from_every_page(self):
+        del self.pubs['publications'][:10]
+        assert self.change_feed.add(self.pubs) == []
+        self.pubs['pages'] = 1
+        feed = self.change_feed.add(self.pubs)
+        assert len(feed) == 10
+        assert all(change['type'] == 'publication_removed' for change in feed)
+
+
+class TestWorkQueue:
+    """
+    Testing for leased crawl tasks in a SQLite queue.
+    """
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.temp_dir, 'crawl.db')
+        self.work_queue = workqueue.SQLiteQueue(self.db_path, lease_seconds=60, max_attempts=2)
+
+    def teardown(self):
+        self.work_queue.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_put_ignores_duplicates(self):
+        assert self.work_queue.put('author', {'author_uid': 'x'})
+        assert not self.work_queue.put('author', {'author_uid': 'x'})
+        assert self.work_queue.get_counts()['pending'] == 1
+
+    def test_claim_and_complete(self):
+        self.work_queue.put('author', {'author_uid': 'x'})
+        task = self.work_queue.claim('a')
+        assert task['args'] == {'author_uid': 'x'}
+        assert self.work_queue.claim('b') is None
+        assert self.work_queue.complete(task['id'], 'a', {'author_UID': 'x'})
+        assert not self.work_queue.complete(task['id'], 'a', {'author_UID': 'x'})
+        assert list(self.work_queue.results()) == [('author', {'author_uid': 'x'}, {'author_UID': 'x'})]
+
+    def test_expired_lease_claimed_again(self):
+        self.work_queue.lease_seconds = 0
+        self.work_queue.put('author', {'author_uid': 'x'})
+        first = self.work_queue.claim('a')
+        time.sleep(0.01)
+        second = self.work_queue.claim('b')
+        assert second['id'] == first['id']
+        assert second['attempts'] == 2
+        assert self.work_queue.complete(second['id'], 'b', {'worker': 'b'})
+        # the late first worker doesn't overwrite the result.
+        assert not self.work_queue.complete(first['id'], 'a', {'worker': 'a'})
+        assert list(self.work_queue.results())[0][2] == {'worker': 'b'}
+
+    def test_failed_after_max_attempts(self):
+        self.work_queue.put('author', {'author_uid': 'x'})
+        self.work_queue.fail(self.work_queue.claim('a')['id'], 'a', 'error')
+        assert self.work_queue.get_counts()['pending'] == 1
+        self.work_queue.fail(self.work_queue.claim('a')['id'], 'a', 'error')
+        assert self.work_queue.get_counts()['failed'] == 1
+        assert self.work_queue.claim('a') is None
+
+    def test_same_author_at_two_depths(self):
+        assert self.work_queue.put('author', OrderedDict([('author_uid', 'x'), ('depth', 2), ('max_depth', 2)]))
+        assert not self.work_queue.put('author', OrderedDict([('author_uid', 'x'), ('depth', 1), ('max_depth', 2)]))
+        assert self.work_queue.get_counts()['pending'] == 1
+        task = self.work_queue.claim('a')
+        assert task['args']['depth'] == 1
+        self.work_queue.complete(task['id'], 'a', {})
+        assert not self.work_queue.put('author', OrderedDict([('author_uid', 'x'), ('depth', 0), ('max_depth', 2)]))
+        assert self.work_queue.get_counts()['pending'] == 0
+
+    def test_concurrent_claims_unique(self):
+        for idx in range(200):
+            self.work_queue.put('publication', {'publication_uid': str(idx)})
+        claimed = []
+        def claim_all():
+            work_queue = workqueue.open_queue('sqlite://' + self.db_path)
+            while True:
+                task = work_queue.claim(threading.current_thread().name)
+                if task is None:
+                    break
+                claimed.append(task['id'])
+            work_queue.close()
+        threads = [threading.Thread(target=claim_all) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(claimed) == range(1, 201)
+
+
+class TestCrawlWorker:
+    """
+    Testing for crawling queued tasks, served from test data.
+    """
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.html = html_file.read()
+        with open('test_data/sutton_coauthors_page.html', 'r') as html_file:
+            cls.coauthors_html = html_file.read()
+        def get_url(url):
+            if 'list_colleagues' in url:
+                return cls.coauthors_html
+            if 'cstart' in url and gs.ParseHelper.get_parameter_from_url(url, 'cstart') != '0':
+                return '<html></html>'
+            return cls.html
+        cls.fake_get_url = FakeGetUrl(get_url)
+        cls.temp_dir = tempfile.mkdtemp()
+        cls.work_queue = workqueue.SQLiteQueue(os.path.join(cls.temp_dir, 'crawl.db'))
+        workqueue.seed_authors(cls.work_queue, ['hNTyptAAAAAJ'])
+        cls.done = workqueue.CrawlWorker(cls.work_queue, 'worker').run()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fake_get_url.restore()
+        cls.work_queue.close()
+        shutil.rmtree(cls.temp_dir)
+
+    def test_follow_up_tasks(self):
+        kinds = [kind for kind, args, result in self.work_queue.results()]
+        assert kinds == ['author', 'publications', 'coauthors', 'publications']
+        assert self.done == 4
+
+    def test_results_written_back(self):
+        author = list(self.work_queue.results('author'))[0][2]
+        assert author['author_UID'] == 'hNTyptAAAAAJ'
+        pubs = list(self.work_queue.results('publications'))[0][2]
+        assert len(pubs['publications']) == 100
+
+    def test_coauthors_not_followed_past_max_depth(self):
+        assert self.work_queue.get_counts()['pending'] == 0
+
+    def test_authors_reached_twice_crawled_once(self):
+        # two coauthors, each listing both as coauthors, so they are
+        # reached at depth 1 from the seed and again at depth 2.
+        soup = BeautifulSoup(self.coauthors_html, 'lxml')
+        for coauthor_div in soup.find(id='gsc_ccl').find_all(class_='gs_scl')[2:]:
+            coauthor_div.decompose()
+        coauthors_html = str(soup)
+        def get_url(url):
+            if 'list_colleagues' in url:
+                return coauthors_html
+            if 'cstart' in url and gs.ParseHelper.get_parameter_from_url(url, 'cstart') != '0':
+                return '<html></html>'
+            return self.html
+        fake_get_url = FakeGetUrl(get_url)
+        work_queue = workqueue.SQLiteQueue(os.path.join(self.temp_dir, 'depths.db'))
+        try:
+            workqueue.seed_authors(work_queue, ['hNTyptAAAAAJ'], max_depth=2)
+            workqueue.CrawlWorker(work_queue, 'worker').run()
+            crawled = [args['author_uid'] for kind, args, result in work_queue.results('author')]
+            assert len(crawled) == 3
+            assert len(set(crawled)) == 3
+        finally:
+            fake_get_url.restore()
+            work_queue.close()
+
+
+class TestPriorityCrawl:
+    """
+    Testing for the priority ordered crawl, served from test data.
+    Every coauthors page is Suttons, so every author has the same coauthors.
+    """
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.html = html_file.read()
+        with open('test_data/sutton_coauthors_page.html', 'r') as html_file:
+            cls.coauthors_html = html_file.read()
+        cls.coauthors = gs.AuthorCoAuthorsParser(cls.coauthors_html, OrderedDict()).get_results()['coauthors']
+        cls.requested_urls = []
+        def get_url(url):
+            cls.requested_urls.append(url)
+            if 'list_colleagues' in url:
+                return cls.coauthors_html
+            if 'cstart' in url and gs.ParseHelper.get_parameter_from_url(url, 'cstart') != '0':
+                return '<html></html>'
+            return cls.html
+        cls.fake_get_url = FakeGetUrl(get_url)
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fake_get_url.restore()
+
+    def requested_authors(self):
+        return [gs.ParseHelper.get_parameter_from_url(url, 'user') for url in self.requested_urls
+                if 'cstart' not in url and 'view_op' not in url]
+
+    def test_scheduler_order(self):
+        crawl_scheduler = scheduler.CrawlScheduler()
+        crawl_scheduler.push(1.0, 'author', 'a')
+        crawl_scheduler.push(3.0, 'author', 'b')
+        crawl_scheduler.push(1.0, 'author', 'c')
+        assert [crawl_scheduler.pop()[2] for _ in range(3)] == ['b', 'a', 'c']
+
+    def test_page_budget(self):
+        del self.requested_urls[:]
+        crawl = scheduler.PriorityCrawl(['hNTyptAAAAAJ'], page_budget=10, max_depth=1)
+        assert crawl.get_results_dict()['pages_fetched'] == 10
+        assert len(self.requested_urls) == 10
+
+    def test_most_cited_coauthors_first(self):
+        del self.requested_urls[:]
+        scheduler.PriorityCrawl(['hNTyptAAAAAJ'], page_budget=12, max_depth=1)
+        by_citations = sorted(self.coauthors, key=lambda coauthor: coauthor['citation_count'], reverse=True)
+        assert self.requested_authors()[0] == 'hNTyptAAAAAJ'
+        assert self.requested_authors()[1:4] == [coauthor['author_uid'] for coauthor in by_citations[:3]]
+
+    def test_recently_crawled_authors_last(self):
+        del self.requested_urls[:]
+        most_cited = max(self.coauthors, key=lambda coauthor: coauthor['citation_count'])['author_uid']
+        scheduler.PriorityCrawl(['hNTyptAAAAAJ'], page_budget=12, max_depth=1, last_crawled={most_cited: time.time()})
+        assert most_cited not in self.requested_authors()
+
+    def test_result_buffer(self):
+        in_memory = scheduler.PriorityCrawl(['hNTyptAAAAAJ'], page_budget=8, max_depth=1)
+        result_buffer = spill.SpillBuffer(memory_budget=4096)
+        buffered = scheduler.PriorityCrawl(['hNTyptAAAAAJ'], page_budget=8, max_depth=1, result_buffer=result_buffer)
+        assert buffered.get_results_dict()['authors'] == []
+        assert sorted(json.dumps(page) for page in buffered.iter_results()) == \
+            sorted(json.dumps(page) for page in in_memory.iter_results())
+        assert buffered.get_results_dict()['result_buffer']['segments'] > 0
+        result_buffer.close()
+
+
+class TestVisitedSet:
+    """
+    Testing for the bloom filter visited set.
+    """
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.visited_dir = os.path.join(self.temp_dir, 'visited')
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_filter_size(self):
+        num_bits, num_hashes = visited.BloomFilter.get_size(1000, 0.01)
+        assert num_bits == 9586
+        assert num_hashes == 7
+
+    def test_no_false_negatives(self):
+        visited_set = visited.VisitedSet(capacity=1000, error_rate=0.01, exact=False)
+        for idx in range(3000):
+            visited_set.add('author:{0}'.format(idx))
+        assert all('author:{0}'.format(idx) in visited_set for idx in range(3000))
+        assert not visited_set.add('author:5')
+
+    def test_grows_and_keeps_error_rate(self):
+        visited_set = visited.VisitedSet(capacity=1000, error_rate=0.01, exact=False)
+        for idx in range(5000):
+            visited_set.add('author:{0}'.format(idx))
+        assert len(visited_set.filters) == 3
+        false_positives = sum('publication:{0}'.format(idx) in visited_set for idx in range(10000))
+        assert false_positives < 100
+
+    def test_exact_store_removes_false_positives(self):
+        visited_set = visited.VisitedSet(self.visited_dir, capacity=100, error_rate=0.5, exact=True)
+        for idx in range(100):
+            visited_set.add('author:{0}'.format(idx))
+        assert not any('publication:{0}'.format(idx) in visited_set for idx in range(1000))
+        visited_set.close()
+
+    def test_in_memory_set_has_no_exact_store(self):
+        assert visited.VisitedSet(capacity=100).exact_store is None
+        try:
+            visited.VisitedSet(capacity=100, exact=True)
+        except ValueError:
+            pass
+        else:
+            assert False
+
+    def test_persisted(self):
+        visited_set = visited.VisitedSet(self.visited_dir, capacity=100)
+        for idx in range(250):
+            visited_set.add(u'author:{0}'.format(idx))
+        visited_set.close()
+        visited_set = visited.VisitedSet(self.visited_dir, capacity=100)
+        assert len(visited_set.filters) == 2
+        assert len(visited_set) == 250
+        assert 'author:249' in visited_set
+        assert 'author:250' not in visited_set
+        visited_set.close()
+
+
+class TestPublicationRegistry:
+    """
+    Testing for publications shared between authors, served from test data.
+    Both authors list Suttons publications, only the first has a detail page.
+    """
+    @classmethod
+    def setup_class(cls):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            cls.html = html_file.read()
+        with open('test_data/sutton_publication.html', 'r') as html_file:
+            cls.publication_html = html_file.read()
+        cls.requested_urls = []
+        def get_url(url):
+            cls.requested_urls.append(url)
+            if 'view_citation' in url:
+                return cls.publication_html if url.endswith('u5HHmVD_uO8C') else '<html></html>'
+            if gs.ParseHelper.get_parameter_from_url(url, 'cstart') != '0':
+                return '<html></html>'
+            return cls.html
+        cls.fake_get_url = FakeGetUrl(get_url)
+        cls.group_pubs = registry.GroupPublications(['hNTyptAAAAAJ', 'Q0ZsJ_UAAAAJ']).get_results_dict()
+
+    @classmethod
+    def teardown_class(cls):
+        cls.fake_get_url.restore()
+
+    def test_shared_details_fetched_once(self):
+        assert self.group_pubs['publications_listed'] == 200
+        assert self.group_pubs['detail_fetches'] == 100
+        assert len([url for url in self.requested_urls if 'view_citation' in url]) == 100
+
+    def test_work_linked_to_every_author(self):
+        work = self.group_pubs['works'][0]
+        assert work['title'] == 'Reinforcement learning: An introduction'
+        assert work['authors'] == [['hNTyptAAAAAJ', 'u5HHmVD_uO8C'], ['Q0ZsJ_UAAAAJ', 'u5HHmVD_uO8C']]
+        assert work['detail']['cluster_ids'][0] == '697317316240233105'
+
+    def test_title_normalized(self):
+        publication_registry = registry.PublicationRegistry()
+        publication_registry.add_listing('x', {'id': 'a', 'title': u'Reinforcement Learning: An Introduction', 'year': 1998})
+        work = publication_registry.find_listing('y', {'id': 'b', 'title': 'reinforcement learning - an introduction', 'year': 1998})
+        assert work['authors'] == [['x', 'a']]
+        assert publication_registry.find_listing('y', {'id': 'b', 'title': 'Reinforcement learning', 'year': 1998}) is None
+
+    def test_generic_title_of_other_authors_not_merged(self):
+        publication_registry = registry.PublicationRegistry()
+        publication_registry.add_listing('x', {'id': 'a', 'title': 'Introduction', 'year': 2010, 'authors_line': 'RS Sutton'})
+        publication_registry.add_listing('y', {'id': 'b', 'title': 'Introduction', 'year': 2010, 'authors_line': 'J Smith, RS Sutton'})
+        assert len(publication_registry) == 2
+        work = publication_registry.find_listing('z', {'id': 'c', 'title': 'Introduction', 'year': 2010, 'authors_line': 'R Sutton, J Smith'})
+        assert work['authors'] == [['x', 'a']]
+
+    def test_matched_by_cluster_id(self):
+        publication_registry = registry.PublicationRegistry()
+        publication_registry.add_listing('x', {'id': 'a', 'title': 'RL: an introduction', 'year': 1998}, {'cluster_ids': ['1', '2']})
+        work = publication_registry.add_listing('y', {'id': 'b', 'title': 'Reinforcement learning', 'year': 1998}, {'cluster_ids': ['2']})
+        assert len(publication_registry) == 1
+        assert work['authors'] == [['x', 'a'], ['y', 'b']]
+        assert publication_registry.find_listing('z', {'id': 'c', 'title': 'Reinforcement learning', 'year': 1998}) is work
+
+
+class TestImageFetcher:
+    """
+    Testing for downloading photos into a content addressed store
+    from a local server.
+    """
+    @classmethod
+    def setup_class(cls):
+        cls.server = LocalServer()
+        cls.server.responses['/avatar_a.jpg'] = [(200, 0, 'placeholder')]
+        cls.server.responses['/avatar_b.jpg'] = [(200, 0, 'placeholder')]
+        cls.server.responses['/photo.jpg'] = [(200, 0, 'photo')]
+        cls.server.responses['/missing.jpg'] = [(404, 0, '')]
+
+    @classmethod
+    def teardown_class(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.image_store = images.ImageStore(os.path.join(self.temp_dir, 'images'))
+        self.image_fetcher = images.ImageFetcher(self.image_store, fetch.FetchPolicy(max_retries=0))
+        del self.server.requests[:]
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_identical_images_stored_once(self):
+        paths = self.image_fetcher.fetch([self.server.url('/avatar_a.jpg'), self.server.url('/avatar_b.jpg'),
+                                          self.server.url('/photo.jpg')])
+        assert len(set(paths.values())) == 2
+        with open(paths[self.server.url('/photo.jpg')], 'rb') as image_file:
+            assert image_file.read() == 'photo'
+        assert self.image_fetcher.get_stats()['duplicates'] == 1
+
+    def test_stored_urls_skipped(self):
+        self.image_fetcher.fetch([self.server.url('/photo.jpg')])
+        self.image_store.save()
+        image_fetcher = images.ImageFetcher(images.ImageStore(self.image_store.store_dir), fetch.FetchPolicy())
+        paths = image_fetcher.fetch([self.server.url('/photo.jpg'), self.server.url('/photo.jpg')])
+        assert self.server.requests == ['/photo.jpg']
+        assert image_fetcher.get_stats()['skipped'] == 2
+        assert os.path.exists(paths[self.server.url('/photo.jpg')])
+
+    def test_local_paths_added_to_results(self):
+        coauthors_dict = OrderedDict([('author_uid', 'x'), ('coauthors', [
+            OrderedDict([('author_uid', 'a'), ('author_image_url', self.server.url('/avatar_a.jpg'))]),
+            OrderedDict([('author_uid', 'b'), ('author_image_url', self.server.url('/missing.jpg'))])])])
+        self.image_fetcher.add_local_paths(coauthors_dict)
+        assert coauthors_dict['coauthors'][0]['author_image_path'] == self.image_store.get_path(self.server.url('/avatar_a.jpg'))
+        assert coauthors_dict['coauthors'][1]['author_image_path'] is None
+        assert self.image_fetcher.get_stats()['errors'] == 1
+
+
+class TestSpillBuffer:
+    """
+    Testing for the spill to disk result buffer.
+    """
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.records = [OrderedDict([('id', 'pub{0}'.format(idx)), ('cited', (idx * 37) % 101),
+                                     ('title', u'Reinforcement learning \u00e9 {0}'.format(idx) * 5)])
+                        for idx in range(500)]
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_in_memory_within_budget(self):
+        result_buffer = spill.SpillBuffer(memory_budget=10 * 1024 * 1024, spill_dir=self.temp_dir)
+        result_buffer.extend(self.records)
+        assert list(result_buffer) == self.records
+        assert result_buffer.get_report()['segments'] == 0
+        assert result_buffer.get_report()['peak_memory'] > 0
+
+    def test_spilled_in_order(self):
+        result_buffer = spill.SpillBuffer(memory_budget=8192, spill_dir=self.temp_dir)
+        result_buffer.extend(self.records)
+        report = result_buffer.get_report()
+        assert report['segments'] > 1
+        assert report['peak_memory'] <= 8192 + 1024
+        assert 0 < report['spilled_compressed_bytes'] < report['spilled_bytes']
+        assert list(result_buffer) == self.records
+        assert len(result_buffer) == 500
+        result_buffer.close()
+        assert os.listdir(self.temp_dir) == []
+
+    def test_spilled_merged_by_key(self):
+        result_buffer = spill.SpillBuffer(memory_budget=8192, spill_dir=self.temp_dir,
+                                          key=lambda record: -record['cited'])
+        result_buffer.extend(self.records)
+        assert result_buffer.get_report()['segments'] > 1
+        by_cited = sorted(self.records, key=lambda record: -record['cited'])
+        assert list(result_buffer) == by_cited
+
+
+class TestCitationHistory:
+    """
+    Testing for the citation count history, from the test data author.
+    """
+    def setup(self):
+        self.temp_dir = tempfile.mkdtemp()
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            html = html_file.read()
+        self.author = gs.AuthorParser(html, OrderedDict()).get_results()
+        self.pubs = gs.AuthorPublicationsParser(html, OrderedDict([('author_uid', 'hNTyptAAAAAJ'), ('page', 0)])).get_results()
+        self.citation_history = history.CitationHistory(self.temp_dir)
+        self.citation_history.add(self.author, timestamp=1000)
+        self.citation_history.add(self.pubs, timestamp=1000)
+
+    def teardown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_only_changes_recorded(self):
+        assert self.citation_history.get_stats()['publication_records'] == 100
+        self.pubs['publications'][0]['cited'] += 7
+        assert self.citation_history.add(self.pubs, timestamp=2000) == 1
+        assert self.citation_history.add(self.author, timestamp=2000) == 0
+        assert self.citation_history.get_stats()['publication_records'] == 101
+        assert self.citation_history.get_stats()['author_records'] == 1
+
+    def test_publication_history(self):
+        cited = self.pubs['publications'][0]['cited']
+        self.pubs['publications'][0]['cited'] += 7
+        self.citation_history.add(self.pubs, timestamp=2000)
+        self.pubs['publications'][0]['cited'] -= 2
+        self.citation_history.add(self.pubs, timestamp=3000)
+        citation_history = history.CitationHistory(self.temp_dir)
+        assert citation_history.get_publication_history('hNTyptAAAAAJ', 'u5HHmVD_uO8C') == [
+            OrderedDict([('timestamp', 1000), ('cited', cited)]),
+            OrderedDict([('timestamp', 2000), ('cited', cited + 7)]),
+            OrderedDict([('timestamp', 3000), ('cited', cited + 5)])]
+        assert citation_history.get_publication_history('hNTyptAAAAAJ', 'missing') == []
+
+    def test_author_history(self):
+        author = OrderedDict(self.author)
+        author['h_index'] = str(int(author['h_index']) + 1)
+        del author['i10_index']
+        self.citation_history.add(author, timestamp=2000)
+        author_history = history.CitationHistory(self.temp_dir).get_author_history('hNTyptAAAAAJ')
+        assert [point['timestamp'] for point in author_history] == [1000, 2000]
+        assert author_history[0]['total_citations'] == int(self.author['total_citations'])
+        assert author_history[1]['h_index'] == int(self.author['h_index']) + 1
+        assert author_history[1]['i10_index'] == int(self.author['i10_index'])
+
+    def test_projected_author_crawl(self):
+        with open('test_data/sutton_home_page.html', 'r') as html_file:
+            html = html_file.read().replace('>55<', '>56<', 1)
+        fake_get_url = FakeGetUrl(lambda url: html)
+        gs.GSHelper.citation_history = self.citation_history
+        try:
+            gs.GSHelper.get_author('hNTyptAAAAAJ', ['h_index'])
+        finally:
+            gs.GSHelper.citation_history = None
+            fake_get_url.restore()
+        author_history = self.citation_history.get_author_history('hNTyptAAAAAJ')
+        assert author_history[-1]['h_index'] == 56
+        assert author_history[-1]['total_citations'] == int(self.author['total_citations'])
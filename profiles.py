@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+"""
+Offline inverted index over author profiles already parsed from GS.
+
+Labels, affiliation words and email domains of every stored profile are
+indexed by author uid, so label and domain lookups for known authors are
+answered locally instead of through AuthorQuery.
+"""
+from collections import OrderedDict
+import json
+import os
+import re
+import sys
+
+
+class ProfileIndex(object):
+    """
+    Inverted index of author profiles. Accepts AuthorParser results,
+    AuthorQueryParser hits and AuthorCoAuthorsParser coauthors.
+    >>> profile_index = ProfileIndex()
+    >>> profile_index.add({'uid': 'x', 'research_areas': ['Machine Learning'], 'email_domain': '@cs.ualberta.ca'})
+    >>> profile_index.search(labels_all=['machine learning'], domains=['ualberta.ca'])
+    ['x']
+    """
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self.profiles = OrderedDict()
+        # term to set of uids, terms are prefixed by label:, domain: or word:
+        self.postings = {}
+        self.terms = {}
+        if index_path is not None and os.path.exists(index_path):
+            with open(index_path, 'r') as index_file:
+                for profile in json.load(index_file, object_pairs_hook=OrderedDict):
+                    self.add(profile)
+
+    def __len__(self):
+        return len(self.profiles)
+
+    @staticmethod
+    def get_uid(profile):
+        for key in ('author_UID', 'uid', 'author_uid'):
+            if profile.get(key):
+                return profile[key]
+        return None
+
+    @staticmethod
+    def normalize_label(label):
+        return '_'.join(label.lower().split())
+
+    @staticmethod
+    def domain_suffixes(domain):
+        """
+        Returns every suffix of an email domain with at least two parts,
+        so cs.ualberta.ca can be found by ualberta.ca.
+        """
+        parts = domain.lower().lstrip('@').strip().split('.')
+        return ['.'.join(parts[idx:]) for idx in range(len(parts) - 1)]
+
+    def get_terms(self, profile):
+        terms = set()
+        labels = profile.get('research_interests') or profile.get('research_areas') or []
+        for label in labels:
+            if label:
+                terms.add('label:' + self.normalize_label(label))
+        affiliation = profile.get('affiliation') or profile.get('bio') or ''
+        for word in re.findall(r'\w+', affiliation.lower(), re.UNICODE):
+            terms.add('word:' + word)
+        domain = profile.get('email_domain') or profile.get('domain') or ''
+        for suffix in self.domain_suffixes(domain):
+            terms.add('domain:' + suffix)
+        return terms
+
+    def add(self, profile):
+        """
+        Adds a profile, or merges its non empty fields into the stored
+        one, so a coauthor entry doesn't drop labels from a full profile.
+        Only the postings which changed are touched.
+        """
+        uid = self.get_uid(profile)
+        if uid is None:
+            return
+        if uid in self.profiles:
+            merged = OrderedDict(self.profiles[uid])
+            merged.update((key, value) for key, value in profile.items() if value)
+            profile = merged
+        old_terms = self.terms.get(uid, set())
+        new_terms = self.get_terms(profile)
+        for term in old_terms - new_terms:
+            self.postings[term].discard(uid)
+            if not self.postings[term]:
+                del self.postings[term]
+        for term in new_terms - old_terms:
+            self.postings.setdefault(term, set()).add(uid)
+        self.terms[uid] = new_terms
+        self.profiles[uid] = profile
+
+    def add_all(self, profiles):
+        for profile in profiles:
+            self.add(profile)
+
+    def remove(self, uid):
+        for term in self.terms.pop(uid, set()):
+            self.postings[term].discard(uid)
+            if not self.postings[term]:
+                del self.postings[term]
+        self.profiles.pop(uid, None)
+
+    def save(self):
+        with open(self.index_path, 'w') as index_file:
+            json.dump(self.profiles.values(), index_file)
+
+    def get_postings(self, term):
+        return self.postings.get(term, set())
+
+    def search(self, labels_all=None, labels_any=None, domains=None, words=None):
+        """
+        Returns the sorted uids of profiles with every label in labels_all,
+        at least one label in labels_any, an email domain ending in one of
+        domains and every word in words, ignoring filters not passed.
+        """
+        required = []
+        for label in labels_all or []:
+            required.append(self.get_postings('label:' + self.normalize_label(label)))
+        for word in words or []:
+            required.append(self.get_postings('word:' + word.lower()))
+        if labels_any:
+            required.append(set().union(*[self.get_postings('label:' + self.normalize_label(label)) for label in labels_any]))
+        if domains:
+            required.append(set().union(*[self.get_postings('domain:' + domain.lower().lstrip('@')) for domain in domains]))
+        if not required:
+            return []
+        # intersect from the smallest posting list up.
+        required.sort(key=len)
+        uids = set(required[0])
+        for postings in required[1:]:
+            if not uids:
+                break
+            uids &= postings
+        return sorted(uids)
+
+    def query(self, query_string):
+        """
+        Searches with GS style terms. Terms are ANDed, OR separates
+        alternatives, and AND binds tighter than OR.
+        >>> profile_index.query('label:machine_learning domain:ualberta.ca OR label:robotics')
+        """
+        uids = set()
+        for group in re.split(r'\s+OR\s+', query_string.strip()):
+            labels_all = []
+            domains = []
+            words = []
+            for term in group.split():
+                if term == 'AND':
+                    continue
+                if term.startswith('label:'):
+                    labels_all.append(term[len('label:'):])
+                elif term.startswith('domain:'):
+                    domains.append(term[len('domain:'):])
+                else:
+                    words.append(term)
+            uids.update(self.search(labels_all=labels_all, domains=domains, words=words))
+        return sorted(uids)
+
+    def get_profiles(self, uids):
+        return [self.profiles[uid] for uid in uids]
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--query':
+        # cli args = query, index file, query string
+        # python profiles.py --query profiles.json 'label:machine_learning domain:ualberta.ca'
+        profile_index = ProfileIndex(sys.argv[2])
+        print json.dumps(profile_index.get_profiles(profile_index.query(sys.argv[3])), indent=4)
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+"""
+Registry of publications shared between authors.
+
+The same paper is listed under every one of its authors with a different
+publication uid. Works are recognised across authors by normalized title,
+year and first author from the publications list, and by the GS cluster
+ids on the detail page, so the view_citation page of a shared paper is
+fetched and parsed once and linked to every author.
+"""
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
+import json
+import os
+import sys
+
+from gs import AuthorAllPublications, AuthorPublication, AuthorPublicationParser, AuthorPublicationsParser, ScholarObject
+from resolve import NameHelper
+
+
+class PublicationRegistry(object):
+    """
+    Works keyed by normalized title, year and first author and by
+    cluster id, each linked to the (author_uid, publication_uid) pairs
+    listing it. Pass a path to persist it between runs.
+    >>> registry = PublicationRegistry()
+    >>> registry.add_listing('x', {'id': 'a', 'title': 'Reinforcement Learning: An Introduction', 'year': 1998,
+    ...                            'authors_line': 'RS Sutton, AG Barto'})
+    >>> registry.find_listing('y', {'id': 'b', 'title': 'Reinforcement learning - an introduction', 'year': 1998,
+    ...                             'authors_line': 'R Sutton, A Barto'})['work_id']
+    'reinforcement learning an introduction|1998|sutton'
+    """
+    def __init__(self, registry_path=None):
+        self.registry_path = registry_path
+        self.works = OrderedDict()
+        self.title_keys = {}
+        self.cluster_ids = {}
+        if registry_path is not None and os.path.exists(registry_path):
+            with open(registry_path, 'r') as registry_file:
+                for work in json.load(registry_file, object_pairs_hook=OrderedDict):
+                    self.add_work(work)
+
+    def __len__(self):
+        return len(self.works)
+
+    @staticmethod
+    def listing_key(author_uid, publication):
+        """
+        Returns the normalized title, year and first author surname of a
+        publication, so generic titles like "Editorial" of different
+        authors aren't merged. Untitled publications can't be matched, so
+        are keyed by their uid.
+        """
+        tokens = NameHelper.normalize(publication.get('title'))
+        if not tokens:
+            return u'{0}:{1}'.format(author_uid, publication.get('id'))
+        first_author = NameHelper.normalize((publication.get('authors_line') or '').split(',')[0])
+        return u'{0}|{1}|{2}'.format(' '.join(tokens), publication.get('year') or '',
+                                     first_author[-1] if first_author else '')
+
+    def add_work(self, work):
+        self.works[work['work_id']] = work
+        for title_key in work['title_keys']:
+            self.title_keys[title_key] = work['work_id']
+        for cluster_id in work['cluster_ids']:
+            self.cluster_ids[cluster_id] = work['work_id']
+
+    def find_listing(self, author_uid, publication):
+        """
+        Returns the work a publications list entry is a version of, or None.
+        """
+        work_id = self.title_keys.get(self.listing_key(author_uid, publication))
+        return self.works.get(work_id)
+
+    def find_clusters(self, cluster_ids):
+        for cluster_id in cluster_ids:
+            if cluster_id in self.cluster_ids:
+                return self.works[self.cluster_ids[cluster_id]]
+        return None
+
+    def add_listing(self, author_uid, publication, detail=None):
+        """
+        Links a publications list entry of author_uid to its work, adding
+        the work if neither its title, year and first author nor the
+        cluster ids in detail are known. Returns the work.
+        """
+        title_key = self.listing_key(author_uid, publication)
+        cluster_ids = (detail.get('cluster_ids') or []) if detail else []
+        work = self.find_listing(author_uid, publication) or self.find_clusters(cluster_ids)
+        if work is None:
+            work = OrderedDict()
+            work['work_id'] = title_key
+            work['title'] = publication.get('title')
+            work['year'] = publication.get('year')
+            work['title_keys'] = []
+            work['cluster_ids'] = []
+            work['authors'] = []
+            work['detail'] = detail
+        if title_key not in work['title_keys']:
+            work['title_keys'].append(title_key)
+        for cluster_id in cluster_ids:
+            if cluster_id not in work['cluster_ids']:
+                work['cluster_ids'].append(cluster_id)
+        if work['detail'] is None:
+            work['detail'] = detail
+        link = [author_uid, publication.get('id')]
+        if link not in work['authors']:
+            work['authors'].append(link)
+        self.add_work(work)
+        return work
+
+    def save(self):
+        with open(self.registry_path, 'w') as registry_file:
+            json.dump(self.works.values(), registry_file)
+
+
+class GroupPublications(ScholarObject):
+    """
+    Every publication of a group of authors, with the detail page of
+    each shared work fetched once. Details are fetched concurrently with
+    max_workers threads, for one listing of each title, year and first
+    author not already in the registry.
+    >>> group_pubs = GroupPublications(['hNTyptAAAAAJ', 'Q0ZsJ_UAAAAJ'])
+    >>> group_pubs.get_results_dict()['detail_fetches']
+    """
+    # the authors line gives the first author of the title key.
+    LISTING_FIELDS = AuthorPublicationsParser.DEFAULT_FIELDS + ('authors_line',)
+
+    def __init__(self, author_uids, registry=None, max_workers=8):
+        self.registry = registry if registry is not None else PublicationRegistry()
+        listings = []
+        for author_uid in author_uids:
+            author_pubs = AuthorAllPublications(author_uid, AuthorPublicationsParser, fields=self.LISTING_FIELDS)
+            for publication in author_pubs.get_results_dict()['publications']:
+                listings.append((author_uid, publication))
+
+        # one listing per title key the registry doesn't know.
+        to_fetch = OrderedDict()
+        for author_uid, publication in listings:
+            title_key = PublicationRegistry.listing_key(author_uid, publication)
+            if self.registry.find_listing(author_uid, publication) is None and title_key not in to_fetch:
+                to_fetch[title_key] = (author_uid, publication)
+        details = self.fetch_details(to_fetch.values(), max_workers)
+        for (author_uid, publication), detail in zip(to_fetch.values(), details):
+            self.registry.add_listing(author_uid, publication, detail)
+        work_ids = []
+        for author_uid, publication in listings:
+            work_id = self.registry.add_listing(author_uid, publication)['work_id']
+            if work_id not in work_ids:
+                work_ids.append(work_id)
+
+        self.results_dict = OrderedDict()
+        self.results_dict['author_uids'] = author_uids
+        self.results_dict['publications_listed'] = len(listings)
+        self.results_dict['detail_fetches'] = len(to_fetch)
+        self.results_dict['works'] = [self.registry.works[work_id] for work_id in work_ids]
+
+    def fetch_details(self, listings, max_workers):
+        def fetch_detail(listing):
+            author_uid, publication = listing
+            author_pub = AuthorPublication(author_uid, publication['id'], AuthorPublicationParser)
+            return author_pub.get_results_dict()
+        if not listings:
+            return []
+        pool = ThreadPool(min(max_workers, len(listings)))
+        try:
+            return pool.map(fetch_detail, listings)
+        finally:
+            pool.close()
+            pool.join()
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--group':
+        # cli args = group, comma separated author uids, registry file
+        # python registry.py --group 'hNTyptAAAAAJ,Q0ZsJ_UAAAAJ' registry.json
+        try:
+            registry = PublicationRegistry(sys.argv[3])
+        except IndexError:
+            registry = PublicationRegistry()
+        print GroupPublications(sys.argv[2].split(','), registry).to_json()
+        if registry.registry_path is not None:
+            registry.save()
@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+"""
+Batch resolution of (name, affiliation) pairs to GS author uids.
+
+Every AuthorQueryParser hit seen is kept in a local index, blocked by
+the soundex code of the last name, so repeat, near duplicate and
+misspelled names are resolved offline. Only queries the index can't
+answer confidently go to GS, one search per block of near duplicate
+names in a batch, and those searches run concurrently.
+"""
+from collections import OrderedDict
+from difflib import SequenceMatcher
+from multiprocessing.pool import ThreadPool
+import json
+import os
+import re
+import sys
+import unicodedata
+
+from gs import AuthorQuery, AuthorQueryParser
+
+
+class NameHelper(object):
+    """
+    Normalization and similarity of author names and affiliations.
+    """
+    @staticmethod
+    def normalize(text):
+        """
+        Lower case ascii tokens, with accents and punctuation removed.
+        >>> NameHelper.normalize(u'Jos\\xe9 A. Mart\\xednez-Ruiz')
+        ['jose', 'a', 'martinez', 'ruiz']
+        """
+        if not text:
+            return []
+        if isinstance(text, str):
+            text = text.decode('utf-8')
+        text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').lower()
+        return re.findall(r'[a-z0-9]+', text)
+
+    @staticmethod
+    def name_tokens(name):
+        """
+        Normalized tokens of a name, last name last. Names written last
+        name first with trailing initials are turned around.
+        >>> NameHelper.name_tokens('Einstein A')
+        ['a', 'einstein']
+        """
+        tokens = NameHelper.normalize(name)
+        if len(tokens) > 1 and len(tokens[0]) > 1 and all(len(token) == 1 for token in tokens[1:]):
+            return tokens[1:] + tokens[:1]
+        return tokens
+
+    SOUNDEX_CODES = dict((letter, str(code)) for code, letters in
+                         enumerate(['aeiouy', 'bfpv', 'cgjkqsxz', 'dt', 'l', 'mn', 'r'])
+                         for letter in letters)
+
+    @staticmethod
+    def soundex(token):
+        """
+        Returns the American soundex code of a normalized token.
+        >>> NameHelper.soundex('einstein'), NameHelper.soundex('einstien')
+        ('e523', 'e523')
+        """
+        if not token or not token[0].isalpha():
+            return token
+        code = token[0]
+        last = NameHelper.SOUNDEX_CODES.get(token[0])
+        for letter in token[1:]:
+            if letter in 'hw':
+                # h and w don't separate letters with the same code.
+                continue
+            digit = NameHelper.SOUNDEX_CODES.get(letter)
+            if digit is not None and digit != '0' and digit != last:
+                code += digit
+            last = digit
+        return (code + '000')[:4]
+
+    @staticmethod
+    def block_key(name):
+        """
+        Returns the soundex code of the normalized last name, which
+        candidates must share, so last names with a typo still meet.
+        """
+        tokens = NameHelper.name_tokens(name)
+        return NameHelper.soundex(tokens[-1]) if tokens else ''
+
+    @staticmethod
+    def initial_key(name):
+        """
+        Returns the first initial of a name, which bounds the hits a name
+        with an unknown last name is scored against.
+        """
+        tokens = NameHelper.name_tokens(name)
+        return tokens[0][0] if tokens else ''
+
+    @staticmethod
+    def name_similarity(query_name, hit_name):
+        """
+        Scores two names from 0 to 1. Last names must be near identical,
+        a given name matching only by initial scores lower than a full match.
+        """
+        query_tokens = NameHelper.name_tokens(query_name)
+        hit_tokens = NameHelper.name_tokens(hit_name)
+        if not query_tokens or not hit_tokens:
+            return 0.0
+        last_name = SequenceMatcher(None, query_tokens[-1], hit_tokens[-1]).ratio()
+        if last_name < 0.85:
+            return 0.0
+        query_given = query_tokens[:-1]
+        hit_given = hit_tokens[:-1]
+        if not query_given or not hit_given:
+            given_name = 0.8
+        elif query_given[0] == hit_given[0]:
+            given_name = 1.0
+        elif query_given[0][0] == hit_given[0][0] and min(len(query_given[0]), len(hit_given[0])) == 1:
+            given_name = 0.9
+        else:
+            given_name = 0.6 * SequenceMatcher(None, query_given[0], hit_given[0]).ratio()
+        return last_name * given_name
+
+    @staticmethod
+    def affiliation_similarity(query_affiliation, hit):
+        """
+        Fraction of the query affiliation tokens found in the hits
+        affiliation or email domain.
+        """
+        query_tokens = set(NameHelper.normalize(query_affiliation))
+        if not query_tokens:
+            return None
+        hit_tokens = set(NameHelper.normalize(hit.get('affiliation')))
+        hit_tokens.update(NameHelper.normalize(hit.get('email_domain')))
+        return len(query_tokens & hit_tokens) / float(len(query_tokens))
+
+
+class AuthorIndex(object):
+    """
+    Local index of author search hits, keyed by uid and blocked by
+    the soundex code of the last name and by first initial. Pass a path
+    to persist it between runs.
+    """
+    # a runner up this close to the best match makes the match ambiguous.
+    AMBIGUITY_MARGIN = 0.05
+    AMBIGUITY_PENALTY = 0.75
+
+    def __init__(self, index_path=None):
+        self.index_path = index_path
+        self.hits = OrderedDict()
+        self.blocks = {}
+        self.initials = {}
+        if index_path is not None and os.path.exists(index_path):
+            with open(index_path, 'r') as index_file:
+                self.add(json.load(index_file, object_pairs_hook=OrderedDict))
+
+    def __len__(self):
+        return len(self.hits)
+
+    def add(self, hits):
+        for hit in hits:
+            uid = hit.get('uid')
+            if not uid:
+                continue
+            if uid not in self.hits:
+                self.blocks.setdefault(NameHelper.block_key(hit.get('name')), []).append(uid)
+                self.initials.setdefault(NameHelper.initial_key(hit.get('name')), []).append(uid)
+            self.hits[uid] = hit
+
+    def save(self):
+        with open(self.index_path, 'w') as index_file:
+            json.dump(self.hits.values(), index_file)
+
+    def score(self, name, affiliation, hit):
+        name_score = NameHelper.name_similarity(name, hit.get('name'))
+        affiliation_score = NameHelper.affiliation_similarity(affiliation, hit)
+        if affiliation_score is None:
+            return name_score
+        return 0.7 * name_score + 0.3 * affiliation_score
+
+    def lookup(self, name, affiliation=None):
+        """
+        Returns (hit, confidence) of the best match for name, or
+        (None, 0.0) when nothing in the index is similar. Names whose
+        block is empty, such as a last name with a typo in its first
+        letter, are scored against the hits with the same first initial.
+        """
+        scored = []
+        uids = self.blocks.get(NameHelper.block_key(name)) or self.initials.get(NameHelper.initial_key(name)) or []
+        for uid in uids:
+            hit = self.hits[uid]
+            scored.append((self.score(name, affiliation, hit), hit))
+        if not scored:
+            return None, 0.0
+        scored.sort(key=lambda scored_hit: scored_hit[0], reverse=True)
+        confidence, hit = scored[0]
+        if len(scored) > 1 and scored[1][0] >= confidence - self.AMBIGUITY_MARGIN:
+            confidence *= self.AMBIGUITY_PENALTY
+        return hit, confidence
+
+
+class BatchResolver(object):
+    """
+    Resolves (name, affiliation) pairs to GS author uids.
+    Duplicate queries are resolved once, queries the index answers with
+    at least min_confidence never reach GS, and the rest are searched
+    concurrently with max_workers threads. Only one name of each block
+    is searched at a time, the others are looked up again once its hits
+    are in the index. A search which fails leaves the queries of its
+    block unresolved without failing the rest of the batch.
+    >>> resolver = BatchResolver(AuthorIndex('author_index.json'))
+    >>> resolver.resolve([('A Einstein', 'princeton'), ('Albert Einstein', 'Princeton')])
+    """
+    def __init__(self, author_index, min_confidence=0.8, max_workers=4):
+        self.author_index = author_index
+        self.min_confidence = min_confidence
+        self.max_workers = max_workers
+        self.searches = 0
+
+    @staticmethod
+    def query_key(name, affiliation):
+        return (tuple(NameHelper.normalize(name)), tuple(NameHelper.normalize(affiliation)))
+
+    def search(self, query):
+        """
+        Returns the search hits for a query, or None if the search failed.
+        """
+        name, affiliation = query
+        try:
+            author_query = AuthorQuery(name, AuthorQueryParser, affiliation)
+            return author_query.get_results_dict()['search_results']
+        except Exception as e:
+            print "Couldn't search for {0}: {1}".format(name, e)
+            return None
+
+    def resolve(self, queries):
+        """
+        Returns an OrderedDict per query, in order, with the matched uid,
+        its confidence, and whether it came from the 'index', a 'search'
+        or is unresolved because its search failed with an 'error'.
+        """
+        unique_queries = OrderedDict()
+        for name, affiliation in queries:
+            unique_queries.setdefault(self.query_key(name, affiliation), (name, affiliation))
+
+        resolved = {}
+        pending = list(unique_queries)
+        while pending:
+            # one query per block is searched, the rest wait for its hits.
+            to_search = OrderedDict()
+            waiting = []
+            for key in pending:
+                name, affiliation = unique_queries[key]
+                hit, confidence = self.author_index.lookup(name, affiliation)
+                if hit is not None and confidence >= self.min_confidence:
+                    resolved[key] = (hit, confidence, 'index')
+                elif NameHelper.block_key(name) not in to_search:
+                    to_search[NameHelper.block_key(name)] = key
+                else:
+                    waiting.append(key)
+            if not to_search:
+                break
+            self.searches += len(to_search)
+            pool = ThreadPool(min(self.max_workers, len(to_search)))
+            try:
+                search_results = pool.map(self.search, [unique_queries[key] for key in to_search.values()])
+            finally:
+                pool.close()
+                pool.join()
+            for hits in search_results:
+                if hits is not None:
+                    self.author_index.add(hits)
+            failed_blocks = set()
+            for (block_key, key), hits in zip(to_search.items(), search_results):
+                if hits is None:
+                    resolved[key] = (None, 0.0, 'error')
+                    failed_blocks.add(block_key)
+                    continue
+                name, affiliation = unique_queries[key]
+                hit, confidence = self.author_index.lookup(name, affiliation)
+                resolved[key] = (hit, confidence, 'search')
+            pending = []
+            for key in waiting:
+                if NameHelper.block_key(unique_queries[key][0]) in failed_blocks:
+                    resolved[key] = (None, 0.0, 'error')
+                else:
+                    pending.append(key)
+
+        results = []
+        for name, affiliation in queries:
+            hit, confidence, source = resolved[self.query_key(name, affiliation)]
+            result = OrderedDict()
+            result['name'] = name
+            result['affiliation'] = affiliation
+            result['uid'] = hit['uid'] if hit is not None else None
+            result['confidence'] = round(confidence, 3)
+            result['source'] = source
+            results.append(result)
+        return results
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--resolve':
+        # cli args = resolve, queries file, index file
+        # python resolve.py --resolve authors.json author_index.json
+        # the queries file is a json list of [name, affiliation] pairs.
+        with open(sys.argv[2], 'r') as queries_file:
+            queries = [tuple(query) for query in json.load(queries_file)]
+        try:
+            author_index = AuthorIndex(sys.argv[3])
+        except IndexError:
+            author_index = AuthorIndex()
+        resolver = BatchResolver(author_index)
+        print json.dumps(resolver.resolve(queries), indent=4)
+        if author_index.index_path is not None:
+            author_index.save()
@@ -0,0 +1,228 @@
+#!/usr/bin/env python
+"""
+Priority ordered crawl of authors and their coauthors within a page budget.
+
+Instead of crawling coauthors breadth first, every pending page is kept
+in a priority queue scored from what has been parsed so far: coauthor
+citation counts, the citations of the last publication on a page, graph
+distance from the seed authors and how long ago an author was crawled.
+The crawl stops once page_budget pages are fetched, so the budget goes on
+the most important authors first.
+"""
+from collections import OrderedDict
+import heapq
+import itertools
+import json
+import math
+import sys
+import time
+
+from gs import (Author, AuthorCoAuthors, AuthorCoAuthorsParser, AuthorParser, AuthorPublications,
+                AuthorPublicationsParser, GSHelper, ScholarObject)
+from spill import SpillBuffer
+from visited import VisitedSet
+
+
+class CrawlScheduler(object):
+    """
+    Priority queue of pages to fetch. Higher priorities are popped first,
+    pages of equal priority in the order they were pushed.
+    >>> scheduler = CrawlScheduler()
+    >>> scheduler.push(2.0, 'author', {'author_uid': 'x'})
+    >>> scheduler.push(5.0, 'author', {'author_uid': 'y'})
+    >>> scheduler.pop()
+    (5.0, 'author', {'author_uid': 'y'})
+    """
+    def __init__(self):
+        self.heap = []
+        self.sequence = itertools.count()
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, priority, kind, args):
+        # heapq is a min heap, so priorities are negated.
+        heapq.heappush(self.heap, (-priority, next(self.sequence), kind, args))
+
+    def pop(self):
+        priority, sequence, kind, args = heapq.heappop(self.heap)
+        return -priority, kind, args
+
+
+class PriorityCrawl(ScholarObject):
+    """
+    Crawls authors, their publications pages and their coauthors from
+    seed author uids, highest priority page first, until page_budget
+    pages are fetched or nothing is left within max_depth coauthor hops.
+    last_crawled maps author uids to when they were last crawled, authors
+    crawled less than refresh_seconds ago are put behind new ones.
+    Author and publication uids seen are kept in visited, a VisitedSet,
+    pass one kept on disk for crawls too large for memory. The default
+    is a Bloom filter in memory, which may skip error_rate of new uids. Pass a
+    SpillBuffer as result_buffer to keep crawled pages within a memory
+    budget instead of in the results dict, and read them back with
+    iter_results.
+    >>> crawl = PriorityCrawl(['hNTyptAAAAAJ'], page_budget=50, max_depth=2)
+    >>> crawl.get_results_dict()['pages_fetched']
+    50
+    """
+    # seeds come before anything found while crawling.
+    SEED_PRIORITY = float('inf')
+
+    def __init__(self, seed_uids, page_budget, max_depth=2, last_crawled=None, refresh_seconds=30 * 24 * 3600,
+                 distance_decay=0.5, visited=None, result_buffer=None):
+        self.page_budget = page_budget
+        self.max_depth = max_depth
+        self.last_crawled = last_crawled or {}
+        self.refresh_seconds = refresh_seconds
+        self.distance_decay = distance_decay
+        self.scheduler = CrawlScheduler()
+        self.visited = visited if visited is not None else VisitedSet(capacity=100000)
+        self.result_buffer = result_buffer
+        self.handlers = {
+            'author': self.crawl_author,
+            'publications': self.crawl_publications,
+            'coauthors': self.crawl_coauthors,
+        }
+
+        self.results_dict = OrderedDict()
+        self.results_dict['page_budget'] = page_budget
+        self.results_dict['pages_fetched'] = 0
+        self.results_dict['authors'] = []
+        self.results_dict['publications'] = []
+        self.results_dict['coauthors'] = []
+        for author_uid in seed_uids:
+            self.queue_author(author_uid, 0, self.SEED_PRIORITY)
+        self.crawl()
+
+    def staleness(self, author_uid):
+        """
+        Returns 1 for authors never crawled or due a refresh, and the
+        fraction of refresh_seconds since the last crawl otherwise.
+        """
+        if author_uid not in self.last_crawled:
+            return 1.0
+        age = time.time() - self.last_crawled[author_uid]
+        return min(max(age / float(self.refresh_seconds), 0.0), 1.0)
+
+    def author_priority(self, author_uid, distance, citation_count):
+        if distance == 0:
+            return self.SEED_PRIORITY
+        return math.log1p(citation_count or 0) * self.distance_decay ** distance * self.staleness(author_uid)
+
+    def queue_author(self, author_uid, distance, priority):
+        if not self.visited.add('author:' + author_uid):
+            return
+        args = OrderedDict([('author_uid', author_uid), ('distance', distance)])
+        self.scheduler.push(priority, 'author', args)
+        self.scheduler.push(priority, 'publications', OrderedDict(args, page=0))
+        if distance < self.max_depth:
+            self.scheduler.push(priority, 'coauthors', args)
+
+    def crawl(self):
+        while len(self.scheduler) and self.results_dict['pages_fetched'] < self.page_budget:
+            priority, kind, args = self.scheduler.pop()
+            self.results_dict['pages_fetched'] += 1
+            try:
+                self.handlers[kind](priority, args)
+            except Exception as e:
+                print "Couldn't crawl {0} {1}: {2}".format(kind, args['author_uid'], e)
+        self.results_dict['pages_pending'] = len(self.scheduler)
+        if self.result_buffer is not None:
+            self.results_dict['result_buffer'] = self.result_buffer.get_report()
+
+    def add_result(self, kind, results_dict):
+        if self.result_buffer is None:
+            self.results_dict[kind].append(results_dict)
+        else:
+            self.result_buffer.append(OrderedDict([('kind', kind), ('result', results_dict)]))
+
+    def iter_results(self):
+        """
+        Yields the (kind, results dict) of every page crawled, in the
+        order crawled, whether buffered or in the results dict.
+        >>> for kind, results_dict in crawl.iter_results():
+        ...     print kind
+        """
+        if self.result_buffer is not None:
+            for record in self.result_buffer:
+                yield record['kind'], record['result']
+            return
+        pages = [(kind, results_dict) for kind in ('authors', 'publications', 'coauthors')
+                 for results_dict in self.results_dict[kind]]
+        for kind, results_dict in pages:
+            yield kind, results_dict
+
+    def crawl_author(self, priority, args):
+        author = Author(args['author_uid'], AuthorParser)
+        self.add_result('authors', author.get_results_dict())
+        # the uid on the page, if the queued one was an old alias.
+        if author.get_results_dict().get('author_UID'):
+            self.visited.add('author:' + author.get_results_dict()['author_UID'])
+
+    def crawl_publications(self, priority, args):
+        author_pubs = AuthorPublications(args['author_uid'], args['page'], AuthorPublicationsParser)
+        publications = author_pubs.get_results_dict()['publications']
+        self.add_result('publications', author_pubs.get_results_dict())
+        new_publications = 0
+        for publication in publications:
+            if publication.get('id') and self.visited.add('publication:' + args['author_uid'] + ':' + publication['id']):
+                new_publications += 1
+        # a page of publications seen before means the pages have run out.
+        if len(publications) < GSHelper.PUB_RESULTS_PER_PAGE or not new_publications:
+            return
+        # pages are sorted by citations, so the next page is worth at most
+        # what the last publication on this one was.
+        next_priority = math.log1p(publications[-1].get('cited') or 0) * self.distance_decay ** args['distance'] \
+            * self.staleness(args['author_uid'])
+        self.scheduler.push(min(priority, next_priority), 'publications', OrderedDict(args, page=args['page'] + 1))
+
+    def crawl_coauthors(self, priority, args):
+        author_coauthors = AuthorCoAuthors(args['author_uid'], AuthorCoAuthorsParser)
+        self.add_result('coauthors', author_coauthors.get_results_dict())
+        distance = args['distance'] + 1
+        for coauthor in author_coauthors.get_results_dict()['coauthors']:
+            coauthor_uid = coauthor.get('author_uid')
+            if coauthor_uid:
+                self.queue_author(coauthor_uid, distance,
+                                  self.author_priority(coauthor_uid, distance, coauthor.get('citation_count')))
+
+
+if __name__ == '__main__':
+    visited = None
+    if '--visited' in sys.argv:
+        # keep visited uids in a bloom filter on disk, for crawls too large for memory
+        # python scheduler.py --crawl 'hNTyptAAAAAJ' 200 2 --visited visited_dir
+        option_idx = sys.argv.index('--visited')
+        visited = VisitedSet(sys.argv[option_idx + 1])
+        del sys.argv[option_idx:option_idx + 2]
+
+    result_buffer = None
+    if '--memory-budget' in sys.argv:
+        # buffer crawled pages within a memory budget in MB, spilling the rest to disk,
+        # and print them as json lines followed by the crawl summary
+        # python scheduler.py --crawl 'hNTyptAAAAAJ' 200 2 --memory-budget 256
+        option_idx = sys.argv.index('--memory-budget')
+        result_buffer = SpillBuffer(int(float(sys.argv[option_idx + 1]) * 1024 * 1024))
+        del sys.argv[option_idx:option_idx + 2]
+
+    if sys.argv[1] == '--crawl':
+        # cli args = crawl, comma separated seed author uids, page budget, coauthor depth
+        # python scheduler.py --crawl 'hNTyptAAAAAJ' 200 2
+        seed_uids = sys.argv[2].split(',')
+        page_budget = int(sys.argv[3])
+        try:
+            max_depth = int(sys.argv[4])
+        except IndexError:
+            max_depth = 2
+        crawl = PriorityCrawl(seed_uids, page_budget, max_depth, visited=visited, result_buffer=result_buffer)
+        if result_buffer is None:
+            print crawl.to_json()
+        else:
+            for kind, results_dict in crawl.iter_results():
+                print json.dumps(OrderedDict([('kind', kind), ('result', results_dict)]))
+            print crawl.to_json()
+            result_buffer.close()
+
+    if visited is not None:
+        visited.close()
@@ -0,0 +1,155 @@
+"""
+Result buffering within a memory budget for crawls too large for memory.
+
+Records are held serialized, and the memory they take is estimated from
+their serialized length. When the buffer goes over its memory budget the
+records held are written to a zlib compressed segment file and dropped
+from memory. Reading the buffer back streams the segments and the records
+still in memory in the order they were added, or merged by a sort key.
+"""
+from collections import OrderedDict
+import heapq
+import json
+import os
+import shutil
+import struct
+import tempfile
+import zlib
+
+
+class SpillBuffer(object):
+    """
+    Buffers JSON serializable records within about memory_budget bytes,
+    spilling to compressed segments under spill_dir, a temporary
+    directory by default. Pass key to read records back sorted by it.
+    >>> result_buffer = SpillBuffer(memory_budget=64 * 1024 * 1024)
+    >>> result_buffer.append(author.get_results_dict())
+    >>> for results_dict in result_buffer:
+    ...     print results_dict['author_UID']
+    >>> result_buffer.get_report()['spilled_records']
+    0
+    """
+    RECORD_HEADER = '<I'
+    # estimated bytes a held record costs on top of its serialized length.
+    RECORD_OVERHEAD = 64
+
+    def __init__(self, memory_budget=64 * 1024 * 1024, spill_dir=None, key=None, compress_level=6):
+        self.memory_budget = memory_budget
+        self.key = key
+        self.compress_level = compress_level
+        self.own_spill_dir = spill_dir is None
+        self.spill_dir = spill_dir if spill_dir is not None else tempfile.mkdtemp(prefix='gs_spill_')
+        if not os.path.isdir(self.spill_dir):
+            os.makedirs(self.spill_dir)
+        # (sort key, sequence number, serialized record) of held records.
+        self.held = []
+        self.memory_used = 0
+        self.sequence = 0
+        self.segments = []
+
+        self.report = OrderedDict()
+        self.report['records'] = 0
+        self.report['memory_budget'] = memory_budget
+        self.report['peak_memory'] = 0
+        self.report['spilled_records'] = 0
+        self.report['spilled_bytes'] = 0
+        self.report['spilled_compressed_bytes'] = 0
+        self.report['segments'] = 0
+
+    def __len__(self):
+        return self.report['records']
+
+    def append(self, record):
+        serialized = json.dumps(record)
+        # round tripped so held keys compare like the ones read back from segments.
+        sort_key = json.loads(json.dumps(self.key(record))) if self.key is not None else None
+        self.held.append((sort_key, self.sequence, serialized))
+        self.sequence += 1
+        self.memory_used += len(serialized) + self.RECORD_OVERHEAD
+        self.report['records'] += 1
+        self.report['peak_memory'] = max(self.report['peak_memory'], self.memory_used)
+        if self.memory_used > self.memory_budget:
+            self.spill()
+
+    def extend(self, records):
+        for record in records:
+            self.append(record)
+
+    def spill(self):
+        """
+        Writes the held records to a new compressed segment, sorted if
+        the buffer has a key, and drops them from memory.
+        """
+        if not self.held:
+            return
+        if self.key is not None:
+            self.held.sort()
+        segment_path = os.path.join(self.spill_dir, 'segment_{0:05d}.z'.format(len(self.segments)))
+        compressor = zlib.compressobj(self.compress_level)
+        with open(segment_path, 'wb') as segment_file:
+            for sort_key, sequence, serialized in self.held:
+                entry = json.dumps([sort_key, sequence, serialized])
+                segment_file.write(compressor.compress(struct.pack(self.RECORD_HEADER, len(entry)) + entry))
+                self.report['spilled_bytes'] += len(serialized)
+            segment_file.write(compressor.flush())
+        self.segments.append(segment_path)
+        self.report['spilled_records'] += len(self.held)
+        self.report['spilled_compressed_bytes'] += os.path.getsize(segment_path)
+        self.report['segments'] = len(self.segments)
+        self.held = []
+        self.memory_used = 0
+
+    def read_segment(self, segment_path, chunk_size=65536):
+        """
+        Yields the (sort key, sequence number, serialized record) entries
+        of a segment, decompressing it a chunk at a time.
+        """
+        decompressor = zlib.decompressobj()
+        pending = ''
+        header_size = struct.calcsize(self.RECORD_HEADER)
+        with open(segment_path, 'rb') as segment_file:
+            while True:
+                chunk = segment_file.read(chunk_size)
+                pending += decompressor.decompress(chunk) if chunk else decompressor.flush()
+                offset = 0
+                while len(pending) - offset >= header_size:
+                    length, = struct.unpack_from(self.RECORD_HEADER, pending, offset)
+                    if len(pending) - offset - header_size < length:
+                        break
+                    entry = pending[offset + header_size:offset + header_size + length]
+                    offset += header_size + length
+                    sort_key, sequence, serialized = json.loads(entry)
+                    yield sort_key, sequence, serialized
+                pending = pending[offset:]
+                if not chunk:
+                    break
+
+    def __iter__(self):
+        """
+        Yields every record in the order added, or by key and then order
+        added if the buffer has a key.
+        """
+        held = sorted(self.held) if self.key is not None else self.held
+        sources = [self.read_segment(segment_path) for segment_path in self.segments] + [iter(held)]
+        if self.key is not None:
+            entries = heapq.merge(*sources)
+        else:
+            entries = (entry for source in sources for entry in source)
+        for sort_key, sequence, serialized in entries:
+            yield json.loads(serialized, object_pairs_hook=OrderedDict)
+
+    def get_report(self):
+        return self.report
+
+    def close(self):
+        """
+        Deletes the spilled segments.
+        """
+        for segment_path in self.segments:
+            if os.path.exists(segment_path):
+                os.remove(segment_path)
+        self.segments = []
+        self.held = []
+        self.memory_used = 0
+        if self.own_spill_dir:
+            shutil.rmtree(self.spill_dir, ignore_errors=True)
@@ -0,0 +1,132 @@
+"""
+Dense year indexed counts, such as publications or citations per year.
+"""
+from collections import OrderedDict
+
+import numpy as np
+
+
+class YearSeries(object):
+    """
+    Counts for consecutive years, stored as a start year and a dense
+    integer array. Years missing from the source data count as 0.
+    >>> series = YearSeries.from_pairs([(2010, 3), (2013, 1)])
+    >>> series.start_year, list(series.counts)
+    (2010, [3, 0, 0, 1])
+    >>> YearSeries.total([series, YearSeries(2012, [5])]).to_dicts()[2]
+    OrderedDict([('year', 2012), ('count', 5)])
+    """
+    def __init__(self, start_year, counts):
+        self.start_year = start_year
+        self.counts = np.asarray(counts, dtype=np.int64)
+
+    @staticmethod
+    def from_pairs(pairs):
+        """
+        Builds a series from (year, count) pairs in any order.
+        Counts for a repeated year are added together.
+        """
+        pairs = list(pairs)
+        if not pairs:
+            return YearSeries(0, [])
+        years = np.array([year for year, count in pairs], dtype=np.int64)
+        counts = np.array([count for year, count in pairs], dtype=np.int64)
+        start_year = years.min()
+        dense = np.bincount(years - start_year, weights=counts).astype(np.int64)
+        return YearSeries(int(start_year), dense)
+
+    @staticmethod
+    def from_dicts(year_dicts):
+        """
+        Builds a series from a list of {'year': ..., 'count': ...} dicts.
+        """
+        return YearSeries.from_pairs((year_dict['year'], year_dict['count']) for year_dict in year_dicts)
+
+    def to_dicts(self):
+        """
+        Returns the series as a list of {'year': ..., 'count': ...} dicts.
+        """
+        year_dicts = []
+        for year, count in zip(self.years(), self.counts):
+            year_dict = OrderedDict()
+            year_dict['year'] = int(year)
+            year_dict['count'] = int(count)
+            year_dicts.append(year_dict)
+        return year_dicts
+
+    @property
+    def end_year(self):
+        """
+        The last year in the series, inclusive.
+        """
+        return self.start_year + len(self.counts) - 1
+
+    def years(self):
+        return np.arange(self.start_year, self.start_year + len(self.counts))
+
+    def get(self, year):
+        index = year - self.start_year
+        if 0 <= index < len(self.counts):
+            return int(self.counts[index])
+        return 0
+
+    def __len__(self):
+        return len(self.counts)
+
+    def __eq__(self, other):
+        return (isinstance(other, YearSeries) and self.start_year == other.start_year
+                and np.array_equal(self.counts, other.counts))
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'YearSeries({0}, {1})'.format(self.start_year, list(self.counts))
+
+    def __add__(self, other):
+        return YearSeries.total([self, other])
+
+    def __sub__(self, other):
+        start_year, matrix = YearSeries.align([self, other])
+        return YearSeries(start_year, matrix[0] - matrix[1])
+
+    def diff(self):
+        """
+        Returns the change in count from each year to the next.
+        """
+        return YearSeries(self.start_year + 1, np.diff(self.counts))
+
+    def cumulative(self):
+        return YearSeries(self.start_year, self.counts.cumsum())
+
+    @staticmethod
+    def align(series_list, start_year=None, end_year=None):
+        """
+        Returns (start_year, matrix) where row i of matrix holds the counts
+        of series_list[i] over a shared range of years. The range covers
+        every series unless start_year or end_year are passed.
+        """
+        non_empty = [series for series in series_list if len(series)]
+        if start_year is None:
+            start_year = min([series.start_year for series in non_empty] or [0])
+        if end_year is None:
+            end_year = max([series.end_year for series in non_empty] or [start_year - 1])
+        width = max(end_year - start_year + 1, 0)
+        matrix = np.zeros((len(series_list), width), dtype=np.int64)
+        for row, series in enumerate(series_list):
+            # clip each series to the shared range.
+            first = max(series.start_year, start_year)
+            last = min(series.end_year, end_year)
+            if first > last:
+                continue
+            matrix[row, first - start_year:last - start_year + 1] = \
+                series.counts[first - series.start_year:last - series.start_year + 1]
+        return start_year, matrix
+
+    @staticmethod
+    def total(series_list):
+        """
+        Returns the year by year sum of every series.
+        """
+        start_year, matrix = YearSeries.align(series_list)
+        return YearSeries(start_year, matrix.sum(axis=0))
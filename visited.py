@@ -0,0 +1,254 @@
+"""
+Compact visited set for crawls of millions of author and publication uids.
+
+Uids are kept in a scalable Bloom filter, a list of bit arrays memory
+mapped from files, instead of a set of strings. A new, larger filter with
+a tighter error rate is added whenever the last one is full, so the
+overall false positive rate stays under error_rate however many uids are
+added. When the filters are kept on disk, Bloom filter positives are
+confirmed against an exact store on disk too, so only uids which may have
+been seen before cost a disk lookup and no uid is held in memory.
+"""
+import hashlib
+import math
+import mmap
+import os
+import sqlite3
+import struct
+
+
+class BloomFilter(object):
+    """
+    Bloom filter sized for capacity keys at error_rate false positives,
+    with its bits memory mapped from path. Pass None to keep it in memory.
+    """
+    # magic, number of bits, number of hashes, keys added, capacity, error rate.
+    HEADER_FORMAT = '<4sQQQQd'
+    HEADER_SIZE = 64
+    MAGIC = 'BLM1'
+
+    def __init__(self, path=None, capacity=1000000, error_rate=0.001):
+        self.path = path
+        if path is not None and os.path.exists(path):
+            with open(path, 'r+b') as filter_file:
+                magic, self.num_bits, self.num_hashes, self.count, self.capacity, self.error_rate = \
+                    struct.unpack(self.HEADER_FORMAT, filter_file.read(struct.calcsize(self.HEADER_FORMAT)))
+                if magic != self.MAGIC:
+                    raise ValueError('{0} is not a bloom filter'.format(path))
+                self.bits = mmap.mmap(filter_file.fileno(), 0)
+            return
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits, self.num_hashes = self.get_size(capacity, error_rate)
+        self.count = 0
+        size = self.HEADER_SIZE + (self.num_bits + 7) // 8
+        if path is None:
+            self.bits = mmap.mmap(-1, size)
+        else:
+            with open(path, 'w+b') as filter_file:
+                filter_file.truncate(size)
+                self.bits = mmap.mmap(filter_file.fileno(), 0)
+        self.write_header()
+
+    @staticmethod
+    def get_size(capacity, error_rate):
+        """
+        Returns the (number of bits, number of hashes) giving error_rate
+        false positives once capacity keys are added.
+        """
+        num_bits = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        num_hashes = max(int(round(num_bits / float(capacity) * math.log(2))), 1)
+        return num_bits, num_hashes
+
+    @staticmethod
+    def hash_key(key):
+        """
+        Returns the two 64 bit halves of the md5 of key, which every
+        filter derives its bit positions from.
+        """
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return struct.unpack('<QQ', hashlib.md5(key).digest())
+
+    def write_header(self):
+        header = struct.pack(self.HEADER_FORMAT, self.MAGIC, self.num_bits, self.num_hashes, self.count,
+                             self.capacity, self.error_rate)
+        self.bits[:len(header)] = header
+
+    def get_positions(self, hashes):
+        # double hashing, the i-th position is first + i * second.
+        first, second = hashes
+        return [(first + idx * second) % self.num_bits for idx in xrange(self.num_hashes)]
+
+    def contains_hashes(self, hashes):
+        bits = self.bits
+        for position in self.get_positions(hashes):
+            if not ord(bits[self.HEADER_SIZE + (position >> 3)]) & (1 << (position & 7)):
+                return False
+        return True
+
+    def add_hashes(self, hashes):
+        """
+        Sets the bits for hashes, returns False if they were all set already.
+        """
+        bits = self.bits
+        added = False
+        for position in self.get_positions(hashes):
+            byte_idx = self.HEADER_SIZE + (position >> 3)
+            byte = ord(bits[byte_idx])
+            mask = 1 << (position & 7)
+            if not byte & mask:
+                bits[byte_idx] = chr(byte | mask)
+                added = True
+        if added:
+            self.count += 1
+        return added
+
+    def __contains__(self, key):
+        return self.contains_hashes(self.hash_key(key))
+
+    def add(self, key):
+        return self.add_hashes(self.hash_key(key))
+
+    def is_full(self):
+        return self.count >= self.capacity
+
+    def get_size_bytes(self):
+        return len(self.bits)
+
+    def flush(self):
+        self.write_header()
+        if self.path is not None:
+            self.bits.flush()
+
+    def close(self):
+        self.flush()
+        self.bits.close()
+
+
+class ExactStore(object):
+    """
+    Exact set of keys in a SQLite database at path, used to confirm
+    Bloom filter positives.
+    """
+    # keys added between commits.
+    COMMIT_EVERY = 10000
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute('CREATE TABLE IF NOT EXISTS visited (key TEXT PRIMARY KEY)')
+        self.uncommitted = 0
+
+    def __contains__(self, key):
+        return self.connection.execute('SELECT 1 FROM visited WHERE key = ?', (key,)).fetchone() is not None
+
+    def add(self, key):
+        self.connection.execute('INSERT OR IGNORE INTO visited (key) VALUES (?)', (key,))
+        self.uncommitted += 1
+        if self.uncommitted >= self.COMMIT_EVERY:
+            self.flush()
+
+    def flush(self):
+        self.connection.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.flush()
+        self.connection.close()
+
+
+class VisitedSet(object):
+    """
+    Set of visited uids in a scalable Bloom filter kept in visited_dir,
+    or in memory if visited_dir is None. With exact=True positives are
+    checked against an ExactStore in visited_dir so there are no false
+    positives, otherwise at most error_rate of unseen uids are reported
+    as seen. exact defaults to True when visited_dir is given, an exact
+    store in memory would hold every uid the filter saves memory on.
+    >>> visited = VisitedSet('visited_dir', capacity=1000000, error_rate=0.001)
+    >>> visited.add('author:hNTyptAAAAAJ')
+    True
+    >>> 'author:hNTyptAAAAAJ' in visited
+    True
+    """
+    FILTER_FILE = 'filter_{0:05d}.bloom'
+    EXACT_FILE = 'exact.db'
+
+    def __init__(self, visited_dir=None, capacity=1000000, error_rate=0.001, exact=None, growth=2, tightening=0.5):
+        if exact is None:
+            exact = visited_dir is not None
+        if exact and visited_dir is None:
+            raise ValueError('An exact VisitedSet needs a visited_dir to keep its exact store in')
+        self.visited_dir = visited_dir
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.growth = growth
+        self.tightening = tightening
+        self.filters = []
+        if visited_dir is not None:
+            if not os.path.isdir(visited_dir):
+                os.makedirs(visited_dir)
+            while os.path.exists(self.get_filter_path(len(self.filters))):
+                self.filters.append(BloomFilter(self.get_filter_path(len(self.filters))))
+        if not self.filters:
+            self.add_filter()
+        self.exact_store = None
+        if exact:
+            self.exact_store = ExactStore(os.path.join(visited_dir, self.EXACT_FILE))
+
+    def get_filter_path(self, index):
+        if self.visited_dir is None:
+            return None
+        return os.path.join(self.visited_dir, self.FILTER_FILE.format(index))
+
+    def add_filter(self):
+        """
+        Adds a filter growth times larger than the last, with an error
+        rate tightening times lower so the rates sum to under error_rate.
+        """
+        index = len(self.filters)
+        capacity = self.capacity * self.growth ** index
+        error_rate = self.error_rate * (1 - self.tightening) * self.tightening ** index
+        self.filters.append(BloomFilter(self.get_filter_path(index), capacity, error_rate))
+
+    def __len__(self):
+        return sum(bloom_filter.count for bloom_filter in self.filters)
+
+    def contains_hashes(self, key, hashes):
+        if not any(bloom_filter.contains_hashes(hashes) for bloom_filter in self.filters):
+            return False
+        if self.exact_store is None:
+            return True
+        return key in self.exact_store
+
+    def __contains__(self, key):
+        return self.contains_hashes(key, BloomFilter.hash_key(key))
+
+    def add(self, key):
+        """
+        Adds key, returns True if it wasn't in the set already.
+        """
+        hashes = BloomFilter.hash_key(key)
+        if self.contains_hashes(key, hashes):
+            return False
+        if self.filters[-1].is_full():
+            self.add_filter()
+        self.filters[-1].add_hashes(hashes)
+        if self.exact_store is not None:
+            self.exact_store.add(key)
+        return True
+
+    def get_size_bytes(self):
+        return sum(bloom_filter.get_size_bytes() for bloom_filter in self.filters)
+
+    def flush(self):
+        for bloom_filter in self.filters:
+            bloom_filter.flush()
+        if self.exact_store is not None:
+            self.exact_store.flush()
+
+    def close(self):
+        for bloom_filter in self.filters:
+            bloom_filter.close()
+        if self.exact_store is not None:
+            self.exact_store.close()
@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+"""
+Leased work queue for crawling with many worker processes.
+
+Tasks (an author page, a publications page, a publication detail page or
+a coauthors page) are claimed with a lease. A worker that dies or stalls
+lets its lease expire and the task is handed to another worker, and
+results are written back once however often a task is retried.
+SQLiteQueue keeps the queue in a WAL mode SQLite database, other backends
+implement WorkQueue and are registered in QUEUE_BACKENDS.
+"""
+from collections import OrderedDict
+from multiprocessing import Pool
+import json
+import os
+import socket
+import sqlite3
+import sys
+import time
+
+from gs import (Author, AuthorCoAuthors, AuthorCoAuthorsParser, AuthorParser, AuthorPublication,
+                AuthorPublicationParser, AuthorPublications, AuthorPublicationsParser, GSHelper)
+
+
+# args which are crawl settings, rather than saying what a task fetches.
+CRAWL_SETTINGS = ('depth', 'max_depth', 'details')
+
+
+class WorkQueue(object):
+    """
+    Interface of a work queue backend. Tasks are dicts with the id, kind,
+    args and attempts of the task. A task is done once, by the worker
+    holding its lease, and put ignores a task which is already queued.
+    """
+    def put(self, kind, args):
+        """
+        Queues a task unless one fetching the same page was queued
+        before, whatever its CRAWL_SETTINGS. A pending task reached again
+        at a smaller depth takes the smaller depth. Returns True if it
+        was queued.
+        """
+        raise NotImplementedError
+
+    def claim(self, worker_id):
+        """
+        Leases the next pending or expired task to worker_id, returns
+        None when there is nothing to do.
+        """
+        raise NotImplementedError
+
+    def extend(self, task_id, worker_id):
+        """
+        Renews the lease on a long running task.
+        """
+        raise NotImplementedError
+
+    def complete(self, task_id, worker_id, result):
+        """
+        Stores the result of a task, returns False if the lease was lost
+        or the task was already done.
+        """
+        raise NotImplementedError
+
+    def fail(self, task_id, worker_id, error):
+        raise NotImplementedError
+
+    def get_counts(self):
+        raise NotImplementedError
+
+    def results(self, kind=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteQueue(WorkQueue):
+    """
+    Work queue in a SQLite database in WAL mode, so workers on the same
+    machine or sharing the file can claim tasks while others write.
+    Tasks whose lease expires after lease_seconds are claimed again, up
+    to max_attempts times.
+    >>> work_queue = SQLiteQueue('crawl.db')
+    >>> work_queue.put('author', {'author_uid': 'hNTyptAAAAAJ'})
+    True
+    >>> work_queue.claim('worker-1')['kind']
+    'author'
+    """
+    def __init__(self, db_path, lease_seconds=120, max_attempts=5):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        # autocommit, transactions are begun explicitly.
+        self.connection = sqlite3.connect(db_path, timeout=60, isolation_level=None)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute(
+            'CREATE TABLE IF NOT EXISTS tasks ('
+            ' id INTEGER PRIMARY KEY,'
+            ' task_key TEXT UNIQUE NOT NULL,'
+            ' kind TEXT NOT NULL,'
+            ' args TEXT NOT NULL,'
+            ' depth INTEGER NOT NULL DEFAULT 0,'
+            " state TEXT NOT NULL DEFAULT 'pending',"
+            ' attempts INTEGER NOT NULL DEFAULT 0,'
+            ' lease_owner TEXT,'
+            ' lease_expires REAL,'
+            ' result TEXT,'
+            ' error TEXT)')
+        self.connection.execute('CREATE INDEX IF NOT EXISTS tasks_state ON tasks (state, lease_expires)')
+
+    @staticmethod
+    def task_key(kind, args):
+        """
+        Returns the kind and the args saying what the task fetches, so
+        an author reached at two depths is one task.
+        """
+        identity = dict((key, value) for key, value in args.items() if key not in CRAWL_SETTINGS)
+        return kind + ':' + json.dumps(identity, sort_keys=True)
+
+    def put(self, kind, args):
+        task_key = self.task_key(kind, args)
+        depth = args.get('depth', 0)
+        cursor = self.connection.execute(
+            'INSERT OR IGNORE INTO tasks (task_key, kind, args, depth) VALUES (?, ?, ?, ?)',
+            (task_key, kind, json.dumps(args), depth))
+        if cursor.rowcount == 1:
+            return True
+        # reached closer to the seed, so it may lead further before max_depth.
+        self.connection.execute(
+            "UPDATE tasks SET args = ?, depth = ? WHERE task_key = ? AND state = 'pending' AND depth > ?",
+            (json.dumps(args), depth, task_key, depth))
+        return False
+
+    def claim(self, worker_id):
+        now = time.time()
+        # takes the write lock up front, so two workers can't claim the same task.
+        self.connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = self.connection.execute(
+                "SELECT id, kind, args, attempts FROM tasks"
+                " WHERE (state = 'pending' OR (state = 'leased' AND lease_expires < ?)) AND attempts < ?"
+                " ORDER BY id LIMIT 1", (now, self.max_attempts)).fetchone()
+            if row is None:
+                # expired tasks out of attempts are given up on.
+                self.connection.execute(
+                    "UPDATE tasks SET state = 'failed', error = 'lease expired'"
+                    " WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, self.max_attempts))
+                self.connection.execute('COMMIT')
+                return None
+            task_id, kind, args, attempts = row
+            self.connection.execute(
+                "UPDATE tasks SET state = 'leased', attempts = attempts + 1, lease_owner = ?, lease_expires = ?"
+                " WHERE id = ?", (worker_id, now + self.lease_seconds, task_id))
+            self.connection.execute('COMMIT')
+        except:
+            self.connection.execute('ROLLBACK')
+            raise
+        task = OrderedDict()
+        task['id'] = task_id
+        task['kind'] = kind
+        task['args'] = json.loads(args, object_pairs_hook=OrderedDict)
+        task['attempts'] = attempts + 1
+        return task
+
+    def extend(self, task_id, worker_id):
+        cursor = self.connection.execute(
+            "UPDATE tasks SET lease_expires = ? WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+            (time.time() + self.lease_seconds, task_id, worker_id))
+        return cursor.rowcount == 1
+
+    def complete(self, task_id, worker_id, result):
+        # a worker whose lease expired may still finish, its result is as
+        # good as the new owners so it's kept unless the task is done.
+        cursor = self.connection.execute(
+            "UPDATE tasks SET state = 'done', result = ?, lease_owner = ?, lease_expires = NULL, error = NULL"
+            " WHERE id = ? AND state != 'done'", (json.dumps(result), worker_id, task_id))
+        return cursor.rowcount == 1
+
+    def fail(self, task_id, worker_id, error):
+        """
+        Releases the task to be retried, or marks it failed once it has
+        been attempted max_attempts times.
+        """
+        self.connection.execute(
+            "UPDATE tasks SET state = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+            " lease_owner = NULL, lease_expires = NULL, error = ?"
+            " WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+            (self.max_attempts, error, task_id, worker_id))
+
+    def get_counts(self):
+        counts = OrderedDict((state, 0) for state in ('pending', 'leased', 'done', 'failed'))
+        for state, count in self.connection.execute('SELECT state, COUNT(*) FROM tasks GROUP BY state'):
+            counts[state] = count
+        return counts
+
+    def results(self, kind=None):
+        """
+        Yields (kind, args, result) of every done task, in queue order.
+        """
+        query = "SELECT kind, args, result FROM tasks WHERE state = 'done'"
+        params = ()
+        if kind is not None:
+            query += ' AND kind = ?'
+            params = (kind,)
+        for kind, args, result in self.connection.execute(query + ' ORDER BY id', params):
+            yield kind, json.loads(args, object_pairs_hook=OrderedDict), json.loads(result, object_pairs_hook=OrderedDict)
+
+    def close(self):
+        self.connection.close()
+
+
+# url scheme to the WorkQueue backend, which is passed the rest of the url.
+QUEUE_BACKENDS = {'sqlite': SQLiteQueue}
+
+
+def open_queue(queue_url, **kwargs):
+    """
+    Opens the queue at queue_url with the backend for its scheme.
+    sqlite://crawl.db and a plain crawl.db are both SQLite databases.
+    """
+    scheme, separator, location = queue_url.partition('://')
+    if not separator:
+        return SQLiteQueue(queue_url, **kwargs)
+    return QUEUE_BACKENDS[scheme](location, **kwargs)
+
+
+class CrawlWorker(object):
+    """
+    Claims crawl tasks from a work queue, fetches and parses them, and
+    queues the tasks they lead to. Authors lead to their first
+    publications page and their coauthors, publications pages to the
+    next page, and coauthors to their authors up to max_depth hops from
+    the seed. Publication detail pages are only queued when the seed
+    task has details set.
+    """
+    def __init__(self, work_queue, worker_id=None, poll_interval=1.0):
+        self.work_queue = work_queue
+        self.poll_interval = poll_interval
+        self.worker_id = worker_id or '{0}:{1}'.format(socket.gethostname(), os.getpid())
+        self.handlers = {
+            'author': self.crawl_author,
+            'publications': self.crawl_publications,
+            'publication': self.crawl_publication,
+            'coauthors': self.crawl_coauthors,
+        }
+
+    def run(self, max_tasks=None):
+        """
+        Works until no task is pending or leased to another worker, or
+        max_tasks tasks are done. Returns the number of tasks done.
+        """
+        done = 0
+        while max_tasks is None or done < max_tasks:
+            task = self.work_queue.claim(self.worker_id)
+            if task is None:
+                # leased tasks may queue more work, or expire and be retried.
+                if not self.work_queue.get_counts()['leased']:
+                    break
+                time.sleep(self.poll_interval)
+                continue
+            try:
+                result = self.handlers[task['kind']](task['args'])
+            except Exception as e:
+                print "Task {0} {1} failed: {2}".format(task['id'], task['kind'], e)
+                self.work_queue.fail(task['id'], self.worker_id, str(e))
+                continue
+            self.work_queue.complete(task['id'], self.worker_id, result)
+            done += 1
+        return done
+
+    @staticmethod
+    def follow_args(args, **changes):
+        """
+        Returns args for a follow up task, keeping the crawl settings.
+        """
+        follow_args = OrderedDict()
+        for key in CRAWL_SETTINGS:
+            if key in args:
+                follow_args[key] = args[key]
+        follow_args.update(changes)
+        return follow_args
+
+    def crawl_author(self, args):
+        author = Author(args['author_uid'], AuthorParser)
+        self.work_queue.put('publications', self.follow_args(args, author_uid=args['author_uid'], page=0))
+        self.work_queue.put('coauthors', self.follow_args(args, author_uid=args['author_uid']))
+        return author.get_results_dict()
+
+    def crawl_publications(self, args):
+        author_pubs = AuthorPublications(args['author_uid'], args['page'], AuthorPublicationsParser)
+        publications = author_pubs.get_results_dict()['publications']
+        if len(publications) == GSHelper.PUB_RESULTS_PER_PAGE:
+            self.work_queue.put('publications', self.follow_args(args, author_uid=args['author_uid'], page=args['page'] + 1))
+        if args.get('details'):
+            for publication in publications:
+                self.work_queue.put('publication', OrderedDict([('author_uid', args['author_uid']),
+                                                                ('publication_uid', publication['id'])]))
+        return author_pubs.get_results_dict()
+
+    def crawl_publication(self, args):
+        author_pub = AuthorPublication(args['author_uid'], args['publication_uid'], AuthorPublicationParser)
+        return author_pub.get_results_dict()
+
+    def crawl_coauthors(self, args):
+        author_coauthors = AuthorCoAuthors(args['author_uid'], AuthorCoAuthorsParser)
+        depth = args.get('depth', 0)
+        if depth < args.get('max_depth', 0):
+            for coauthor in author_coauthors.get_results_dict()['coauthors']:
+                if coauthor.get('author_uid'):
+                    self.work_queue.put('author', self.follow_args(args, author_uid=coauthor['author_uid'], depth=depth + 1))
+        return author_coauthors.get_results_dict()
+
+
+def seed_authors(work_queue, author_uids, max_depth=0, details=False):
+    """
+    Queues author tasks for author_uids, crawling coauthors up to
+    max_depth hops away.
+    """
+    for author_uid in author_uids:
+        args = OrderedDict([('author_uid', author_uid), ('depth', 0), ('max_depth', max_depth)])
+        if details:
+            args['details'] = True
+        work_queue.put('author', args)
+
+
+def run_worker(job):
+    """
+    Runs one worker. Lives at module level so it can be handed to a
+    multiprocessing pool.
+    """
+    queue_url, max_tasks = job
+    work_queue = open_queue(queue_url)
+    try:
+        return CrawlWorker(work_queue).run(max_tasks)
+    finally:
+        work_queue.close()
+
+
+def run_workers(queue_url, processes, max_tasks=None):
+    """
+    Runs processes workers on this machine until the queue is empty.
+    Returns the number of tasks each one did.
+    """
+    pool = Pool(processes)
+    try:
+        return pool.map(run_worker, [(queue_url, max_tasks)] * processes)
+    finally:
+        pool.close()
+        pool.join()
+
+
+if __name__ == '__main__':
+    if sys.argv[1] == '--enqueue':
+        # cli args = enqueue, queue, author_uid, coauthor depth
+        # python workqueue.py --enqueue crawl.db 'hNTyptAAAAAJ' 1
+        try:
+            max_depth = int(sys.argv[4])
+        except IndexError:
+            max_depth = 0
+        seed_authors(open_queue(sys.argv[2]), [sys.argv[3]], max_depth)
+
+    if sys.argv[1] == '--work':
+        # run worker processes until the queue is empty, on as many machines as share the queue
+        # cli args = work, queue, processes
+        # python workqueue.py --work crawl.db 4
+        try:
+            processes = int(sys.argv[3])
+        except IndexError:
+            processes = 1
+        print json.dumps(run_workers(sys.argv[2], processes))
+
+    if sys.argv[1] == '--status':
+        # cli args = status, queue
+        # python workqueue.py --status crawl.db
+        print json.dumps(open_queue(sys.argv[2]).get_counts(), indent=4)
+
+    if sys.argv[1] == '--results':
+        # one JSON result per line
+        # cli args = results, queue, kind
+        # python workqueue.py --results crawl.db author
+        try:
+            kind = sys.argv[3]
+        except IndexError:
+            kind = None
+        for kind, args, result in open_queue(sys.argv[2]).results(kind):
+            print json.dumps(result)